@@ -0,0 +1,6 @@
+from heatwave.benchmark.suite import main
+
+import sys
+
+
+sys.exit(main())
@@ -0,0 +1,89 @@
+import numpy as np
+
+from typing import Dict, Iterable, List, Optional
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# Modules every Job (and Pool Worker) Imports, which should stay Light
+CORE = ('heatwave', 'heatwave.loaders', 'heatwave.masks', 'heatwave.utils', 'heatwave.indices',
+        'heatwave.significance')
+
+# Dependencies the Core should only Import on First Use
+HEAVY = ('matplotlib', 'cartopy', 'shapefile', 'scipy', 'sklearn', 'tensorflow', 'torch')
+
+BUDGET = 1.0  # Import Time Budget per Core Module (seconds, Fresh Interpreter)
+
+PROBE = ("import importlib, json, sys, time; start = time.perf_counter(); importlib.import_module({!r}); "
+         "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))")
+
+
+def import_time(module: str, repeat: int = 5) -> Dict:
+    """
+    Import Time of a Module (and its Parent Packages) in Fresh Interpreters, as a Pool Worker or Batch Job pays it,
+    and the Heavy Modules it Pulls in. Times are the Best and Median of repeat Runs.
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+
+    seconds, modules = [], []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', PROBE.format(module)],
+                                 capture_output=True, text=True, env=environment)
+        if process.returncode:
+            raise ImportError(f"importing {module} failed: {process.stderr.strip().splitlines()[-1]}")
+
+        elapsed, modules = json.loads(process.stdout.splitlines()[-1])
+        seconds.append(elapsed)
+
+    heavy = sorted({name.split('.')[0] for name in modules} & set(HEAVY))
+    return {'module': module, 'best': min(seconds), 'median': float(np.median(seconds)), 'heavy': heavy}
+
+
+def check_imports(modules: Iterable[str] = CORE, budget: float = BUDGET, repeat: int = 5,
+                  heavy: Iterable[str] = HEAVY) -> List[str]:
+    # Violations: Core Modules Slower than budget (Best of repeat Runs), or Importing Heavy Dependencies
+    return violations([import_time(module, repeat) for module in modules], budget, heavy)
+
+
+def violations(results: List[Dict], budget: float = BUDGET, heavy: Iterable[str] = HEAVY) -> List[str]:
+    found = []
+    for result in results:
+        if result['best'] > budget:
+            found.append(f"{result['module']} imports in {result['best']:.3f}s, budget is {budget:.3f}s")
+        if set(result['heavy']) & set(heavy):
+            found.append(f"{result['module']} imports {', '.join(sorted(set(result['heavy']) & set(heavy)))}")
+    return found
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import Time Benchmark of the heatwave Core")
+    parser.add_argument('modules', nargs='*', default=CORE)
+    parser.add_argument('--budget', type=float, default=BUDGET)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="Print Machine-Readable Results")
+    arguments = parser.parse_args(arguments)
+
+    results = [import_time(module, arguments.repeat) for module in arguments.modules]
+
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{result['module']:<24} best {result['best']:.3f}s  median {result['median']:.3f}s  "
+                  f"heavy: {', '.join(result['heavy']) or '-'}")
+
+    found = violations(results, arguments.budget)
+    for violation in found:
+        print(violation, file=sys.stderr)
+
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
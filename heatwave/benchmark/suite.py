@@ -0,0 +1,272 @@
+from heatwave.benchmark.synthetic import synthetic_era, synthetic_ghcn
+from heatwave.loaders.era import ERA
+from heatwave.loaders.ghcn import GHCN, GHCNElement
+from heatwave.enums import Country
+from heatwave import instrumentation
+
+import numpy as np
+
+from typing import Callable, Dict, Iterable, List, Optional
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# Problem Sizes: ERA Grid (lat, lon), Years and Time Chunking, GHCN Stations and Years
+SCALES = {
+    'small': {'shape': (37, 72), 'years': 2, 'chunking': (8, 37, 72), 'stations': 50, 'ghcn_years': 3},
+    'medium': {'shape': (73, 144), 'years': 5, 'chunking': (8, 73, 144), 'stations': 200, 'ghcn_years': 10},
+    'large': {'shape': (181, 360), 'years': 10, 'chunking': (8, 181, 360), 'stations': 1000, 'ghcn_years': 40},
+}
+
+FIRST_YEAR = 1979
+
+
+class Case:
+    """
+    Benchmark Case: setup(directory, scale) Prepares Inputs (Synthetic Data is Generated once per Directory and Scale)
+    and Returns the Callable that is Timed. Cases whose Dependencies are Missing are Skipped.
+    """
+
+    def __init__(self, name: str, setup: Callable[[str, Dict], Callable[[], object]], requires: Iterable[str] = ()):
+        self.name = name
+        self.setup = setup
+        self.requires = tuple(requires)
+
+    def missing(self) -> List[str]:
+        import importlib.util
+        return [module for module in self.requires if importlib.util.find_spec(module) is None]
+
+
+def era_path(directory: str, scale: Dict) -> str:
+    # Synthetic Cube of a Scale, Generated on First Use
+    path = os.path.join(directory, f"era-{scale['shape'][0]}x{scale['shape'][1]}-{scale['years']}y.nc")
+    if not os.path.exists(path):
+        synthetic_era(path, 't2m', scale['shape'], (FIRST_YEAR, FIRST_YEAR + scale['years'] - 1),
+                      chunking=scale['chunking'])
+    return path
+
+
+def ghcn_root(directory: str, scale: Dict) -> str:
+    root = os.path.join(directory, f"ghcn-{scale['stations']}-{scale['ghcn_years']}y")
+    if not os.path.exists(os.path.join(root, f"{GHCN.SOURCE_NAME}{GHCN.SOURCE_EXT}")):
+        synthetic_ghcn(root, scale['stations'], (FIRST_YEAR, FIRST_YEAR + scale['ghcn_years'] - 1))
+    return root
+
+
+def ghcn(directory: str, scale: Dict) -> GHCN:
+    GHCN.set_root(ghcn_root(directory, scale))
+    return GHCN(GHCNElement.TMAX, Country.US, (FIRST_YEAR, FIRST_YEAR + scale['ghcn_years'] - 1), cache=None)
+
+
+# Cases Bypass the Derived Product Cache, such that they Time the Computation rather than Cache Hits
+def setup_era_data(directory: str, scale: Dict) -> Callable[[], object]:
+    path = era_path(directory, scale)
+    return lambda: ERA(path, 't2m', cache=None).data
+
+
+def setup_era_anomaly(directory: str, scale: Dict) -> Callable[[], object]:
+    path = era_path(directory, scale)
+    return lambda: ERA(path, 't2m', cache=None).anomaly
+
+
+def setup_era_reindex(directory: str, scale: Dict) -> Callable[[], object]:
+    # Summer Days over the Northern Half of the Grid: Scattered Time Steps and a Spatial Subset
+    path = era_path(directory, scale)
+
+    def run():
+        era = ERA(path, 't2m', cache=None)
+        return era.reindex([np.flatnonzero(era.time_axis.window()), slice(0, era.shape[1] // 2)]).data
+
+    return run
+
+
+def setup_ghcn_extract(directory: str, scale: Dict) -> Callable[[], object]:
+    def run():
+        request = ghcn(directory, scale)
+        if os.path.exists(request.file):
+            os.remove(request.file)
+        request.extract()
+
+    return run
+
+
+def setup_ghcn_load(directory: str, scale: Dict) -> Callable[[], object]:
+    request = ghcn(directory, scale)
+    if not os.path.exists(request.file):
+        request.extract()
+
+    def run():
+        GHCN.set_root(ghcn_root(directory, scale))
+        return request.load()
+
+    return run
+
+
+def setup_country_mask(directory: str, scale: Dict) -> Callable[[], object]:
+    from heatwave.masks import grid_country_mask
+
+    latitude = np.linspace(90, -90, scale['shape'][0])
+    longitude = np.linspace(0, 360, scale['shape'][1], endpoint=False)
+    return lambda: grid_country_mask(longitude, latitude)
+
+
+def setup_points_in_polygon(directory: str, scale: Dict) -> Callable[[], object]:
+    # Country-Like Polygon (Star with Noisy Radius) against a Grid of the Scale's Resolution
+    from heatwave.masks import points_in_polygon
+
+    random = np.random.default_rng(0)
+    angle = np.linspace(0, 2 * np.pi, 4096, endpoint=False)
+    radius = 20 + 5 * np.sin(7 * angle) + random.uniform(0, 2, len(angle))
+    polygon = np.column_stack([-100 + radius * np.cos(angle), 40 + 0.5 * radius * np.sin(angle)])
+    edges = np.hstack([polygon, np.roll(polygon, -1, axis=0)])
+
+    latitude = np.linspace(90, -90, scale['shape'][0] * 4)
+    longitude = np.linspace(-180, 180, scale['shape'][1] * 4, endpoint=False)
+    coordinates = np.stack(np.meshgrid(longitude, latitude), axis=-1).reshape(-1, 2)
+    return lambda: points_in_polygon(edges, coordinates)
+
+
+CASES = {case.name: case for case in (
+    Case('era.data', setup_era_data),
+    Case('era.anomaly', setup_era_anomaly),
+    Case('era.reindex', setup_era_reindex),
+    Case('ghcn.extract', setup_ghcn_extract),
+    Case('ghcn.load', setup_ghcn_load),
+    Case('masks.country_mask', setup_country_mask, requires=('shapefile',)),
+    Case('masks.points_in_polygon', setup_points_in_polygon),
+)}
+
+
+def measure(run: Callable[[], object], repeat: int = 3) -> Dict:
+    """
+    Wall Time of repeat Runs, then the Peak Python Heap (incl. Numpy Buffers) and the Instrumentation Report of one
+    more Run under tracemalloc, which is kept out of the Timed Runs since it slows Allocations down
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+
+    with instrumentation.instrument() as report:
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': seconds, 'best': min(seconds), 'median': float(np.median(seconds)), 'peak_memory': peak,
+            **report.report()}
+
+
+def run(cases: Optional[Iterable[str]] = None, scales: Iterable[str] = ('small',), repeat: int = 3,
+        directory: Optional[str] = None, verbose: bool = False) -> Dict:
+    """
+    Run Benchmark Cases at several Scales on Synthetic Data, Returning Machine-Readable Results
+
+    directory: Where Synthetic Data is Generated (and Reused between Runs), a Temporary Directory if None
+    """
+
+    cases = list(CASES) if cases is None else list(cases)
+    unknown = [name for name in cases if name not in CASES] + [name for name in scales if name not in SCALES]
+    if unknown:
+        raise ValueError(f"unknown cases or scales {unknown}, choose from {list(CASES)} and {list(SCALES)}")
+
+    temporary = directory is None
+    directory = tempfile.mkdtemp(prefix='heatwave-benchmark-') if temporary else directory
+    os.makedirs(directory, exist_ok=True)
+
+    root = GHCN.ROOT
+    results = []
+
+    try:
+        for scale_name in scales:
+            scale = SCALES[scale_name]
+            for name in cases:
+                case = CASES[name]
+                result = {'case': name, 'scale': scale_name, 'parameters': {key: list(value) if isinstance(value, tuple)
+                                                                            else value for key, value in scale.items()}}
+
+                missing = case.missing()
+                if missing:
+                    result['skipped'] = f"requires {', '.join(missing)}"
+                else:
+                    result.update(measure(case.setup(directory, scale), repeat))
+
+                if verbose:
+                    summary = result.get('skipped') or \
+                        f"best {result['best']:.3f}s  peak {result['peak_memory'] / 2 ** 20:.1f} MiB"
+                    print(f"{name:<24} {scale_name:<8} {summary}", file=sys.stderr)
+
+                results.append(result)
+    finally:
+        GHCN.set_root(root)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {'meta': metadata(repeat), 'results': results}
+
+
+def metadata(repeat: int) -> Dict:
+    import netCDF4
+
+    return {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'repeat': repeat,
+            'python': platform.python_version(), 'numpy': np.__version__, 'netCDF4': netCDF4.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.2) -> List[str]:
+    # Regressions: (case, scale) Pairs whose Best Time or Peak Memory grew by more than tolerance over the Baseline
+    reference = {(result['case'], result['scale']): result for result in baseline['results'] if 'best' in result}
+
+    regressions = []
+    for result in current['results']:
+        before = reference.get((result['case'], result['scale']))
+        if before is None or 'best' not in result:
+            continue
+        for metric, unit, factor in (('best', 's', 1), ('peak_memory', ' MiB', 2 ** -20)):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{result['case']} ({result['scale']}) {metric}: "
+                                   f"{before[metric] * factor:.3f}{unit} -> {result[metric] * factor:.3f}{unit}")
+    return regressions
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark heatwave Hot Paths on Synthetic ERA and GHCN Data")
+    parser.add_argument('--cases', nargs='*', default=None, help=f"Cases to Run, from {', '.join(CASES)}")
+    parser.add_argument('--scales', nargs='*', default=['small'], help=f"Scales to Run, from {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--directory', default=None, help="Keep (and Reuse) Synthetic Data in this Directory")
+    parser.add_argument('--output', default=None, help="Write JSON Results to this Path (Standard Output otherwise)")
+    parser.add_argument('--baseline', default=None, help="Compare against Earlier JSON Results")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Relative Slowdown counted as Regression")
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.cases, arguments.scales, arguments.repeat, arguments.directory, verbose=True)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare(json.load(file), results, arguments.tolerance)
+
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
@@ -0,0 +1,182 @@
+from heatwave.loaders.timeaxis import FIXED_CALENDARS, STANDARD_CALENDARS
+from heatwave.loaders.ghcn import GHCN
+from heatwave.loaders import dly
+
+import netCDF4
+
+import numpy as np
+
+from typing import Iterable, Optional, Sequence, Tuple
+
+import calendar as calendars
+import io
+import os
+import tarfile
+
+
+def synthetic_era(path: str, target: str = 't2m', shape: Tuple[int, int] = (73, 144),
+                  years: Tuple[int, int] = (1979, 1980), calendar: str = 'standard',
+                  chunking: Optional[Sequence[int]] = None, unit: str = 'days', missing: float = 0.0, seed: int = 0,
+                  latitude_key: str = 'latitude', longitude_key: str = 'longitude', time_key: str = 'time') -> str:
+    """
+    Write a Synthetic ERA-like [time, lat, lon] Daily Cube: a Seasonal Cycle (Amplitude growing with Latitude) plus
+    Noise, as float32 on a Global Grid (North to South, 0-360 Longitudes, like ERA-Interim)
+
+    years: Inclusive (first, last) Year, with Year Lengths following calendar (e.g. 'noleap', '360_day')
+    chunking: (time, lat, lon) Chunk Shape, None for a Contiguous Variable
+    unit: Time Unit of the Time Axis ('days' or 'hours')
+    missing: Fraction of Values Written as Fill Values (Read back as NaN)
+    """
+
+    random = np.random.default_rng(seed)
+    calendar = calendar.lower()
+
+    n_latitude, n_longitude = shape
+    latitude = np.linspace(90, -90, n_latitude, dtype=np.float32)
+    longitude = np.linspace(0, 360, n_longitude, endpoint=False, dtype=np.float32)
+
+    lengths = [year_length(year, calendar) for year in range(years[0], years[1] + 1)]
+    steps = 24 if unit == 'hours' else 1
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    with netCDF4.Dataset(path, 'w', format='NETCDF4') as dataset:
+        dataset.createDimension(time_key, sum(lengths))
+        dataset.createDimension(latitude_key, n_latitude)
+        dataset.createDimension(longitude_key, n_longitude)
+
+        time = dataset.createVariable(time_key, np.float64, (time_key,))
+        time.units = f"{unit} since {years[0]:04d}-01-01 00:00:00"
+        time.calendar = calendar
+        time[:] = np.arange(sum(lengths), dtype=np.float64) * steps
+
+        dataset.createVariable(latitude_key, np.float32, (latitude_key,))[:] = latitude
+        dataset.createVariable(longitude_key, np.float32, (longitude_key,))[:] = longitude
+
+        dimensions = (time_key, latitude_key, longitude_key)
+        if chunking is None:
+            variable = dataset.createVariable(target, np.float32, dimensions, contiguous=True,
+                                              fill_value=np.float32(-32767))
+        else:
+            chunking = [min(size, length) for size, length in zip(chunking, (sum(lengths), n_latitude, n_longitude))]
+            variable = dataset.createVariable(target, np.float32, dimensions, chunksizes=chunking,
+                                              fill_value=np.float32(-32767))
+
+        amplitude = (2 + 18 * np.abs(np.sin(np.radians(latitude))))[:, None]
+        mean = (30 - 0.4 * np.abs(latitude))[:, None] + np.zeros((1, n_longitude), np.float32)
+
+        # One Year at a Time, such that Memory is Bounded by a Single Year
+        offset = 0
+        for length in lengths:
+            phase = np.cos(2 * np.pi * (np.arange(length) - 0.55 * length) / length)[:, None, None]
+            data = (mean[None] + amplitude[None] * np.sign(latitude)[None, :, None] * phase +
+                    random.normal(0, 2, (length, n_latitude, n_longitude))).astype(np.float32)
+
+            if missing:
+                data = np.ma.masked_array(data, random.random(data.shape) < missing)
+
+            variable[offset:offset + length] = data
+            offset += length
+
+    return path
+
+
+def synthetic_ghcn(root: str, stations: int = 100, span: Tuple[int, int] = (1979, 1981),
+                   elements: Iterable[str] = ('TMAX', 'TMIN', 'PRCP'), countries: Sequence[str] = ('US', 'CA'),
+                   latitude: Tuple[float, float] = (25, 50), longitude: Tuple[float, float] = (-125, -66),
+                   missing: float = 0.05, compress_level: int = 6, seed: int = 0) -> str:
+    """
+    Write a Synthetic ghcnd_all.tar.gz and ghcnd-inventory.txt (GHCN Layout, see GHCN.set_root) into root
+
+    Stations are Spread Uniformly over a Coordinate Box and Cycle through countries, every Station has every Element
+    for every Year of span. Temperatures follow a Seasonal Cycle plus Noise (Tenths of Degrees C), Precipitation is
+    Gamma Distributed (Tenths of mm), and a Fraction missing of all Days is Missing.
+    """
+
+    random = np.random.default_rng(seed)
+    elements = list(elements)
+    years = np.arange(span[0], span[1] + 1)
+
+    os.makedirs(root, exist_ok=True)
+
+    ids = [f"{countries[station % len(countries)]}C{station:08d}" for station in range(stations)]
+    latitudes = random.uniform(*latitude, stations)
+    longitudes = random.uniform(*longitude, stations)
+
+    with open(os.path.join(root, 'ghcnd-inventory.txt'), 'w') as inventory:
+        for station_id, station_latitude, station_longitude in zip(ids, latitudes, longitudes):
+            for element in elements:
+                inventory.write(f"{station_id} {station_latitude:8.4f} {station_longitude:9.4f} {element} "
+                                f"{span[0]:4d} {span[1]:4d}\n")
+
+    path = os.path.join(root, f"{GHCN.SOURCE_NAME}{GHCN.SOURCE_EXT}")
+    with tarfile.open(path, 'w:gz', compresslevel=compress_level) as archive:
+        for station_id, station_latitude in zip(ids, latitudes):
+            raw = station_records(station_id, station_latitude, years, elements, missing, random).tobytes()
+
+            info = tarfile.TarInfo(f"{GHCN.SOURCE_NAME}/{station_id}{GHCN.STATION_EXT}")
+            info.size = len(raw)
+            archive.addfile(info, io.BytesIO(raw))
+
+    return root
+
+
+def station_records(station_id: str, latitude: float, years: np.ndarray, elements: Sequence[str], missing: float,
+                    random: np.random.Generator) -> np.ndarray:
+    # (Year, Month, Element) Ordered .dly Records of one Station, Formatted without Looping over Days
+    n_years, n_elements = len(years), len(elements)
+
+    # Day of Year (Approximately) and Validity of every (year, month, day) Slot
+    month_days = np.array([[calendars.monthrange(int(year), month)[1] for month in range(1, 13)] for year in years])
+    valid = np.arange(dly.DAYS)[None, None, :] < month_days[:, :, None]
+    day_of_year = (np.arange(12) * 30.5)[None, :, None] + np.arange(dly.DAYS)[None, None, :]
+
+    season = np.cos(2 * np.pi * (day_of_year - 200) / 365.25) * (50 + 3 * abs(latitude))
+    noise = random.normal(0, 30, (n_years, 12, dly.DAYS))
+
+    values = np.empty((n_years, 12, n_elements, dly.DAYS), np.int64)
+    for index, element in enumerate(elements):
+        if element == 'TMAX':
+            values[:, :, index] = np.round(300 - 4 * abs(latitude) + season + noise)
+        elif element == 'TMIN':
+            values[:, :, index] = np.round(180 - 4 * abs(latitude) + season + 0.5 * noise)
+        elif element == 'PRCP':
+            values[:, :, index] = np.round(random.gamma(0.4, 60, (n_years, 12, dly.DAYS)))
+        else:
+            values[:, :, index] = 0
+
+    values[~np.broadcast_to(valid[:, :, None], values.shape)] = dly.NA
+    values[random.random(values.shape) < missing] = dly.NA
+
+    records = np.zeros((n_years, 12, n_elements), dly.RECORD_LINE)
+    records["ID"] = station_id.encode()
+    records["YEAR"] = np.char.encode(np.char.zfill(years.astype(str), 4))[:, None, None]
+    records["MONTH"] = np.char.encode(np.char.zfill(np.arange(1, 13).astype(str), 2))[None, :, None]
+    records["ELEMENT"] = np.char.encode(np.array(elements))[None, None, :]
+    records["DAYS"][..., :5] = format_values(values)
+    records["DAYS"][..., 5:] = ord(" ")  # Empty Measurement, Quality and Source Flags
+    records["NEWLINE"] = b"\n"
+
+    return records.ravel()
+
+
+def format_values(values: np.ndarray) -> np.ndarray:
+    # Right Aligned 5 Character ASCII of Integers within [-9999, 99999], as [..., 5] Bytes
+    magnitude = np.abs(values)
+    digits = np.stack([(magnitude // 10 ** power) % 10 for power in range(4, -1, -1)], axis=-1) + ord("0")
+    length = 1 + sum((magnitude >= 10 ** power).astype(np.int64) for power in range(1, 5))
+
+    position = np.arange(5)
+    output = np.where(position >= 5 - length[..., None], digits, ord(" "))
+    output = np.where((values[..., None] < 0) & (position == 4 - length[..., None]), ord("-"), output)
+    return output.astype(np.uint8)
+
+
+def year_length(year: int, calendar: str = 'standard') -> int:
+    # Days in a Year of a CF Calendar
+    if calendar in STANDARD_CALENDARS:
+        return 366 if calendars.isleap(year) else 365
+    if calendar in FIXED_CALENDARS:
+        return sum(FIXED_CALENDARS[calendar])
+    raise ValueError(f"calendar should be one of {STANDARD_CALENDARS + tuple(FIXED_CALENDARS)}, not '{calendar}'")
@@ -0,0 +1,160 @@
+from heatwave import instrumentation
+
+import numpy as np
+
+from typing import Callable, Optional, Union, Iterable, Dict, Any
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+Sources = Union[str, Iterable[str]]
+
+
+class Cache:
+    """
+    Content Addressed On-Disk Cache for Derived Arrays
+
+    Entries are keyed on their Source Files (path, modification time and size) and the Parameters they were
+    derived with, stored as .npy files (loaded memory-mapped) and evicted Least Recently Used beyond max_size.
+    """
+
+    ROOT = os.environ.get('HEATWAVE_CACHE',
+                          os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/cache')))
+
+    MAX_SIZE = 16 * 2 ** 30  # bytes
+
+    ARRAY_EXT = ".npy"
+    META_EXT = ".json"
+
+    def __init__(self, root: Optional[str] = None, max_size: Optional[int] = None):
+        self._root = root or Cache.ROOT
+        self._max_size = max_size if max_size is not None else Cache.MAX_SIZE
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def size(self) -> int:
+        return sum(os.path.getsize(path) for path in self._entries(self.ARRAY_EXT))
+
+    def key(self, sources: Sources, **params) -> str:
+        sources = [sources] if isinstance(sources, str) else list(sources)
+
+        fingerprint = hashlib.sha1()
+        for source in sources:
+            stat = os.stat(source)
+            fingerprint.update(f"{os.path.abspath(source)}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        for name in sorted(params):
+            fingerprint.update(f"{name}=".encode())
+            _fingerprint(fingerprint, params[name])
+            fingerprint.update(b";")
+
+        return fingerprint.hexdigest()
+
+    def load(self, key: str, mmap: bool = True) -> Optional[np.ndarray]:
+        path = self._path(key, self.ARRAY_EXT)
+
+        if not os.path.exists(path):
+            return None
+
+        # Touch Entry to mark it as Recently Used
+        os.utime(path)
+
+        # Copy on Write, such that Callers can Modify the Result without Touching the Cache
+        return np.load(path, mmap_mode='c' if mmap else None)
+
+    def save(self, key: str, array: np.ndarray, meta: Optional[Dict[str, Any]] = None) -> None:
+        os.makedirs(self._root, exist_ok=True)
+
+        # Write to Temporary File first, so Concurrent Readers never see Partial Entries
+        handle, temporary = tempfile.mkstemp(dir=self._root, suffix=self.ARRAY_EXT)
+        with os.fdopen(handle, 'wb') as file:
+            np.save(file, np.asarray(array), allow_pickle=False)
+        os.replace(temporary, self._path(key, self.ARRAY_EXT))
+
+        with open(self._path(key, self.META_EXT), 'w') as file:
+            json.dump(meta or {}, file)
+
+        self.evict()
+
+    def get(self, sources: Sources, compute: Callable[[], np.ndarray], mmap: bool = True, **params) -> np.ndarray:
+        key = self.key(sources, **params)
+
+        array = self.load(key, mmap)
+        if array is not None:
+            instrumentation.count('cache.hits')
+        else:
+            instrumentation.count('cache.misses')
+            with instrumentation.timer('cache.compute'):
+                array = compute()
+            sources = [sources] if isinstance(sources, str) else list(sources)
+            self.save(key, array, {'sources': [os.path.abspath(source) for source in sources],
+                                   'params': {name: repr(value) for name, value in params.items()}})
+
+        return array
+
+    def invalidate(self, source: Optional[str] = None) -> None:
+        # Remove all Entries, or only those Derived from the given Source
+        source = os.path.abspath(source) if source else None
+
+        for path in self._entries(self.META_EXT):
+            if source is not None:
+                with open(path) as file:
+                    if source not in json.load(file).get('sources', ()):
+                        continue
+            self._remove(os.path.splitext(os.path.basename(path))[0])
+
+    def evict(self) -> None:
+        # Remove Least Recently Used Entries until Cache fits within max_size
+        entries = sorted(self._entries(self.ARRAY_EXT), key=os.path.getmtime)
+        size = sum(os.path.getsize(path) for path in entries)
+
+        for path in entries:
+            if size <= self._max_size:
+                break
+            size -= os.path.getsize(path)
+            self._remove(os.path.splitext(os.path.basename(path))[0])
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self._root, key + ext)
+
+    def _entries(self, ext: str) -> Iterable[str]:
+        if not os.path.isdir(self._root):
+            return []
+        return [os.path.join(self._root, name) for name in os.listdir(self._root)
+                if name.endswith(ext) and not name.startswith('tmp')]
+
+    def _remove(self, key: str) -> None:
+        for ext in (self.ARRAY_EXT, self.META_EXT):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+
+def _fingerprint(fingerprint, value) -> None:
+    # Feed a (nested) Parameter Value into the Hash, hashing Arrays by their Contents
+    if isinstance(value, np.ndarray):
+        fingerprint.update(f"array{value.dtype.str}{value.shape}".encode())
+        fingerprint.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        fingerprint.update(f"{type(value).__name__}[".encode())
+        for item in value:
+            _fingerprint(fingerprint, item)
+            fingerprint.update(b",")
+        fingerprint.update(b"]")
+    elif isinstance(value, slice):
+        fingerprint.update(f"slice({value.start},{value.stop},{value.step})".encode())
+    else:
+        fingerprint.update(repr(value).encode())
+
+
+CACHE = Cache()
@@ -0,0 +1,156 @@
+from heatwave.loaders.timeaxis import TimeAxis, DAYS, LEAP_DAY, MONTH_OFFSET
+
+import numpy as np
+import pandas as pd
+
+from typing import Optional, Iterable, Iterator, Tuple, Union
+
+
+def day_of_year(time: Union[pd.DatetimeIndex, TimeAxis], leap: str = 'keep') -> np.ndarray:
+    """
+    Day of Year Slot (0-365) for every Date, such that the same Calendar Date always maps onto the same Slot
+
+    leap: 'keep' gives February 29th a Slot of its own, 'merge' pools it with February 28th
+    """
+
+    # Time Axes Precompute (and Cache) their Day of Year Index
+    if isinstance(time, TimeAxis):
+        return time.day_of_year(leap)
+
+    index = MONTH_OFFSET[np.asarray(time.month)] + np.asarray(time.day) - 1
+
+    if leap == 'merge':
+        index[index == LEAP_DAY] = LEAP_DAY - 1
+    elif leap != 'keep':
+        raise ValueError(f"leap should be either 'keep' or 'merge', not '{leap}'")
+
+    return index
+
+
+class Climatology:
+    """
+    Day of Year Climatology, accumulated over (chunks of) a [time, ...] array without a DataFrame round trip
+
+    window: Width of a (circular) Gaussian Smoothing Window over the Day of Year Means (std = window / 2)
+    harmonics: Number of Annual Harmonics to fit to the Day of Year Means
+    leap: How to handle February 29th, see day_of_year()
+    """
+
+    def __init__(self, time: Union[pd.DatetimeIndex, TimeAxis], window: Optional[int] = None,
+                 harmonics: Optional[int] = None, leap: str = 'keep', mean: Optional[np.ndarray] = None):
+
+        self._index = day_of_year(time, leap)
+        self._slots = time.slots if isinstance(time, TimeAxis) else DAYS  # Period of the Annual Cycle
+        self._window = window
+        self._harmonics = harmonics
+        self._leap = leap
+
+        self._sums = None
+        self._counts = None
+        self._mean = mean
+
+    @property
+    def index(self) -> np.ndarray:
+        return self._index
+
+    @property
+    def mean(self) -> np.ndarray:
+        if self._mean is None:
+            if self._sums is None:
+                raise ValueError("Climatology has not been fitted yet")
+            self._mean = self._finalize()
+        return self._mean
+
+    def update(self, block: slice, data: np.ndarray) -> 'Climatology':
+        # Allocate Accumulators on First Block
+        if self._sums is None:
+            self._sums = np.zeros((DAYS,) + data.shape[1:], np.float64)
+            self._counts = np.zeros((DAYS,) + data.shape[1:], np.int32)
+
+        # Sort Block by Day of Year Slot, so every Slot can be Summed with a single reduceat
+        slots = self._index[block]
+        order = np.argsort(slots, kind='stable')
+        slots = slots[order]
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+
+        values = data[order].astype(np.float64, copy=False)
+        valid = ~np.isnan(values)
+        values[~valid] = 0
+
+        self._sums[slots[starts]] += np.add.reduceat(values, starts, axis=0)
+        self._counts[slots[starts]] += np.add.reduceat(valid, starts, axis=0, dtype=np.int32)
+        self._mean = None
+
+        return self
+
+    def fit(self, data: np.ndarray) -> 'Climatology':
+        return self.fit_chunks([(slice(0, len(data)), data)])
+
+    def fit_chunks(self, chunks: Iterable[Tuple[slice, np.ndarray]]) -> 'Climatology':
+        for block, data in chunks:
+            self.update(block, data)
+        return self
+
+    def anomaly(self, data: np.ndarray, block: slice = slice(None)) -> np.ndarray:
+        return data - self.mean[self._index[block]]
+
+    def anomaly_chunks(self, chunks: Iterable[Tuple[slice, np.ndarray]]) -> Iterator[Tuple[slice, np.ndarray]]:
+        for block, data in chunks:
+            yield block, self.anomaly(data, block)
+
+    def _finalize(self) -> np.ndarray:
+        sums, counts = self._sums, self._counts.astype(np.float64)
+
+        # Smooth Sums and Counts alike, so that Empty Slots (e.g. outside a Season) carry no Weight
+        if self._window:
+            sums, counts = self._smooth(sums), self._smooth(counts)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums / counts
+
+        if self._harmonics:
+            mean = self._fit_harmonics(mean, counts)
+
+        # February 29th takes February 28th's Mean, unless the Slot is a Date of its own (e.g. 360_day Calendars)
+        if self._leap == 'merge' and not self._counts[LEAP_DAY].any():
+            mean[LEAP_DAY] = mean[LEAP_DAY - 1]
+
+        return mean
+
+    def _smooth(self, values: np.ndarray) -> np.ndarray:
+        # Circular Gaussian Convolution along the Day of Year Axis (via FFT), over the Calendar's Slots only
+        slots = self._slots
+        offsets = np.arange(slots)
+        offsets = np.minimum(offsets, slots - offsets)
+        kernel = np.exp(-0.5 * (offsets / (self._window / 2)) ** 2)
+        kernel[offsets > self._window // 2] = 0
+
+        shape = (slots,) + (1,) * (values.ndim - 1)
+        spectrum = np.fft.rfft(kernel).reshape((-1,) + shape[1:])
+        smoothed = values.copy()
+        smoothed[:slots] = np.fft.irfft(np.fft.rfft(values[:slots], axis=0) * spectrum, n=slots, axis=0)
+        return smoothed
+
+    def _fit_harmonics(self, mean: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # Design Matrix of Mean and Annual Harmonics, Unused Slots (beyond the Calendar's) have no Weight
+        phase = 2 * np.pi * np.arange(DAYS) / self._slots
+        design = np.column_stack([np.ones(DAYS)] + [f(k * phase) for k in range(1, self._harmonics + 1)
+                                                    for f in (np.cos, np.sin)])
+
+        # Weighted Least Squares with Slot Weights shared by all Cells
+        flat = mean.reshape(DAYS, -1)
+        weight = counts.reshape(DAYS, -1).max(1)
+        weight[self._slots:] = 0
+        weighted = design * weight[:, None]
+
+        coefficients = np.linalg.pinv(weighted.T @ design) @ weighted.T @ np.nan_to_num(flat)
+
+        fitted = design @ coefficients
+        fitted[:, np.all(np.isnan(flat), axis=0)] = np.nan
+
+        return fitted.reshape(mean.shape)
+
+
+def anomaly(data: np.ndarray, time: Union[pd.DatetimeIndex, TimeAxis], window: Optional[int] = None,
+            harmonics: Optional[int] = None, leap: str = 'keep') -> np.ndarray:
+    return Climatology(time, window, harmonics, leap).fit(data).anomaly(data)
@@ -0,0 +1,230 @@
+import numpy as np
+
+from typing import Optional, Tuple, List
+
+import heapq
+
+
+CLUSTER_BLOCK = 2**26  # Bytes of Intermediate (AND-ed) Bit Masks per Distance Block
+
+# Set Bits per Byte, for Numpy Versions without np.bitwise_count
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], np.uint8)
+
+
+def pack(masks: np.ndarray) -> np.ndarray:
+    # Pack Boolean [items, days] Masks into [items, words] uint64 Bit Arrays (Padded with Zeros)
+    masks = np.asarray(masks, bool)
+    packed = np.packbits(masks, axis=1)
+    padded = np.zeros((len(masks), -(-packed.shape[1] // 8) * 8), np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    # Number of Set Bits over the last Axis of uint64 Words
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(-1, dtype=np.int64)
+    return _POPCOUNT[words.view(np.uint8)].sum(-1, dtype=np.int64)
+
+
+def condensed_index(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    # Position of Pair (i, j), i != j, in a Condensed (scipy.spatial.distance.pdist style) Distance Array
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return n * i - i * (i + 1) // 2 + j - i - 1
+
+
+def jaccard_distances(masks: np.ndarray, block: int = CLUSTER_BLOCK) -> np.ndarray:
+    """
+    Condensed float32 Jaccard Distances between Boolean [items, days] Masks (e.g. T95 Exceedances per Cell)
+
+    Masks are Packed into Bits, and Intersections are Counted with popcount, a Block of Rows at a Time.
+    Pairs of Empty Masks have Distance 0, like scipy.spatial.distance.jaccard.
+    """
+
+    packed = pack(masks)
+    counts = popcount(packed)
+    n = len(packed)
+
+    distances = np.empty(n * (n - 1) // 2, np.float32)
+    rows = max(1, block // max(1, packed.nbytes))
+
+    for start in range(0, n - 1, rows):
+        stop = min(start + rows, n - 1)
+
+        # Upper Triangle of Rows [start, stop), i.e. all Pairs (i, j > i)
+        intersection = popcount(packed[start:stop, None] & packed[None, start + 1:])
+        union = counts[start:stop, None] + counts[None, start + 1:] - intersection
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_distances = np.where(union > 0, 1 - intersection / union, 0).astype(np.float32)
+
+        for row in range(start, stop):
+            offset = condensed_index(n, row, row + 1)
+            distances[offset:offset + n - row - 1] = block_distances[row - start, row - start:]
+
+    return distances
+
+
+def grid_connectivity(mask: np.ndarray, wrap: bool = False) -> np.ndarray:
+    # [edges, 2] Pairs of 4-Neighbouring Cells within a [lat, lon] mask, as Positions in mask[mask] Order
+    mask = np.asarray(mask, bool)
+    position = np.full(mask.shape, -1, np.int64)
+    position[mask] = np.arange(mask.sum())
+
+    east = np.roll(position, -1, axis=1) if wrap else np.pad(position[:, 1:], ((0, 0), (0, 1)), constant_values=-1)
+    south = np.pad(position[1:], ((0, 1), (0, 0)), constant_values=-1)
+
+    edges = []
+    for neighbour in (east, south):
+        valid = (position >= 0) & (neighbour >= 0) & (position != neighbour)
+        edges.append(np.column_stack([position[valid], neighbour[valid]]))
+
+    return np.concatenate(edges)
+
+
+def average_linkage(distances: np.ndarray, n: int, connectivity: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Average Linkage Merges [(a, b, distance, size)] of n Items, Updating Condensed distances In Place
+
+    Without connectivity, Merges are found with the Nearest-Neighbour Chain Algorithm. With connectivity ([edges, 2]
+    Item Pairs), only Clusters that share an Edge are Merged (smallest Average Distance first), which keeps Clusters
+    Spatially Contiguous. Merged Clusters take the Place of b, Merges are in Order of Distance.
+    """
+
+    size = np.ones(n, np.int64)
+    active = np.ones(n, bool)
+    items = np.arange(n)
+
+    def row(x: int) -> np.ndarray:
+        others = items[active & (items != x)]
+        values = np.full(n, np.inf)
+        values[others] = distances[condensed_index(n, x, others)]
+        return values
+
+    def merge(x: int, y: int) -> None:
+        # Lance-Williams Update for Average Linkage, the New Cluster takes the Place of y
+        others = items[active & (items != x) & (items != y)]
+        dx, dy = distances[condensed_index(n, x, others)], distances[condensed_index(n, y, others)]
+        distances[condensed_index(n, y, others)] = (size[x] * dx + size[y] * dy) / (size[x] + size[y])
+        size[y] += size[x]
+        active[x] = False
+
+    merges = []
+
+    if connectivity is None:
+        chain = []
+        while len(merges) < n - 1:
+            if not chain:
+                chain = [int(np.argmax(active))]
+
+            while True:
+                x = chain[-1]
+                values = row(x)
+                y = int(np.argmin(values))
+
+                # Prefer the Previous Chain Element on Ties, which Terminates the Chain
+                if len(chain) > 1 and values[chain[-2]] <= values[y]:
+                    y = chain[-2]
+                    break
+
+                chain.append(y)
+
+            chain = chain[:-2]
+            merges.append((x, y, float(values[y]), size[x] + size[y]))
+            merge(x, y)
+
+        merges.sort(key=lambda merge: merge[2])
+    else:
+        neighbours: List[set] = [set() for _ in range(n)]
+        for a, b in np.asarray(connectivity):
+            if a != b:
+                neighbours[a].add(int(b))
+                neighbours[b].add(int(a))
+
+        heap = [(float(distances[condensed_index(n, a, b)]), min(a, b), max(a, b))
+                for a in range(n) for b in neighbours[a] if a < b]
+        heapq.heapify(heap)
+
+        while heap:
+            distance, x, y = heapq.heappop(heap)
+
+            # Skip Pairs that were Merged or Updated since they were Pushed
+            if not (active[x] and active[y]) or distance != distances[condensed_index(n, x, y)]:
+                continue
+
+            merges.append((x, y, distance, size[x] + size[y]))
+            merge(x, y)
+
+            neighbours[y] |= neighbours[x]
+            neighbours[y] -= {x, y}
+            for k in neighbours[x] - {y}:
+                neighbours[k].discard(x)
+                neighbours[k].add(y)
+
+            for k in neighbours[y]:
+                heapq.heappush(heap, (float(distances[condensed_index(n, y, k)]), min(y, k), max(y, k)))
+
+    return np.array(merges, dtype=[("a", np.int64), ("b", np.int64), ("distance", np.float64), ("size", np.int64)])
+
+
+def labels_from_merges(merges: np.ndarray, n: int, n_clusters: int) -> np.ndarray:
+    # Cluster Label (0 .. n_clusters-1, Largest Cluster First) per Item, after the First n - n_clusters Merges
+    parent = np.arange(n)
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(merges["a"][:max(0, n - n_clusters)], merges["b"][:max(0, n - n_clusters)]):
+        parent[find(a)] = find(b)
+
+    roots = np.array([find(x) for x in range(n)])
+    _, labels, sizes = np.unique(roots, return_inverse=True, return_counts=True)
+
+    order = np.argsort(-sizes, kind='stable')
+    return np.argsort(order)[labels]
+
+
+def cluster(masks: np.ndarray, n_clusters: int, connectivity: Optional[np.ndarray] = None,
+            block: int = CLUSTER_BLOCK) -> np.ndarray:
+    """
+    Average Linkage Clustering of Boolean [items, days] Masks under Jaccard Distance
+
+    Equivalent to AgglomerativeClustering(n_clusters, affinity='jaccard', linkage='average').fit(masks).labels_
+    (up to Label Order), in Condensed float32 Memory. Labels are ordered by Cluster Size, Largest First.
+    """
+
+    n = len(masks)
+    merges = average_linkage(jaccard_distances(masks, block), n, connectivity)
+    return labels_from_merges(merges, n, n_clusters)
+
+
+def cluster_grid(exceedance: np.ndarray, mask: np.ndarray, n_clusters: int, contiguous: bool = False,
+                 wrap: bool = False, min_size: int = 0, block: int = CLUSTER_BLOCK) -> np.ndarray:
+    """
+    Cluster Grid Cells by their [time, lat, lon] Exceedance Masks (e.g. T2M > 95th Percentile) within a Region
+
+    mask: Boolean [lat, lon] Region Mask (e.g. era_country_mask(path) == Country.US)
+    contiguous: Only Merge Spatially Neighbouring Clusters (wrap: Longitudes are Periodic)
+    min_size: Clusters with fewer Cells are Dropped
+
+    Returns a [lat, lon] Grid of Labels (Largest Cluster First), -1 outside the Region or in Dropped Clusters
+    """
+
+    mask = np.asarray(mask, bool)
+    connectivity = grid_connectivity(mask, wrap) if contiguous else None
+
+    labels = cluster(np.asarray(exceedance)[:, mask].T, n_clusters, connectivity, block)
+
+    if min_size:
+        sizes = np.bincount(labels)
+        kept = np.flatnonzero(sizes >= min_size)
+        relabel = np.full(len(sizes), -1)
+        relabel[kept] = np.arange(len(kept))
+        labels = relabel[labels]
+
+    grid = np.full(mask.shape, -1, int)
+    grid[mask] = labels
+    return grid
@@ -0,0 +1,220 @@
+from heatwave.loaders.era import ERA
+
+import numpy as np
+
+from typing import Optional, Callable, Iterator, Tuple, Union
+
+
+Chunks = Callable[[], Iterator[Tuple[slice, np.ndarray]]]
+
+
+class EOF:
+    """
+    Empirical Orthogonal Functions (EOFs) of a [time, lat, lon] Anomaly Field, e.g. for the PDO
+
+    The Leading n_modes Modes are found with a Randomized SVD (Halko et al., 2011), accumulated over Time Chunks:
+    every Pass over the Data multiplies it with a thin [cells, n_modes + oversample] Matrix, so neither the Data nor
+    its Covariance is ever held in Memory. The Field is Centered in Time and (optionally) Weighted by the Square Root
+    of the Cosine of Latitude. Cells with Missing Values (e.g. Land) are left out and are NaN in the EOFs.
+
+    iterations: Power Iterations, each costing one more Pass, but sharpening the Estimate of the Trailing Modes
+    """
+
+    def __init__(self, n_modes: int = 10, weighted: bool = True, oversample: int = 10, iterations: int = 3,
+                 seed: Optional[int] = 0):
+        self._n_modes = n_modes
+        self._weighted = weighted
+        self._oversample = oversample
+        self._iterations = iterations
+        self._seed = seed
+
+        self._mean = None
+        self._components = None
+        self._singular = None
+        self._total = None
+        self._pcs = None
+        self._shape = None
+        self._valid = None
+        self._weights = None
+
+    @property
+    def eofs(self) -> np.ndarray:
+        # [mode, lat, lon] EOFs (of the Weighted Field), NaN where Cells were left out
+        self._check()
+        eofs = np.full((self._n_modes,) + self._shape, np.nan)
+        eofs.reshape(self._n_modes, -1)[:, self._valid] = self._components
+        return eofs
+
+    @property
+    def pcs(self) -> np.ndarray:
+        # [time, mode] Principal Components (not Scaled) of the Fitted Data
+        self._check()
+        if self._pcs is None:
+            raise ValueError("Principal components are not known for EOFs loaded from the cache, use project()")
+        return self._pcs
+
+    @property
+    def singular_values(self) -> np.ndarray:
+        self._check()
+        return self._singular
+
+    @property
+    def variance_fraction(self) -> np.ndarray:
+        # Fraction of the Total (Weighted) Variance Explained by every Mode
+        self._check()
+        return self._singular ** 2 / self._total
+
+    def fit(self, era: ERA, anomaly: bool = True, time_block: Optional[int] = None,
+            memory_limit: Optional[int] = None) -> 'EOF':
+        # Fit EOFs to an ERA Dataset, Reusing (and Caching) the EOFs of Earlier Fits with the Same Settings
+        climatology = None
+
+        def chunks() -> Iterator[Tuple[slice, np.ndarray]]:
+            nonlocal climatology
+            if anomaly:
+                # Fit the Climatology once (on the First Pass only), such that every Pass is a single Read
+                if climatology is None:
+                    climatology = era.climatology(time_block=time_block, memory_limit=memory_limit)
+                return era.iter_anomaly(time_block, memory_limit, climatology=climatology)
+            return era.iter_chunks(time_block, memory_limit)
+
+        params = dict(product='eof', n_modes=self._n_modes, weighted=self._weighted, oversample=self._oversample,
+                      iterations=self._iterations, seed=self._seed, anomaly=anomaly)
+
+        def fitted(product) -> np.ndarray:
+            if self._components is None:
+                self.fit_chunks(chunks, era.latitude, era.shape)
+            return product()
+
+        self._components, self._pcs = None, None
+
+        stacked = era._cached(lambda: fitted(self._stacked), part='eofs', **params)
+        singular = era._cached(lambda: fitted(lambda: np.r_[self._singular, self._total]), part='singular', **params)
+
+        if self._components is None:
+            self._load(np.asarray(stacked), np.asarray(singular), era.latitude, era.shape)
+
+        return self
+
+    def fit_array(self, data: np.ndarray, latitude: np.ndarray) -> 'EOF':
+        # Fit EOFs to an in Memory [time, lat, lon] Array
+        data = np.asarray(data)
+        return self.fit_chunks(lambda: iter([(slice(0, len(data)), data)]), latitude, data.shape)
+
+    def fit_chunks(self, chunks: Chunks, latitude: np.ndarray, shape: Tuple[int, int, int]) -> 'EOF':
+        """
+        Fit EOFs to Chunks of a [time, lat, lon] Field
+
+        chunks: Callable returning a Fresh Iterator of (block, [block, lat, lon] data) over the Field on every Call
+        """
+
+        time = shape[0]
+        self._shape = tuple(shape[1:])
+        self._weights = self._cell_weights(latitude)
+
+        width = min(self._n_modes + self._oversample, time)
+        random = np.random.RandomState(self._seed)
+        omega = random.standard_normal((time, width))
+
+        # First Pass: Sketch Y = X' Omega, Mean and Missing Cells (Centering is applied Afterwards)
+        cells = int(np.prod(self._shape))
+        sketch = np.zeros((cells, width))
+        sums = np.zeros(cells)
+        squares = np.zeros(cells)
+        missing = np.zeros(cells, bool)
+
+        for block, data in chunks():
+            data = self._flatten(data)
+            missing |= np.isnan(data).any(0)
+            data = np.nan_to_num(data)
+
+            sketch += data.T @ omega[block]
+            sums += data.sum(0)
+            squares += (data ** 2).sum(0)
+
+        self._valid = ~missing
+        mean = sums[self._valid] / time
+
+        # Centered Sketch: (X - 1 mean') Omega' = X' Omega - mean (1' Omega)
+        sketch = sketch[self._valid] - mean[:, None] * omega.sum(0)[None, :]
+        basis, _ = np.linalg.qr(sketch)
+
+        # Power Iterations: Y = X' X Q, in a single Pass each
+        for _ in range(self._iterations):
+            product = np.zeros_like(basis)
+
+            for block, data in chunks():
+                centered = self._center(data, mean)
+                product += centered.T @ (centered @ basis)
+
+            basis, _ = np.linalg.qr(product)
+
+        # Final Pass: B = X Q, whose SVD gives the Leading Modes
+        projection = np.zeros((time, basis.shape[1]))
+        for block, data in chunks():
+            projection[block] = self._center(data, mean) @ basis
+
+        u, singular, vt = np.linalg.svd(projection, full_matrices=False)
+        components = (basis @ vt.T).T[:self._n_modes]
+
+        # Deterministic Sign: Largest Loading of every Mode is Positive
+        sign = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+        components *= sign[:, None]
+
+        self._mean = np.full(cells, np.nan)
+        self._mean[self._valid] = mean
+        self._mean = self._mean.reshape(self._shape)
+
+        self._components = components
+        self._singular = singular[:self._n_modes]
+        self._total = np.sum(squares[self._valid] - time * mean ** 2)
+        self._pcs = u[:, :self._n_modes] * self._singular[None, :] * sign[None, :]
+
+        return self
+
+    def project(self, data: Union[ERA, np.ndarray], anomaly: bool = True, time_block: Optional[int] = None,
+                memory_limit: Optional[int] = None) -> np.ndarray:
+        # Project a (new) [time, lat, lon] Field onto the EOFs, giving its [time, mode] Principal Components
+        self._check()
+
+        if isinstance(data, ERA):
+            chunks = data.iter_anomaly if anomaly else data.iter_chunks
+            pcs = np.empty((data.shape[0], self._n_modes))
+            for block, values in chunks(time_block, memory_limit):
+                pcs[block] = self._project(values)
+            return pcs
+
+        return self._project(np.asarray(data))
+
+    def _project(self, data: np.ndarray) -> np.ndarray:
+        mean = self._mean.reshape(-1)[self._valid]
+        return self._center(data, mean) @ self._components.T
+
+    def _center(self, data: np.ndarray, mean: np.ndarray) -> np.ndarray:
+        return np.nan_to_num(self._flatten(data)[:, self._valid]) - mean[None, :]
+
+    def _flatten(self, data: np.ndarray) -> np.ndarray:
+        # [time, lat, lon] -> Weighted [time, cells]
+        data = np.asarray(data, np.float64).reshape(len(data), -1)
+        return data * self._weights[None, :] if self._weighted else data
+
+    def _cell_weights(self, latitude: np.ndarray) -> np.ndarray:
+        weights = np.sqrt(np.clip(np.cos(np.radians(np.asarray(latitude, np.float64))), 0, None))
+        return np.repeat(weights, int(np.prod(self._shape)) // len(weights))
+
+    def _stacked(self) -> np.ndarray:
+        # Mean and EOFs as a single [mode + 1, cells] Array, for the Cache
+        return np.concatenate([self._mean[None], self.eofs]).reshape(self._n_modes + 1, -1)
+
+    def _load(self, stacked: np.ndarray, singular: np.ndarray, latitude: np.ndarray,
+              shape: Tuple[int, int, int]) -> None:
+        self._shape = tuple(shape[1:])
+        self._weights = self._cell_weights(latitude)
+        self._mean = stacked[0].reshape(self._shape)
+        self._valid = ~np.isnan(stacked[0])
+        self._components = stacked[1:, self._valid]
+        self._singular, self._total = singular[:-1], singular[-1]
+
+    def _check(self) -> None:
+        if self._components is None:
+            raise ValueError("EOF has not been fitted yet")
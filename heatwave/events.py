@@ -0,0 +1,355 @@
+from heatwave.loaders.era import ERA
+from heatwave.loaders.ensemble import Ensemble
+from heatwave.loaders.spatial import EARTH_RADIUS, to_cartesian
+from heatwave.climatology import Climatology, day_of_year
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from typing import List, Optional, Tuple
+
+
+TRACK_COLUMNS = ['event', 'date', 'area', 'intensity', 'peak', 'latitude', 'longitude']
+EVENT_COLUMNS = ['event', 'start', 'end', 'duration', 'area', 'extent', 'intensity', 'peak', 'latitude', 'longitude']
+
+
+def cell_area(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    # Area (km2) of every Cell [lat, lon] of a Regular Grid, Cells at the Poles Ending there
+    latitude, longitude = np.asarray(latitude, np.float64), np.asarray(longitude, np.float64)
+    spacing_latitude = np.median(np.abs(np.diff(latitude))) if len(latitude) > 1 else 1.0
+    spacing_longitude = np.median(np.abs(np.diff(longitude))) if len(longitude) > 1 else 1.0
+
+    edges = np.radians(np.clip(latitude[:, None] + np.array([-0.5, 0.5]) * spacing_latitude, -90, 90))
+    area = EARTH_RADIUS ** 2 * np.radians(spacing_longitude) * np.abs(np.diff(np.sin(edges), axis=1))[:, 0]
+    return np.broadcast_to(area[:, None], (len(latitude), len(longitude)))
+
+
+def thresholds(era: ERA, q: float = 0.95, anomaly: bool = True, memory_limit: Optional[int] = None) -> np.ndarray:
+    # q-th Percentile over Time of every Cell [lat, lon], Reading Bands of Latitudes that fit within the Memory Limit
+    memory_limit = memory_limit if memory_limit is not None else era.memory_limit
+    rows = int(max(1, memory_limit // max(1, 2 * 8 * len(era.time) * len(era.longitude))))
+
+    output = np.empty(era.shape[1:])
+    for start in range(0, len(era.latitude), rows):
+        band = era.reindex([None, slice(start, start + rows)])
+        data = band._read_blocks(band.iter_anomaly(), np.float64) if anomaly else band._read_blocks(band.iter_chunks())
+        quantile = np.nanquantile if np.isnan(data).any() else np.quantile
+        with np.errstate(invalid='ignore'):
+            output[start:start + rows] = quantile(data, q, axis=0)
+
+    return output
+
+
+class EventDetector:
+    """
+    Heatwave Events: 3-D (time, lat, lon) Connected Components of Cells Exceeding a Threshold, Labelled in a Stream
+
+    threshold: [lat, lon] or Day of Year [366, lat, lon] Threshold (e.g. a per-Cell Percentile, see thresholds())
+    min_duration: Minimum Number of Days, min_area: Minimum (Largest Daily) Area in km2
+    connectivity: 1 (Neighbours share a Face), 2 (an Edge) or 3 (a Corner), as scipy.ndimage
+    wrap: Longitudes are Periodic (default: if the Grid goes all around)
+
+    Time Chunks are Labelled with scipy.ndimage.label, and Labels of Consecutive Chunks are Stitched (Union-Find)
+    where the Last Time Step of one Chunk Touches the First of the Next. Events that no longer Touch the Last Time Step
+    are Complete: they are Summarized and their Per-Day Rows Dropped, so Memory does not Grow with the Record.
+    """
+
+    def __init__(self, threshold: np.ndarray, latitude: np.ndarray, longitude: np.ndarray, min_duration: int = 3,
+                 min_area: float = 0.0, connectivity: int = 1, wrap: Optional[bool] = None):
+
+        if connectivity not in (1, 2, 3):
+            raise ValueError(f"connectivity should be 1, 2 or 3, not {connectivity}")
+
+        self._threshold = np.asarray(threshold, np.float64)
+        self._min_duration = min_duration
+        self._min_area = min_area
+        self._structure = ndimage.generate_binary_structure(3, connectivity)
+
+        if wrap is None:
+            spacing = np.median(np.diff(np.sort(np.mod(longitude, 360)))) if len(longitude) > 1 else 360
+            wrap = len(longitude) > 1 and 360 - np.ptp(np.mod(longitude, 360)) <= 1.5 * spacing
+        self._wrap = bool(wrap)
+
+        self._area = np.ascontiguousarray(cell_area(latitude, longitude)).ravel()
+        self._cartesian = to_cartesian(*np.meshgrid(latitude, longitude, indexing='ij')).reshape(-1, 3)
+        self._positive = bool(np.all(np.asarray(longitude) >= 0))
+
+        self._parent = np.zeros(1, np.int64)  # Union-Find over Global Labels (0: Background)
+        self._boundary = None  # Global Labels [lat, lon] of the Last Time Step
+        self._rows = []  # Per (Label, Day) Summaries of Events in Progress
+        self._events = []
+        self._tracks = []
+
+    @property
+    def events(self) -> pd.DataFrame:
+        # One Row per Complete Event (so far), see catalogue()
+        return _events_frame(self._events)
+
+    @property
+    def tracks(self) -> pd.DataFrame:
+        # One Row per Day of every Complete Event: its Area, Intensity and Centroid
+        return pd.DataFrame(np.concatenate(self._tracks) if self._tracks else np.empty(0, _TRACK_DTYPE),
+                            columns=TRACK_COLUMNS)
+
+    def update(self, dates: pd.DatetimeIndex, data: np.ndarray) -> 'EventDetector':
+        # Label the next [time, lat, lon] Chunk (of Anomalies), following on the Previous Chunk
+        data = np.asarray(data)
+        dates = pd.DatetimeIndex(dates)
+
+        threshold = self._threshold[day_of_year(dates)] if self._threshold.ndim == 3 else self._threshold
+        with np.errstate(invalid='ignore'):
+            exceed = data > threshold
+
+        labels, count = ndimage.label(exceed, self._structure)
+        labels = labels.astype(np.int64)
+
+        # Local Labels become Global Labels
+        offset = len(self._parent) - 1
+        labels[labels > 0] += offset
+        self._parent = np.r_[self._parent, np.arange(offset + 1, offset + count + 1)]
+
+        # Longitude Seam: Cells in the Last Column Neighbour those in the First
+        if self._wrap and count:
+            for shift in self._offsets(time=True):
+                self._union(*_pairs(labels[..., -1], labels[..., 0], shift))
+
+        # Stitch to the Last Time Step of the Previous Chunk (with the Seam Columns Repeated on either Side)
+        if self._boundary is not None and count:
+            boundary, first = self._boundary, labels[0]
+            if self._wrap:
+                boundary, first = (np.concatenate([step[:, -1:], step, step[:, :1]], axis=1)
+                                   for step in (boundary, first))
+            for shift in self._offsets(time=False):
+                self._union(*_pairs(boundary, first, shift))
+
+        self._rows.append(self._summarize(dates, data, labels))
+        self._boundary = labels[-1]
+
+        # Events not in the Last Time Step can not Grow anymore
+        self._complete(active=np.unique(self._find(self._boundary[self._boundary > 0])))
+        self._compact()
+
+        return self
+
+    def finish(self) -> 'EventDetector':
+        # Complete all Events in Progress (at the End of the Record, or of an Ensemble Member)
+        self._complete(active=np.empty(0, np.int64))
+        self._boundary = None
+        return self
+
+    def _compact(self) -> None:
+        # Renumber the Events in Progress 1..n, such that the Union-Find does not Grow with the Record
+        live = np.unique(self._rows[0]['label'])
+        self._rows[0]['label'] = np.searchsorted(live, self._rows[0]['label']) + 1
+
+        labelled = self._boundary > 0
+        self._boundary = self._boundary.copy()
+        self._boundary[labelled] = np.searchsorted(live, self._find(self._boundary[labelled])) + 1
+        self._parent = np.arange(len(live) + 1)
+
+    def _offsets(self, time: bool) -> List[Tuple[int, int]]:
+        # (time, lat) Shifts of Neighbours across the Longitude Seam (time=True) or (lat, lon) Shifts of Neighbours in
+        # the Previous Time Step (time=False), according to the Structure
+        if time:
+            return [(dt - 1, dy - 1) for dt, dy in zip(*np.nonzero(self._structure[:, :, 0]))]
+        return [(dy - 1, dx - 1) for dy, dx in zip(*np.nonzero(self._structure[0]))]
+
+    def _find(self, labels: np.ndarray) -> np.ndarray:
+        # Roots of Labels, with Path Compression by Pointer Jumping
+        roots = self._parent[labels]
+        while True:
+            parents = self._parent[roots]
+            if np.array_equal(parents, roots):
+                break
+            roots = parents
+
+        self._parent[labels] = roots
+        return roots
+
+    def _union(self, first: np.ndarray, second: np.ndarray) -> None:
+        pairs = np.unique(np.stack([first, second], axis=1), axis=0) if len(first) else ()
+        for a, b in pairs:
+            a, b = self._find(np.array([a]))[0], self._find(np.array([b]))[0]
+            if a != b:
+                self._parent[max(a, b)] = min(a, b)
+
+    def _summarize(self, dates: pd.DatetimeIndex, data: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        # Area, Area-Weighted Anomaly Sum, Peak and Area-Weighted Position Sums of every (Label, Day)
+        time, cells = np.nonzero(labels.reshape(len(labels), -1))
+        label = labels.reshape(len(labels), -1)[time, cells]
+        values = data.reshape(len(data), -1)[time, cells].astype(np.float64)
+        area = self._area[cells]
+
+        keys, inverse = np.unique(np.stack([label, time]), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+
+        rows = np.zeros(keys.shape[1], _ROW_DTYPE)
+        rows['label'] = keys[0]
+        rows['date'] = dates.values[keys[1]].astype('datetime64[D]')
+        rows['area'] = np.bincount(inverse, area, len(rows))
+        rows['weighted'] = np.bincount(inverse, area * values, len(rows))
+        rows['peak'] = -np.inf
+        np.maximum.at(rows['peak'], inverse, values)
+        for axis, name in enumerate(('x', 'y', 'z')):
+            rows[name] = np.bincount(inverse, area * self._cartesian[cells, axis], len(rows))
+
+        return rows
+
+    def _position(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Latitude / Longitude of (Area-Weighted Sums of) Unit Vectors, in the Grid's Longitude Convention
+        latitude = np.degrees(np.arctan2(z, np.hypot(x, y)))
+        longitude = np.degrees(np.arctan2(y, x))
+        return latitude, np.mod(longitude, 360) if self._positive else longitude
+
+    def _complete(self, active: np.ndarray) -> None:
+        rows = np.concatenate(self._rows) if self._rows else np.empty(0, _ROW_DTYPE)
+        rows['label'] = self._find(rows['label'])
+
+        done = ~np.isin(rows['label'], active)
+        self._rows = [rows[~done]]
+        rows = rows[done]
+
+        if not len(rows):
+            return
+
+        # Merge Rows of Labels that were Joined, per (Event, Day)
+        keys, inverse = np.unique(np.stack([rows['label'], rows['date'].astype(np.int64)]), axis=1,
+                                  return_inverse=True)
+        inverse = inverse.ravel()
+
+        days = np.zeros(keys.shape[1], _ROW_DTYPE)
+        days['label'], days['date'] = keys[0], keys[1].astype('datetime64[D]')
+        for name in ('area', 'weighted', 'x', 'y', 'z'):
+            days[name] = np.bincount(inverse, rows[name], len(days))
+        days['peak'] = -np.inf
+        np.maximum.at(days['peak'], inverse, rows['peak'])
+
+        events, starts = np.unique(days['label'], return_index=True)
+        durations = np.diff(np.r_[starts, len(days)])
+
+        largest = np.maximum.reduceat(days['area'], starts)
+        keep = (durations >= self._min_duration) & (largest >= self._min_area)
+        keep_days = np.repeat(keep, durations)
+
+        # Number Events in Order of Completion (and Start within a Chunk)
+        first = sum(len(events) for events in self._events)
+        numbers = first + np.cumsum(keep) - 1
+
+        track = np.zeros(keep_days.sum(), _TRACK_DTYPE)
+        kept = days[keep_days]
+        track['event'] = np.repeat(numbers[keep], durations[keep])
+        track['date'] = kept['date']
+        track['area'] = kept['area']
+        track['intensity'] = kept['weighted'] / kept['area']
+        track['peak'] = kept['peak']
+        track['latitude'], track['longitude'] = self._position(kept['x'], kept['y'], kept['z'])
+        self._tracks.append(track)
+
+        sums = {name: np.add.reduceat(days[name], starts)[keep] for name in ('area', 'weighted', 'x', 'y', 'z')}
+        event = np.zeros(keep.sum(), _EVENT_DTYPE)
+        event['event'] = numbers[keep]
+        event['start'] = days['date'][starts][keep]
+        event['end'] = days['date'][starts + durations - 1][keep]
+        event['duration'] = (event['end'] - event['start']).astype(np.int64) + 1
+        event['area'] = largest[keep]
+        event['extent'] = sums['area']
+        event['intensity'] = sums['weighted'] / sums['area']
+        event['peak'] = np.maximum.reduceat(days['peak'], starts)[keep]
+        event['latitude'], event['longitude'] = self._position(sums['x'], sums['y'], sums['z'])
+        self._events.append(event)
+
+
+_ROW_DTYPE = np.dtype([('label', np.int64), ('date', 'datetime64[D]'), ('area', np.float64),
+                       ('weighted', np.float64), ('peak', np.float64), ('x', np.float64), ('y', np.float64),
+                       ('z', np.float64)])
+_TRACK_DTYPE = np.dtype([('event', np.int64), ('date', 'datetime64[D]'), ('area', np.float64),
+                         ('intensity', np.float64), ('peak', np.float64), ('latitude', np.float64),
+                         ('longitude', np.float64)])
+_EVENT_DTYPE = np.dtype([('event', np.int64), ('start', 'datetime64[D]'), ('end', 'datetime64[D]'),
+                         ('duration', np.int64), ('area', np.float64), ('extent', np.float64),
+                         ('intensity', np.float64), ('peak', np.float64), ('latitude', np.float64),
+                         ('longitude', np.float64)])
+
+
+def catalogue(era: ERA, threshold: np.ndarray, anomaly: bool = True, min_duration: int = 3, min_area: float = 0.0,
+              connectivity: int = 1, wrap: Optional[bool] = None, time_block: Optional[int] = None,
+              memory_limit: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Event Catalogue of an ERA Dataset, Streamed over Time Chunks, see EventDetector
+
+    Returns (events, tracks):
+        events: start, end, duration (days), area (largest daily, km2), extent (km2 days), intensity (Area-Weighted
+                Mean Anomaly), peak (Anomaly), latitude / longitude (Area-Weighted Centroid)
+        tracks: Area, Intensity, Peak and Centroid of every Event on every Day
+    """
+
+    detector = EventDetector(threshold, era.latitude, era.longitude, min_duration, min_area, connectivity, wrap)
+    chunks = era.iter_anomaly(time_block, memory_limit) if anomaly else era.iter_chunks(time_block, memory_limit)
+
+    for block, data in chunks:
+        detector.update(era.time.index[block], data)
+
+    detector.finish()
+    return detector.events, detector.tracks
+
+
+def catalogue_ensemble(ensemble: Ensemble, threshold: np.ndarray, climatology: Optional[Climatology] = None,
+                       anomaly: bool = True, min_duration: int = 3, min_area: float = 0.0, connectivity: int = 1,
+                       wrap: Optional[bool] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Event Catalogue of every Ensemble Member, with a 'member' Column, see catalogue()
+
+    Members are Detected on the Ensemble's Pool, every Worker Streaming its Member one Year (File) at a Time.
+    Anomalies are relative to climatology (default: Pooled over all Members, see Ensemble.climatology).
+    """
+
+    mean = None
+    if anomaly:
+        mean = (climatology or ensemble.climatology()).mean
+
+    with ensemble.pool() as executor:
+        futures = [executor.submit(_member_events, ensemble, member, threshold, mean, min_duration, min_area,
+                                   connectivity, wrap) for member in range(len(ensemble.members))]
+        results = [future.result() for future in futures]
+
+    events = pd.concat([frame.assign(member=member) for member, (frame, _) in enumerate(results)], ignore_index=True)
+    tracks = pd.concat([frame.assign(member=member) for member, (_, frame) in enumerate(results)], ignore_index=True)
+
+    return events[['member'] + EVENT_COLUMNS], tracks[['member'] + TRACK_COLUMNS]
+
+
+def _member_events(ensemble: Ensemble, member: int, threshold: np.ndarray, mean: Optional[np.ndarray],
+                   min_duration: int, min_area: float, connectivity: int,
+                   wrap: Optional[bool]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    time = pd.DatetimeIndex(ensemble.time.index)
+    climatology = Climatology(time, mean=mean) if mean is not None else None
+    year_length = len(time) // len(ensemble.years)
+
+    detector = EventDetector(threshold, ensemble.latitude, ensemble.longitude, min_duration, min_area,
+                             connectivity, wrap)
+
+    for year in range(len(ensemble.years)):
+        block = slice(year * year_length, (year + 1) * year_length)
+        data = ensemble.read(member, year)
+        detector.update(time[block], climatology.anomaly(data, block) if climatology is not None else data)
+
+    detector.finish()
+    return detector.events, detector.tracks
+
+
+def _pairs(first: np.ndarray, second: np.ndarray, shift: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    # Labels of (first[i], second[i + shift]) where both are Labelled, for 2-D Arrays
+    (a, b), slices_first, slices_second = shift, [], []
+    for offset, length in zip((a, b), first.shape):
+        slices_first.append(slice(max(0, -offset), length - max(0, offset)))
+        slices_second.append(slice(max(0, offset), length - max(0, -offset)))
+
+    left, right = first[tuple(slices_first)], second[tuple(slices_second)]
+    both = (left > 0) & (right > 0)
+    return left[both], right[both]
+
+
+def _events_frame(events: List[np.ndarray]) -> pd.DataFrame:
+    events = np.concatenate(events) if events else np.empty(0, _EVENT_DTYPE)
+    return pd.DataFrame(events, columns=EVENT_COLUMNS)
@@ -0,0 +1,2 @@
+from .t95 import t95, t95_ensemble, spatial_percentile, area_weights, standardize, rolling_mean
+from .climate import ClimateIndex, Region, REGISTRY, register, compute, write
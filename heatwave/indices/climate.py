@@ -0,0 +1,209 @@
+from heatwave.loaders.era import ERA
+from heatwave.climatology import Climatology
+from heatwave.indices.t95 import spatial_percentile
+
+import numpy as np
+import pandas as pd
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import os
+
+
+class Region:
+    """
+    Coordinate Box with Inclusive Bounds, Longitudes in either the -180/180 or 0/360 Convention (and may Wrap)
+
+    mask: Optional Boolean [lat, lon] Mask on the Source Grid restricting the Box further (e.g. a Cluster or Country)
+    """
+
+    def __init__(self, latitude: Tuple[float, float], longitude: Tuple[float, float],
+                 mask: Optional[np.ndarray] = None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.mask = mask
+
+    def cells(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        # Boolean [lat, lon] Mask of the Region on a Grid
+        within_latitude = (latitudes >= self.latitude[0]) & (latitudes <= self.latitude[1])
+
+        longitude_min, longitude_max = np.mod(self.longitude, 360)
+        grid_longitudes = np.mod(longitudes, 360)
+        if longitude_min <= longitude_max:
+            within_longitude = (grid_longitudes >= longitude_min) & (grid_longitudes <= longitude_max)
+        else:
+            within_longitude = (grid_longitudes >= longitude_min) | (grid_longitudes <= longitude_max)
+
+        cells = within_latitude[:, None] & within_longitude[None, :]
+        return cells & np.asarray(self.mask, bool) if self.mask is not None else cells
+
+    def __repr__(self):
+        return f"Region({self.latitude}, {self.longitude}{', masked' if self.mask is not None else ''})"
+
+
+class ClimateIndex:
+    """
+    Declarative Climate Index: a Weighted Sum of Regional Reductions of a single Source Variable
+
+    source: Key of the Source (e.g. 'sst', 'msl'), resolved to an ERA Dataset when Computing
+    terms: (weight, Region) Pairs, e.g. [(1, AZORES), (-1, ICELAND)] for the NAO
+    reduction: 'mean' (over the Region's Cells, Ignoring NaN) or 'percentile' (q-th Spatial Percentile)
+    anomaly: Subtract the Day of Year Climatology (per Cell for Percentiles, of the Regional Mean otherwise)
+    normalize: Divide by the Standard Deviation, either of every Term ('terms') or of the Index ('index')
+    fill: Forward Fill Missing Values
+    """
+
+    def __init__(self, name: str, source: str, terms: Sequence[Tuple[float, Region]], reduction: str = 'mean',
+                 q: float = 0.5, anomaly: bool = True, normalize: Optional[str] = None, fill: bool = True):
+
+        if reduction not in ('mean', 'percentile'):
+            raise ValueError(f"reduction should be either 'mean' or 'percentile', not '{reduction}'")
+        if normalize not in (None, 'terms', 'index'):
+            raise ValueError(f"normalize should be either None, 'terms' or 'index', not '{normalize}'")
+
+        self.name = name
+        self.source = source
+        self.terms = list(terms)
+        self.reduction = reduction
+        self.q = q
+        self.anomaly = anomaly
+        self.normalize = normalize
+        self.fill = fill
+
+    def __repr__(self):
+        return f"ClimateIndex({self.name}, {self.source}, {self.reduction})"
+
+
+REGISTRY: Dict[str, ClimateIndex] = OrderedDict()
+
+
+def register(index: ClimateIndex) -> ClimateIndex:
+    REGISTRY[index.name] = index
+    return index
+
+
+# Oceanic Nino Index: Nino 3.4 Sea Surface Temperature Anomaly
+ONI = register(ClimateIndex('ONI', 'sst', [(1, Region((-5, 5), (190, 240)))], normalize='index'))
+
+# North Atlantic Oscillation: Azores minus Iceland Sea Level Pressure
+NAO = register(ClimateIndex('NAO', 'msl', [(1, Region((30, 40), (330, 340))), (-1, Region((60, 70), (335, 345)))],
+                            normalize='terms'))
+
+# Pacific North American Pattern: Four Centers of Action in Sea Level Pressure
+PNA = register(ClimateIndex('PNA', 'msl', [(0.25, Region((15, 25), (180, 220))), (-0.25, Region((40, 50), (180, 220))),
+                                           (0.25, Region((45, 60), (235, 255))), (-0.25, Region((25, 35), (270, 290)))],
+                            normalize='index'))
+
+# Soil Moisture (Layers 1-3): 5th Spatial Percentile over the (Contiguous) United States
+for layer in (1, 2, 3):
+    register(ClimateIndex(f'SM{layer}', f'swvl{layer}', [(1, Region((25, 50), (-125, -67)))],
+                          reduction='percentile', q=0.05, normalize='index'))
+
+
+def compute(indices: Iterable[Union[str, ClimateIndex]], sources: Dict[str, ERA], time_block: Optional[int] = None,
+            memory_limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Compute Climate Indices (Names from REGISTRY or Definitions), one Column per Index
+
+    sources: ERA Dataset per Source Key, e.g. {'sst': ERA('sst.nc', 'sst'), 'msl': ERA('slp.nc', 'msl')}
+
+    Definitions are Grouped by Source, and every Source is Read Once, in Time Chunks, over the Bounding Box of all
+    its Regions. Regional Means and Spatial Percentiles are Reduced on the Fly, such that Memory does not grow with
+    Region Size times Time; Percentile Anomalies need one more Pass to Fit their per Cell Climatologies first.
+    """
+
+    indices = [REGISTRY[index] if isinstance(index, str) else index for index in indices]
+
+    groups: Dict[str, List[ClimateIndex]] = OrderedDict()
+    for index in indices:
+        if index.source not in sources:
+            raise KeyError(f"No source '{index.source}' for index '{index.name}'")
+        groups.setdefault(index.source, []).append(index)
+
+    columns = {}
+    for source, group in groups.items():
+        columns.update(_compute_source(sources[source], group, time_block, memory_limit))
+
+    return pd.concat([columns[index.name].rename(index.name) for index in indices], axis=1)
+
+
+def write(frame: pd.DataFrame, path: str) -> None:
+    # All Indices in one Table: Parquet if the Path asks for it (requires pyarrow), CSV otherwise
+    if os.path.splitext(path)[1] == '.parquet':
+        frame.to_parquet(path)
+    else:
+        frame.to_csv(path, index_label='date')
+
+
+def _compute_source(era: ERA, indices: List[ClimateIndex], time_block: Optional[int],
+                    memory_limit: Optional[int]) -> Dict[str, pd.Series]:
+
+    # Every Distinct Term is Reduced Once, even if Shared between Indices: Regional Means by Region, Percentiles also
+    # by q and Anomaly, since they are Reduced per Time Block (after a per Cell Anomaly) rather than Kept per Cell
+    terms = OrderedDict()
+    for index in indices:
+        for _, region in index.terms:
+            terms.setdefault(_term(index, region), region.cells(era.latitude, era.longitude))
+
+    for key, cells in terms.items():
+        if not cells.any():
+            raise ValueError(f"Region of a '{key[1]}' term contains no grid cells")
+
+    # Read only the Bounding Box of all Regions
+    rows = np.flatnonzero(np.any([cells.any(1) for cells in terms.values()], axis=0))
+    columns = np.flatnonzero(np.any([cells.any(0) for cells in terms.values()], axis=0))
+    rows, columns = slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1)
+
+    view = era.reindex([None, rows, columns])
+    terms = OrderedDict((key, cells[rows, columns]) for key, cells in terms.items())
+
+    # First Pass (only if needed): Fit the per Cell Climatology of every Percentile Anomaly Term
+    climatologies = {key: Climatology(view.time_axis) for key in terms if key[1] == 'percentile' and key[3]}
+    if climatologies:
+        for block, data in view.iter_chunks(time_block, memory_limit):
+            for key, climatology in climatologies.items():
+                climatology.update(block, data[:, terms[key]])
+
+    series = {key: np.full(len(view.time), np.nan) for key in terms}
+
+    for block, data in view.iter_chunks(time_block, memory_limit):
+        for key, cells in terms.items():
+            values = data[:, cells]
+            if key[1] == 'mean':
+                with np.errstate(invalid='ignore'):
+                    series[key][block] = np.nanmean(values, axis=1) if np.isnan(values).any() else values.mean(1)
+            else:
+                if key in climatologies:
+                    values = climatologies[key].anomaly(values, block)
+                series[key][block] = spatial_percentile(values, key[2])
+
+    results = {}
+    for index in indices:
+        total = np.zeros(len(view.time))
+
+        for weight, region in index.terms:
+            values = series[_term(index, region)]
+
+            # Percentile Terms are Anomalies (if asked for) already
+            if index.anomaly and index.reduction == 'mean':
+                values = Climatology(view.time_axis).fit(values).anomaly(values)
+            if index.normalize == 'terms':
+                values = values / np.nanstd(values, ddof=1)
+
+            total += weight * values
+
+        if index.normalize == 'index':
+            total /= np.nanstd(total, ddof=1)
+
+        result = pd.Series(total, index=view.time.index)
+        results[index.name] = result.ffill() if index.fill else result
+
+    return results
+
+
+def _term(index: ClimateIndex, region: Region) -> Tuple:
+    # Key of a Region's Reduction under an Index
+    if index.reduction == 'mean':
+        return id(region), 'mean'
+    return id(region), 'percentile', index.q, index.anomaly
@@ -0,0 +1,201 @@
+from heatwave.loaders.era import ERA
+from heatwave.loaders.ensemble import Ensemble
+from heatwave.climatology import Climatology
+
+import numpy as np
+import pandas as pd
+
+from typing import Optional, Union, Tuple
+
+
+Weights = Optional[Union[str, np.ndarray]]
+
+
+def area_weights(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    # Relative Grid Cell Area [lat, lon] of a Regular Grid, proportional to the Cosine of Latitude
+    return np.broadcast_to(np.cos(np.radians(np.asarray(latitude, np.float64)))[:, None],
+                           (len(latitude), len(longitude)))
+
+
+def spatial_percentile(data: np.ndarray, q: float = 0.95, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    q-th Percentile over the Cells of every Time Step of [time, cells] data, Ignoring NaN
+
+    Without weights this equals np.nanquantile(data, q, 1) (Linear Interpolation), but Partitions rather than Sorts.
+    With weights, Cell i of the Sorted Values sits at Position (Weight of Cells before i) / (Weight of all but the Last
+    Cell), which reduces to the Unweighted Definition for Equal Weights.
+    """
+
+    data = np.asarray(data, np.float64)
+    output = np.full(len(data), np.nan)
+
+    if not data.size:
+        return output
+
+    # Rows with Missing Cells have their own Cell Count, and are Handled one by one
+    missing = np.isnan(data).any(1)
+    complete = np.flatnonzero(~missing)
+
+    if weights is None:
+        position = q * (data.shape[1] - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, data.shape[1] - 1)
+
+        partition = np.partition(data[complete], [lower, upper], axis=1)
+        output[complete] = partition[:, lower] + (position - lower) * (partition[:, upper] - partition[:, lower])
+
+        for row in np.flatnonzero(missing):
+            if not np.isnan(data[row]).all():
+                output[row] = np.nanquantile(data[row], q)
+    else:
+        weights = np.asarray(weights, np.float64)
+        output[complete] = _weighted_percentile(data[complete], q, weights)
+
+        for row in np.flatnonzero(missing):
+            valid = ~np.isnan(data[row])
+            if valid.any():
+                output[row] = _weighted_percentile(data[row, valid][None], q, weights[valid])[0]
+
+    return output
+
+
+def _weighted_percentile(data: np.ndarray, q: float, weights: np.ndarray) -> np.ndarray:
+    if data.shape[1] == 1:
+        return data[:, 0].copy()
+
+    order = np.argsort(data, axis=1)
+    values = np.take_along_axis(data, order, axis=1)
+    weight = weights[order]
+
+    # Position of every Sorted Value within [0, 1]
+    position = np.cumsum(weight, axis=1) - weight
+    position /= position[:, -1:]
+
+    # Interpolate between the last Value at or below q and the next
+    lower = np.clip(np.sum(position <= q, axis=1) - 1, 0, data.shape[1] - 2)[:, None]
+    p0, p1 = np.take_along_axis(position, lower, 1), np.take_along_axis(position, lower + 1, 1)
+    v0, v1 = np.take_along_axis(values, lower, 1), np.take_along_axis(values, lower + 1, 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(p1 > p0, (q - p0) / (p1 - p0), 0)
+
+    return (v0 + fraction * (v1 - v0))[:, 0]
+
+
+def standardize(series: np.ndarray) -> np.ndarray:
+    # Zero Mean, Unit (Sample) Standard Deviation, like (T95 - T95.mean()) / T95.std()
+    return (series - np.nanmean(series)) / np.nanstd(series, ddof=1)
+
+
+def rolling_mean(series: np.ndarray, window: int) -> np.ndarray:
+    # Centered Rolling Mean via Cumulative Sums, NaN where the Window is Incomplete (like .rolling(window, center=True))
+    output = np.full(len(series), np.nan)
+
+    if window > len(series):
+        return output
+
+    missing = np.isnan(series)
+    sums = np.r_[0, np.cumsum(np.where(missing, 0, series))]
+    counts = np.r_[0, np.cumsum(missing)]
+
+    means = (sums[window:] - sums[:-window]) / window
+    means[(counts[window:] - counts[:-window]) > 0] = np.nan
+
+    # The Window ending at i is Centered on i - (window - 1) // 2
+    output[window // 2:window // 2 + len(means)] = means
+
+    return output
+
+
+def t95(era: ERA, mask: np.ndarray, q: float = 0.95, weights: Weights = None, anomaly: bool = True,
+        normalize: bool = True, rolling: Optional[int] = None, time_block: Optional[int] = None,
+        memory_limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    T95: Spatial q-th Percentile of (Anomalous) Temperature within a Region, per Time Step
+
+    era: Temperature, e.g. ERA('t2m.nc', 't2m').summer()
+    mask: Boolean [lat, lon] Region Mask, e.g. era_country_mask(path) == Country.US
+    weights: None, 'area' (Cosine of Latitude) or a [lat, lon] Array of Cell Weights
+    anomaly: Subtract the Day of Year Climatology first
+    normalize: Standardize T95 to Zero Mean and Unit Standard Deviation
+    rolling: Width of a Centered Rolling Mean, added as 'T95_mean'
+
+    Only the Bounding Box of mask is Read, one Time Block at a Time.
+    """
+
+    mask = np.asarray(mask, bool)
+    cell_weights = _cell_weights(weights, era.latitude, era.longitude, mask)
+    era, mask = _crop(era, mask)
+
+    output = np.full(len(era.time), np.nan)
+    chunks = era.iter_anomaly(time_block, memory_limit) if anomaly else era.iter_chunks(time_block, memory_limit)
+
+    for block, data in chunks:
+        output[block] = spatial_percentile(data[:, mask], q, cell_weights)
+
+    return _frame(output, era.time.index, normalize, rolling)
+
+
+def t95_ensemble(ensemble: Ensemble, mask: np.ndarray, q: float = 0.95, weights: Weights = None,
+                 anomaly: bool = True, normalize: bool = True, rolling: Optional[int] = None) -> pd.DataFrame:
+    """
+    T95 of every Ensemble Member (see t95), Computed in Parallel on the Ensemble's Pool
+
+    Returns a DataFrame with ('T95', member) (and ('T95_mean', member)) Columns, such that result['T95'] holds one
+    Column per Member. Every Member is Standardized by itself.
+    """
+
+    mask = np.asarray(mask, bool)
+    cell_weights = _cell_weights(weights, ensemble.latitude, ensemble.longitude, mask)
+    time = pd.DatetimeIndex(ensemble.time.index)
+
+    with ensemble.pool() as executor:
+        futures = [executor.submit(_member_t95, ensemble, member, mask, q, cell_weights, anomaly)
+                   for member in range(len(ensemble.members))]
+
+        frames = {member: _frame(future.result(), time, normalize, rolling) for member, future in enumerate(futures)}
+
+    return pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+
+def _member_t95(ensemble: Ensemble, member: int, mask: np.ndarray, q: float, weights: Optional[np.ndarray],
+                anomaly: bool) -> np.ndarray:
+    # Keep only the Region's Cells of every Year, such that a Worker holds at most one Year of the full Grid
+    data = np.concatenate([ensemble.read(member, year)[:, mask] for year in range(len(ensemble.years))])
+
+    if anomaly:
+        data = Climatology(pd.DatetimeIndex(ensemble.time.index)).fit(data).anomaly(data)
+
+    return spatial_percentile(data, q, weights)
+
+
+def _crop(era: ERA, mask: np.ndarray) -> Tuple[ERA, np.ndarray]:
+    # Restrict ERA and Mask to the Bounding Box of the Mask
+    rows, columns = np.flatnonzero(mask.any(1)), np.flatnonzero(mask.any(0))
+
+    if not len(rows):
+        raise ValueError("Region mask is empty")
+
+    rows, columns = slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1)
+    return era.reindex([None, rows, columns]), mask[rows, columns]
+
+
+def _cell_weights(weights: Weights, latitude: np.ndarray, longitude: np.ndarray,
+                  mask: np.ndarray) -> Optional[np.ndarray]:
+    if weights is None:
+        return None
+    if isinstance(weights, str):
+        if weights != 'area':
+            raise ValueError(f"weights should be either None, 'area' or an array, not '{weights}'")
+        weights = area_weights(latitude, longitude)
+    return np.asarray(weights, np.float64)[mask]
+
+
+def _frame(series: np.ndarray, time: pd.DatetimeIndex, normalize: bool, rolling: Optional[int]) -> pd.DataFrame:
+    series = standardize(series) if normalize else series
+    frame = pd.DataFrame({'T95': series}, index=time)
+
+    if rolling:
+        frame['T95_mean'] = rolling_mean(series, rolling)
+
+    return frame
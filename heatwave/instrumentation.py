@@ -0,0 +1,106 @@
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Optional
+
+import threading
+import time
+
+
+Progress = Callable[[str, int, Optional[int], str], None]  # (task, done, total, item), item is Empty once Finished
+
+
+class Instrumentation:
+    """
+    Opt-In Timers, Counters and Progress of the Loaders (e.g. Bytes Read, Cache Hits), see instrument()
+
+    Timers accumulate (calls, seconds) per Name, Counters accumulate Values per Name. Both are Thread-Safe, such that
+    Reads in Worker Threads (e.g. Ensemble) are Counted too; Work done in Worker Processes is not.
+    """
+
+    def __init__(self, progress: Optional[Progress] = None):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._progress = progress
+
+    @property
+    def timers(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self._timers.items()}
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                calls, seconds = self._timers.get(name, (0, 0.0))
+                self._timers[name] = calls + 1, seconds + elapsed
+
+    def progress(self, task: str, done: int, total: Optional[int] = None, item: str = "") -> None:
+        if self._progress is not None:
+            self._progress(task, done, total, item)
+
+    def report(self) -> Dict[str, Dict]:
+        # Machine-Readable Snapshot of all Timers and Counters
+        return {'timers': self.timers, 'counters': self.counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+
+_ACTIVE: Optional[Instrumentation] = None
+
+
+@contextmanager
+def instrument(instrumentation: Optional[Instrumentation] = None,
+               progress: Optional[Progress] = None) -> Iterator[Instrumentation]:
+    # Collect Timers and Counters (and Report Progress) within this Context, Instrumentation is Off otherwise
+    global _ACTIVE
+
+    previous = _ACTIVE
+    _ACTIVE = instrumentation if instrumentation is not None else Instrumentation(progress)
+    try:
+        yield _ACTIVE
+    finally:
+        _ACTIVE = previous
+
+
+def active() -> Optional[Instrumentation]:
+    return _ACTIVE
+
+
+def count(name: str, value: int = 1) -> None:
+    if _ACTIVE is not None:
+        _ACTIVE.count(name, value)
+
+
+def timer(name: str):
+    return _ACTIVE.timer(name) if _ACTIVE is not None else nullcontext()
+
+
+def progress(task: str, done: int, total: Optional[int] = None, item: str = "") -> None:
+    if _ACTIVE is not None:
+        _ACTIVE.progress(task, done, total, item)
+
+
+def console_progress(task: str, done: int, total: Optional[int] = None, item: str = "") -> None:
+    # Single Line Console Progress, as the Loaders used to Print: instrument(progress=console_progress)
+    if not item:
+        print(f"\r{task} {done:6d}" + (f"/{total:6d}" if total is not None else ""))
+    elif total is not None:
+        print(f"\r{task} {done:6d}/{total:6d} : {item}", end="")
+    else:
+        print(f"\r{task} {done:6d} : {item}", end="")
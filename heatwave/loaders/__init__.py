@@ -1,2 +1,6 @@
 from .ghcn import GHCN, GHCNElement
-from .era import ERA
\ No newline at end of file
+from .era import ERA
+from .ensemble import Ensemble
+from .samples import Samples
+from .store import Store, rechunk
+from .stations import quality_control, aggregate
@@ -0,0 +1,147 @@
+import numpy as np
+
+from typing import Tuple, List
+
+
+RECORD_LENGTH = 269  # Characters per .dly Record (excluding Newline)
+DAYS = 31  # Day Values per .dly Record
+
+NA = -9999
+
+# Fixed Width .dly Record: Header followed by 31 x (VALUE[5] MFLAG[1] QFLAG[1] SFLAG[1])
+RECORD = np.dtype([
+    ("ID", "S11"),
+    ("YEAR", "S4"),
+    ("MONTH", "S2"),
+    ("ELEMENT", "S4"),
+    ("DAYS", "u1", (DAYS, 8)),
+])
+
+RECORD_LINE = np.dtype(RECORD.descr + [("NEWLINE", "S1")])
+
+INVENTORY_LENGTH = 45  # Characters per Inventory Record (excluding Newline)
+
+# Fixed Width Inventory Record (ghcnd-inventory.txt), Fields are Separated by a single Space
+INVENTORY = np.dtype([
+    ("ID", "S11"), ("_0", "S1"),
+    ("LAT", "u1", 8), ("_1", "S1"),
+    ("LON", "u1", 9), ("_2", "S1"),
+    ("ELEMENT", "S4"), ("_3", "S1"),
+    ("FIRSTYEAR", "u1", 4), ("_4", "S1"),
+    ("LASTYEAR", "u1", 4),
+])
+
+
+def read_records(raw: bytes) -> np.ndarray:
+    # Fast Path: Every Record is exactly one Line of Fixed Length, View Bytes as Structured Array
+    if len(raw) % (RECORD_LENGTH + 1) == 0:
+        records = np.frombuffer(raw, RECORD_LINE)
+        if np.all(records["NEWLINE"] == b"\n"):
+            return records[list(RECORD.names)]
+
+    # Slow Path: Pad Irregular Lines to Record Length
+    lines = [line.rstrip(b"\r").ljust(RECORD_LENGTH)[:RECORD_LENGTH] for line in raw.split(b"\n") if line.strip()]
+    return np.frombuffer(b"".join(lines), RECORD)
+
+
+def parse_int(field: np.ndarray) -> np.ndarray:
+    # Parse Right Aligned ASCII Integers [..., width] (uint8) with optional Minus Sign, Vectorised
+    digits = np.where((field >= ord("0")) & (field <= ord("9")), field.astype(np.int32) - ord("0"), 0)
+    values = digits @ (10 ** np.arange(field.shape[-1] - 1, -1, -1, dtype=np.int32))
+    return np.where(np.any(field == ord("-"), axis=-1), -values, values)
+
+
+def parse_float(field: np.ndarray) -> np.ndarray:
+    # Parse Right Aligned ASCII Decimals [n, width] (uint8), e.g. " -12.3456", Vectorised
+    field = np.ascontiguousarray(field)
+
+    point = field == ord(".")
+    point_position = np.where(point.any(axis=-1), np.argmax(point, axis=-1), -1)
+    decimals = np.where(point_position >= 0, field.shape[-1] - 1 - point_position, 0)
+
+    # Digits Left of the Decimal Point shift one Position less than their Column suggests
+    position = np.arange(field.shape[-1])
+    digits = np.where((field >= ord("0")) & (field <= ord("9")), field - np.uint8(ord("0")), 0).astype(np.float64)
+
+    # Fixed Width Columns share their Decimal Point Position, so a single Matrix-Vector Product suffices
+    if np.all(point_position == point_position[:1]):
+        exponent = (field.shape[-1] - 1 - position) - (position < point_position[:1])
+        values = digits @ 10.0 ** np.maximum(exponent, 0)
+    else:
+        exponent = (field.shape[-1] - 1 - position) - (position < point_position[:, None])
+        values = np.sum(digits * 10.0 ** np.maximum(exponent, 0), axis=-1)
+
+    values /= 10.0 ** decimals
+    return np.where(np.any(field == ord("-"), axis=-1), -values, values)
+
+
+def read_inventory(raw: bytes) -> np.ndarray:
+    # Fast Path: View Bytes as Structured Array if every Line has the Record Length
+    if len(raw) % (INVENTORY_LENGTH + 1) == 0 and np.all(
+            np.frombuffer(raw, np.uint8)[INVENTORY_LENGTH::INVENTORY_LENGTH + 1] == ord("\n")):
+        records = np.frombuffer(raw, np.dtype(INVENTORY.descr + [("NEWLINE", "S1")]))
+
+    # Slow Path: Pad Lines to Record Length
+    else:
+        lines = [line.rstrip(b"\r").ljust(INVENTORY_LENGTH)[:INVENTORY_LENGTH]
+                 for line in raw.split(b"\n") if line.strip()]
+        records = np.frombuffer(b"".join(lines), INVENTORY)
+
+    inventory = np.empty(len(records), [("ID", "U11"), ("LAT", "f8"), ("LON", "f8"), ("ELEMENT", "U4"),
+                                        ("FIRSTYEAR", "i4"), ("LASTYEAR", "i4")])
+
+    inventory["ID"] = records["ID"].astype("U11")
+    inventory["LAT"] = parse_float(records["LAT"])
+    inventory["LON"] = parse_float(records["LON"])
+    inventory["ELEMENT"] = records["ELEMENT"].astype("U4")
+    inventory["FIRSTYEAR"] = parse_int(records["FIRSTYEAR"])
+    inventory["LASTYEAR"] = parse_int(records["LASTYEAR"])
+
+    return inventory
+
+
+def parse_header(records: np.ndarray, name: str) -> np.ndarray:
+    return parse_int(np.ascontiguousarray(records[name]).view(np.uint8).reshape(len(records), -1))
+
+
+def span_days(span: Tuple[int, int]) -> int:
+    return int((np.datetime64(f"{span[1] + 1:04d}-01-01") - np.datetime64(f"{span[0]:04d}-01-01")).astype(int))
+
+
+def station_values(raw: bytes, element: str, span: Tuple[int, int], out: np.ndarray = None) -> np.ndarray:
+    # Daily Values of Element within Span for a single Station File, as [days] int16 (NA where missing)
+    return record_values(read_records(raw), element, span, out)
+
+
+def station_targets(raw: bytes, targets: List[Tuple[str, Tuple[int, int]]]) -> List[np.ndarray]:
+    # Daily Values for several (Element, Span) Targets, Parsing the Station File only Once
+    records = read_records(raw)
+    return [record_values(records, element, span) for element, span in targets]
+
+
+def record_values(records: np.ndarray, element: str, span: Tuple[int, int], out: np.ndarray = None) -> np.ndarray:
+    if out is None:
+        out = np.full(span_days(span), NA, np.int16)
+
+    records = records[records["ELEMENT"] == element.encode()]
+
+    year = parse_header(records, "YEAR")
+    records = records[(span[0] <= year) & (year <= span[1])]
+
+    if not len(records):
+        return out
+
+    # Day Offset of every Record's Month relative to the Start of Span, and the Length of that Month
+    months = (parse_header(records, "YEAR") - 1970) * 12 + parse_header(records, "MONTH") - 1
+    month_start = months.astype("datetime64[M]").astype("datetime64[D]")
+    month_length = ((months + 1).astype("datetime64[M]").astype("datetime64[D]") - month_start).astype(int)
+    offset = (month_start - np.datetime64(f"{span[0]:04d}-01-01")).astype(int)
+
+    # Scatter Values of Valid Days (i.e. Skipping February 30th etc.) into Output
+    day = np.arange(DAYS)[None, :]
+    valid = day < month_length[:, None]
+
+    values = parse_int(records["DAYS"][..., :5])
+    out[(offset[:, None] + day)[valid]] = values[valid]
+
+    return out
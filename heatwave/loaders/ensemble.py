@@ -0,0 +1,286 @@
+from heatwave.loaders.era import ERA
+from heatwave.climatology import Climatology
+from heatwave import instrumentation
+
+import netCDF4
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import product
+from typing import List, Tuple, Optional, Iterable, Iterator, Sequence
+
+import ctypes
+import ctypes.util
+import threading
+import os
+
+
+_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def hdf5_thread_safe() -> bool:
+    """
+    Whether the HDF5 Library Loaded by netCDF4 was Built Thread-Safe, as Reported by H5is_library_threadsafe
+
+    The Library is Looked up among the Mapped Libraries of this Process (Linux), or by Name otherwise. False if it
+    can't be Found or Queried, such that Reads are only Concurrent in Threads when HDF5 says they may be.
+    """
+
+    paths = []
+    if os.path.exists('/proc/self/maps'):
+        with open('/proc/self/maps') as maps:
+            paths = sorted({line.split()[-1] for line in maps
+                            if os.path.basename(line.split()[-1]).startswith('libhdf5') and '_hl' not in line})
+    if not paths and ctypes.util.find_library('hdf5'):
+        paths = [ctypes.util.find_library('hdf5')]
+
+    for path in paths:
+        try:
+            flag = ctypes.c_bool()
+            if ctypes.CDLL(path).H5is_library_threadsafe(ctypes.byref(flag)) >= 0:
+                return flag.value
+        except (OSError, AttributeError):
+            continue
+    return False
+
+
+class Ensemble:
+    """
+    Ensemble of ERA-like Files (e.g. EC-Earth Runs), one File per (start, member, year)
+
+    Files are found by formatting template with (start, member, year), e.g.
+    'tas_d_s{0:02d}/tas_d_ECEarth_PD_s{0:02d}r{1:02d}_{2:04d}.nc'. Every (start, member) Pair is one Ensemble Member,
+    whose Years are Concatenated along Time, such that the Ensemble behaves as a [member, time, lat, lon] Array.
+    Files are Read Concurrently by a bounded Pool of max_workers: Threads (executor='thread', netCDF Reads release
+    the GIL, but are Serialized unless HDF5 was built Thread-Safe, see thread_safe()) or Processes
+    (executor='process'). By default Threads are used if HDF5 is Thread-Safe, and Processes otherwise.
+    """
+
+    THREAD_SAFE: Optional[bool] = None  # Whether the netCDF/HDF5 Libraries allow Concurrent Reads from several
+                                        # Threads, None Detects it (see hdf5_thread_safe)
+
+    def __init__(self, template: str, target: str, starts: Iterable[int], members: Iterable[int],
+                 years: Iterable[int], index: List[slice] = (), root: str = "", max_workers: int = 4,
+                 executor: Optional[str] = None, **kwargs):
+
+        executor = executor if executor is not None else 'thread' if Ensemble.thread_safe() else 'process'
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"executor should be either 'thread' or 'process', not '{executor}'")
+
+        self._template = template
+        self._target = target
+        self._root = root
+        self._index = index
+        self._kwargs = kwargs
+        self._max_workers = max_workers
+        self._executor = executor
+
+        self._members = list(product(starts, members))
+        self._years = list(years)
+
+        # Grid and Time Axis are taken from the First Member
+        first = [self.open(0, year) for year in range(len(self._years))]
+
+        self._latitude = first[0].latitude
+        self._longitude = first[0].longitude
+        self._year_length = len(first[0].time)
+        self._time = pd.DataFrame(data=np.arange(self._year_length * len(self._years)),
+                                  index=np.concatenate([era.time.index for era in first]))
+
+        for era in first:
+            era.close()
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return len(self._members), len(self._time), len(self._latitude), len(self._longitude)
+
+    @property
+    def members(self) -> List[Tuple[int, int]]:
+        return self._members
+
+    @property
+    def years(self) -> List[int]:
+        return self._years
+
+    @property
+    def latitude(self) -> np.ndarray:
+        return self._latitude
+
+    @property
+    def longitude(self) -> np.ndarray:
+        return self._longitude
+
+    @property
+    def time(self) -> pd.DataFrame:
+        return self._time
+
+    @property
+    def view(self) -> 'EnsembleView':
+        return EnsembleView(self)
+
+    def path(self, member: int, year: int) -> str:
+        start, run = self._members[member]
+        return os.path.join(self._root, self._template.format(start, run, self._years[year]))
+
+    def open(self, member: int, year: int) -> ERA:
+        return ERA(self.path(member, year), self._target, self._index, **self._kwargs)
+
+    def read(self, member: int, year: int, block: slice = slice(None)) -> np.ndarray:
+        with self.library_lock():
+            with self.open(member, year) as era:
+                if len(era.time) != self._year_length:
+                    raise ValueError(f"{era.path} has {len(era.time)} time steps, expected {self._year_length}")
+                return era._read(block)
+
+    def library_lock(self):
+        # Serialize netCDF Library Calls between Threads, unless the Library is Thread-Safe
+        return _LOCK if self._executor == 'thread' and not Ensemble.thread_safe() else nullcontext()
+
+    @staticmethod
+    def thread_safe() -> bool:
+        return Ensemble.THREAD_SAFE if Ensemble.THREAD_SAFE is not None else hdf5_thread_safe()
+
+    def pool(self) -> Executor:
+        if self._executor == 'process':
+            return ProcessPoolExecutor(self._max_workers)
+        return ThreadPoolExecutor(self._max_workers)
+
+    def iter_members(self, members: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        # Yield [time, lat, lon] Data per Member, while the Next Members are Read in the Background
+        members = range(len(self._members)) if members is None else members
+
+        with self.pool() as executor:
+            pending = []
+            for member in members:
+                pending.append((member, [executor.submit(self.read, member, year) for year in range(len(self._years))]))
+
+                # Keep at most max_workers Members in Flight
+                if len(pending) > self._max_workers:
+                    member, futures = pending.pop(0)
+                    yield member, np.concatenate([future.result() for future in futures])
+
+            for member, futures in pending:
+                yield member, np.concatenate([future.result() for future in futures])
+
+    def iter_files(self) -> Iterator[Tuple[int, int, np.ndarray]]:
+        # Yield (member, year, [time, lat, lon] Data) for every File in Order, Read Concurrently
+        files = [(member, year) for member in range(len(self._members)) for year in range(len(self._years))]
+
+        with self.pool() as executor:
+            for start in range(0, len(files), self._max_workers):
+                futures = [executor.submit(self.read, *file) for file in files[start:start + self._max_workers]]
+                for (member, year), future in zip(files[start:start + self._max_workers], futures):
+                    yield member, year, future.result()
+
+    def climatology(self, window: Optional[int] = None, harmonics: Optional[int] = None,
+                    leap: str = 'keep') -> Climatology:
+        # Day of Year Climatology Pooled over all Members, Accumulated one File at a Time
+        climatology = Climatology(pd.DatetimeIndex(self._time.index), window, harmonics, leap)
+        for member, year, data in self.iter_files():
+            climatology.update(slice(year * self._year_length, (year + 1) * self._year_length), data)
+        return climatology
+
+    def merge(self, path: str, time_units: str = "days since 2000-01-01 12:00:00", calendar: str = "noleap",
+              latitude_key: str = 'lat', longitude_key: str = 'lon', time_key: str = 'time') -> None:
+        # Write all Members into a single NETCDF4_CLASSIC File, Concatenated along Time, one File Slab at a Time
+        if os.path.exists(path):
+            os.remove(path)
+
+        with netCDF4.Dataset(path, 'w', format='NETCDF4_CLASSIC') as dataset:
+            dataset.createDimension(time_key, None)
+            dataset.createDimension(latitude_key, len(self._latitude))
+            dataset.createDimension(longitude_key, len(self._longitude))
+
+            times = dataset.createVariable(time_key, np.float32, (time_key,))
+            latitudes = dataset.createVariable(latitude_key, np.float32, (latitude_key,))
+            longitudes = dataset.createVariable(longitude_key, np.float32, (longitude_key,))
+            variable = dataset.createVariable(self._target, np.float32, (time_key, latitude_key, longitude_key),
+                                              fill_value=np.float32(np.nan))
+
+            times.units = time_units
+            times.calendar = calendar
+
+            latitudes[:] = self._latitude
+            longitudes[:] = self._longitude
+
+            # Copy Metadata from First File
+            with self.open(0, 0) as era:
+                for name in ('units', 'long_name', 'standard_name'):
+                    if name in era.dataset[self._target].ncattrs():
+                        variable.setncattr(name, era.dataset[self._target].getncattr(name))
+
+            files = len(self._members) * len(self._years)
+            for done, (member, year, data) in enumerate(self.iter_files()):
+                instrumentation.progress("Merging", done + 1, files, self.path(member, year))
+
+                offset = (member * len(self._years) + year) * self._year_length
+                with self.library_lock():
+                    variable[offset:offset + len(data)] = data
+                    times[offset:offset + len(data)] = np.arange(offset, offset + len(data))
+
+            instrumentation.progress("Merging", files, files)
+
+    def __repr__(self):
+        return f"Ensemble({self._target}) {self.shape}"
+
+
+class EnsembleView:
+    """Lazy [member, time, lat, lon] View on an Ensemble, Reading only the Files (and Time Steps) that are Indexed"""
+
+    def __init__(self, ensemble: Ensemble):
+        self._ensemble = ensemble
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return self._ensemble.shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        key = key if isinstance(key, tuple) else (key,)
+        member_key, time_key, rest = key[0], key[1] if len(key) > 1 else slice(None), key[2:]
+
+        members = np.arange(self.shape[0])[member_key]
+        times = np.arange(self.shape[1])[time_key]
+
+        squeeze = (0 if np.isscalar(members) else slice(None), 0 if np.isscalar(times) else slice(None))
+        members, times = np.atleast_1d(members), np.atleast_1d(times)
+
+        year_length = self._ensemble.shape[1] // len(self._ensemble.years)
+        output = np.empty((len(members), len(times)) + self.shape[2:], np.float64)
+
+        # Read the Needed Time Steps of every Needed File Concurrently
+        def read(executor: Executor, member_position: int, year: int) -> Tuple[int, np.ndarray, Future]:
+            positions = np.flatnonzero(times // year_length == year)
+            local = times[positions] % year_length
+
+            # Contiguous Time Steps are Read as a single Hyperslab
+            if np.all(np.diff(local) == 1):
+                local = slice(int(local[0]), int(local[-1]) + 1)
+
+            return member_position, positions, executor.submit(self._ensemble.read, members[member_position],
+                                                               year, local)
+
+        with self._ensemble.pool() as executor:
+            for member_position, positions, future in [read(executor, member_position, year)
+                                                       for member_position in range(len(members))
+                                                       for year in np.unique(times // year_length)]:
+                output[member_position, positions] = future.result()
+
+        return output[squeeze + rest]
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return np.asarray(self[:, :], dtype)
+
+    def __repr__(self):
+        return f"EnsembleView({self._ensemble._target}) {self.shape}"
@@ -1,15 +1,29 @@
+from heatwave.climatology import Climatology
+from heatwave.cache import Cache, CACHE
+from heatwave import instrumentation
+from heatwave.loaders.timeaxis import TimeAxis, axis_from
+
 import netCDF4
 
 import numpy as np
 import pandas as pd
 
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Iterator, Union, Callable
+
+import copy
+
+
+Index = Union[slice, np.ndarray]
 
 
 class ERA:
+    MEMORY_LIMIT = 2 ** 30  # Default Memory Ceiling for Chunked Reads (bytes)
+    SERIES_SUFFIX = '_series'  # Space-Major Copy of the Target in a Rechunked Store (see heatwave.loaders.store)
+
     def __init__(self, path: str, target: str, index: List[slice] = (),
                  latitude_key: str = 'latitude', longitude_key: str = 'longitude',
-                 time_key: str = 'time', time_unit: str = 'h', time_origin: str = '1900-01-01'):
+                 time_key: str = 'time', time_unit: str = 'h', time_origin: str = '1900-01-01',
+                 memory_limit: Optional[int] = None, cache: Optional[Cache] = CACHE):
 
         self._path = path
 
@@ -20,7 +34,11 @@ class ERA:
         self._time_unit = time_unit
         self._time_origin = time_origin
 
+        self._memory_limit = memory_limit if memory_limit is not None else ERA.MEMORY_LIMIT
+        self._cache = cache
+
         self._dataset = netCDF4.Dataset(path)
+        self._owner = True  # Views (see reindex) share the Dataset, which only its Opener Closes
         self._target = target
         self._index = [
             index[0] if len(index) >= 1 and index[0] is not None else slice(0, len(self._dataset[self._time_key])),
@@ -28,10 +46,13 @@ class ERA:
             index[2] if len(index) >= 3 and index[2] is not None else slice(0, len(self._dataset[self._longitude_key]))
         ]
 
-        self._time = self._dataset[self._time_key]
-        self._time = netCDF4.num2date(self._time[self._index[0]], units=self._time.units, calendar=self._time.calendar)
-        self._time = [f"{date.year:04d}-{date.month:02d}-{date.day:02d}" for date in self._time]
-        self._time = pd.DataFrame(data=np.arange(len(self._time)), index=pd.to_datetime(self._time))
+        # Normalize Boolean Masks and Contiguous Integer Arrays to Slices, allowing Hyperslab Reads
+        self._index = [ERA._local_index(key, len(self._dataset[name])) for key, name in zip(
+            self._index, (self._time_key, self._latitude_key, self._longitude_key))]
+
+        # Decode Time Axis (falling back on time_unit and time_origin if the File doesn't Specify Units)
+        self._time_axis = axis_from(self._dataset[self._time_key], self._time_unit, self._time_origin, self._index[0])
+        self._time = pd.DataFrame(data=np.arange(len(self._time_axis)), index=pd.DatetimeIndex(self._time_axis.date))
 
         self._latitude = self._dataset[self._latitude_key][self._index[1]].data
         self._longitude = self._dataset[self._longitude_key][self._index[2]].data
@@ -52,11 +73,13 @@ class ERA:
     @property
     def data(self) -> np.ndarray:
         if self._data is None:
-            self._data = self._dataset[self._target][self._index]
-            self._data[self._data.mask] = np.nan
-            self._data = np.array(self._data)
+            self._data = self._read_blocks(self.iter_chunks())
         return self._data
 
+    @property
+    def view(self) -> 'ERAView':
+        return ERAView(self)
+
     @property
     def dataset(self) -> netCDF4.Dataset:
         return self._dataset
@@ -73,26 +96,342 @@ class ERA:
     def time(self) -> pd.DataFrame:
         return self._time
 
+    @property
+    def time_axis(self) -> TimeAxis:
+        return self._time_axis
+
     @property
     def anomaly(self) -> np.ndarray:
         if self._anomaly is None:
-            self._anomaly = self.data.copy()
-            df = pd.DataFrame(self._anomaly.reshape(len(self.time), -1), index=self.time.index)
-            df = df.groupby([df.index.month, df.index.day]).apply(lambda x: x - x.mean())
-            self._anomaly[:] = df.values.reshape(self._anomaly.shape)
+            self._anomaly = self._cached(lambda: self._read_blocks(self.iter_anomaly(), np.float64),
+                                         product='anomaly')
         return self._anomaly
 
-    def reindex(self, index: List[slice] = ()):
-        new_index = []
-        for old, new in zip(self._index, index):
-            if isinstance(old, slice) and isinstance(new, slice):
-                new_index.append(slice(old.start + new.start, old.start + new.stop))
+    @property
+    def memory_limit(self) -> int:
+        return self._memory_limit
+
+    @property
+    def cache(self) -> Optional[Cache]:
+        return self._cache
+
+    @property
+    def dtype(self) -> np.dtype:
+        # dtype of Read Values: Packed Variables take the dtype of their Scale (as netCDF4 Unpacks them), and Integers
+        # that may be Masked (Fill Value, Missing Value or Valid Range) become float64, as Masked Values are NaN
+        variable = self._dataset[self._target]
+        attributes = variable.ncattrs()
+
+        dtype = np.result_type(variable.dtype, *(np.asarray(variable.getncattr(name)).dtype
+                                                 for name in ('scale_factor', 'add_offset') if name in attributes))
+        if dtype.kind != 'f' and any(name in attributes for name in
+                                     ('_FillValue', 'missing_value', 'valid_min', 'valid_max', 'valid_range')):
+            dtype = np.dtype(np.float64)
+        return dtype
+
+    @property
+    def chunking(self) -> Optional[List[int]]:
+        chunking = self._dataset[self._target].chunking()
+        return None if chunking == 'contiguous' else chunking
+
+    def time_block(self, memory_limit: Optional[int] = None) -> int:
+        # Number of Time Steps that fit within the Memory Ceiling (as float64)
+        memory_limit = memory_limit if memory_limit is not None else self._memory_limit
+        steps = max(1, memory_limit // max(1, self.shape[1] * self.shape[2] * np.dtype(np.float64).itemsize))
+
+        # Round down to a multiple of the File's Native Time Chunk (if that fits)
+        native = self.chunking[0] if self.chunking else 1
+        return (steps // native) * native if steps >= native else steps
+
+    def iter_chunks(self, time_block: Optional[int] = None,
+                    memory_limit: Optional[int] = None) -> Iterator[Tuple[slice, np.ndarray]]:
+        # Serve from Memory if Data was Loaded Already
+        if self._data is not None:
+            for block in self._time_blocks(time_block or self.time_block(memory_limit)):
+                yield block, self._data[block]
+            return
+
+        for block in self._time_blocks(time_block or self.time_block(memory_limit)):
+            yield block, self._read(block)
+
+    def iter_anomaly(self, time_block: Optional[int] = None, memory_limit: Optional[int] = None,
+                     climatology: Optional[Climatology] = None) -> Iterator[Tuple[slice, np.ndarray]]:
+        # Serve from Memory if Anomaly was Computed Already
+        if self._anomaly is not None and climatology is None:
+            for block in self._time_blocks(time_block or self.time_block(memory_limit)):
+                yield block, self._anomaly[block]
+            return
+
+        # First Pass: Fit Climatology, Second Pass: Subtract it
+        climatology = climatology or self.climatology(time_block=time_block, memory_limit=memory_limit)
+        yield from climatology.anomaly_chunks(self.iter_chunks(time_block, memory_limit))
+
+    def climatology(self, window: Optional[int] = None, harmonics: Optional[int] = None, leap: str = 'keep',
+                    time_block: Optional[int] = None, memory_limit: Optional[int] = None) -> Climatology:
+        def fit() -> np.ndarray:
+            with instrumentation.timer('era.climatology'):
+                climatology = Climatology(self.time_axis, window, harmonics, leap)
+                return climatology.fit_chunks(self.iter_chunks(time_block, memory_limit)).mean
+
+        mean = self._cached(fit, product='climatology', window=window, harmonics=harmonics, leap=leap)
+        return Climatology(self.time_axis, window, harmonics, leap, mean=mean)
+
+    def reindex(self, index: List[Optional[Index]] = ()) -> 'ERA':
+        # View on a Subset of this ERA, Indexed relative to it (None keeps an Axis as is), sharing the Open Dataset,
+        # Decoded Time Axis and any Loaded Arrays (as Numpy Views, where Slicing allows). Closing a View leaves the
+        # Dataset Open, it stays Open until the ERA that Opened it is Closed
+        index = [index[axis] if axis < len(index) else None for axis in range(3)]
+        local = [ERA._local_index(key, length) for key, length in zip(index, self.shape)]
+
+        era = copy.copy(self)
+        era._owner = False
+        era._index = [ERA._compose(old, new, length) for old, new, length in zip(
+            self._index, local, (len(self._dataset[key]) for key in (self._time_key, self._latitude_key,
+                                                                      self._longitude_key)))]
+
+        era._time_axis = self._time_axis[local[0]]
+        era._time = self._time.iloc[local[0]]
+        era._time = pd.DataFrame(data=np.arange(len(era._time)), index=era._time.index)
+
+        era._latitude = self._latitude[local[1]]
+        era._longitude = self._longitude[local[2]]
+
+        era._shape = len(era._time), len(era._latitude), len(era._longitude)
+
+        era._data = ERA._subset(self._data, local)
+
+        # Anomalies are relative to the Climatology of the Time Axis, so only Spatial Subsets can share them
+        era._anomaly = ERA._subset(self._anomaly, local) if index[0] is None else None
+
+        return era
+
+    def select(self, latitude: Optional[Tuple[float, float]] = None, longitude: Optional[Tuple[float, float]] = None,
+               time: Optional[Tuple[str, str]] = None) -> 'ERA':
+        # View on a Coordinate Box, Longitude Bounds may use either the -180/180 or 0/360 Convention
+        index = [None, None, None]
+
+        if time is not None:
+            index[0] = (self.time.index >= pd.Timestamp(time[0])) & (self.time.index <= pd.Timestamp(time[1]))
+
+        if latitude is not None:
+            index[1] = (self.latitude >= latitude[0]) & (self.latitude <= latitude[1])
+
+        if longitude is not None:
+            longitude_min, longitude_max = np.mod(longitude, 360)
+            longitudes = np.mod(self.longitude, 360)
+            if longitude_min <= longitude_max:
+                index[2] = (longitudes >= longitude_min) & (longitudes <= longitude_max)
             else:
-                new_index.append(new)
+                index[2] = (longitudes >= longitude_min) | (longitudes <= longitude_max)
+
+        return self.reindex(index)
+
+    def window(self, start: str = '06-24', end: str = '08-22', leap_shift: bool = True,
+               before: int = 0, after: int = 0) -> 'ERA':
+        # View on a Fixed Day of Year Window of every Year, Read as one Hyperslab per Year
+        return self.reindex([self.time_axis.window(start, end, leap_shift, before, after)])
+
+    def summer(self, before: int = 0, after: int = 0) -> 'ERA':
+        # 60 Hottest Days of Summer (24 June - 22 August, one Day earlier on Leap Years)
+        return self.window('06-24', '08-22', True, before, after)
+
+    @staticmethod
+    def _local_index(key: Optional[Index], length: int) -> Index:
+        # Normalize Key to a Slice (where possible) or Integer Array along an Axis of the given Length
+        if key is None:
+            return slice(0, length)
+
+        if isinstance(key, slice):
+            steps = range(length)[key]
+            return slice(steps.start, steps.stop, steps.step) if steps.step > 0 else np.asarray(steps)
+
+        key = np.asarray(key)
+        key = np.flatnonzero(key) if key.dtype == bool else np.arange(length)[key]
 
-        return ERA(self._path, self._target, new_index,
-                   self._latitude_key, self._longitude_key,
-                   self._time_key, self._time_unit, self._time_origin)
+        # Contiguous Integer Arrays are Slices, allowing Hyperslab Reads and Numpy Views
+        if len(key) and np.all(np.diff(key) == 1):
+            return slice(int(key[0]), int(key[-1]) + 1)
+
+        return key
+
+    @staticmethod
+    def _compose(old: Index, new: Index, length: int) -> Index:
+        # Map a Key relative to an existing Index onto the File's Axis
+        if isinstance(old, slice) and isinstance(new, slice):
+            steps = range(*old.indices(length))[new]
+            return slice(steps.start, steps.stop, steps.step)
+        if isinstance(old, slice):
+            return np.arange(*old.indices(length))[new]
+        return np.asarray(old)[new]
+
+    @staticmethod
+    def _subset(array: Optional[np.ndarray], local: List[Index]) -> Optional[np.ndarray]:
+        # Index one Axis at a Time, such that Slices remain Views
+        if array is None:
+            return None
+        for axis, key in enumerate(local):
+            array = array[(slice(None),) * axis + (key,)]
+        return array
+
+    def close(self) -> None:
+        if self._owner:
+            self._dataset.close()
+
+    def __enter__(self) -> 'ERA':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _cached(self, compute: Callable[[], np.ndarray], **params) -> np.ndarray:
+        # Compute Derived Product, going through the Cache if one was Configured
+        if self._cache is None:
+            return compute()
+        return self._cache.get(self._path, compute, target=self._target, index=self._index, **params)
+
+    def _time_blocks(self, time_block: int) -> Iterator[slice]:
+        start = 0
+
+        # Align the first Block with the File's Native Time Chunk Boundaries
+        time_index = self._index[0]
+        if self.chunking and isinstance(time_index, slice) and time_index.step in (None, 1):
+            native = self.chunking[0]
+            offset = (time_index.start or 0) % native
+            if offset and time_block >= native:
+                start = min(time_block - offset, len(self.time))
+                yield slice(0, start)
+
+        for start in range(start, len(self.time), time_block):
+            yield slice(start, min(start + time_block, len(self.time)))
+
+    def _read(self, block: Index) -> np.ndarray:
+        with instrumentation.timer('era.read'):
+            data = self._read_steps(block)
+        instrumentation.count('era.bytes_read', data.nbytes)
+        return data
+
+    def _read_steps(self, block: Index) -> np.ndarray:
+        # Map Local Time Steps onto the File's Time Axis
+        time_index = self._index[0]
+
+        if isinstance(time_index, slice) and isinstance(block, slice):
+            steps = range(*time_index.indices(len(self._dataset[self._time_key])))[block]
+            time_index = slice(steps.start, steps.stop, steps.step)
+        elif isinstance(time_index, slice):
+            time_index = np.arange(*time_index.indices(len(self._dataset[self._time_key])))[block]
+        else:
+            time_index = np.asarray(time_index)[block]
+
+        variable = self._variable(time_index)
+
+        # Coalesce Increasing Runs of Time Steps into Hyperslab Reads, rather than (slow) Point-Wise Reads
+        if isinstance(time_index, np.ndarray) and len(time_index) > 1:
+            bounds = np.r_[0, np.flatnonzero(np.diff(time_index) != 1) + 1, len(time_index)]
+            if len(bounds) - 1 < len(time_index):
+                return np.concatenate([
+                    self._fill(variable[(slice(time_index[start], time_index[stop - 1] + 1),
+                                         self._index[1], self._index[2])])
+                    for start, stop in zip(bounds[:-1], bounds[1:])])
+
+        return self._fill(variable[(time_index, self._index[1], self._index[2])])
+
+    def _variable(self, time_index: Index) -> netCDF4.Variable:
+        # Stores may hold the Target in several Chunk Layouts: Read from the one touching the fewest Chunks
+        variables = [self._dataset[self._target]]
+        if self._target + ERA.SERIES_SUFFIX in self._dataset.variables:
+            variables.append(self._dataset[self._target + ERA.SERIES_SUFFIX])
+
+        if len(variables) == 1:
+            return variables[0]
+
+        lengths = [len(self._dataset[key]) for key in (self._time_key, self._latitude_key, self._longitude_key)]
+        bounds = []
+        for key, length in zip((time_index, self._index[1], self._index[2]), lengths):
+            if isinstance(key, slice):
+                steps = range(*key.indices(length))
+                bounds.append((min(steps[0], steps[-1]), max(steps[0], steps[-1])) if len(steps) else (0, 0))
+            else:
+                key = np.atleast_1d(key)
+                bounds.append((int(key.min()), int(key.max())) if len(key) else (0, 0))
+
+        def chunks(variable: netCDF4.Variable) -> int:
+            chunking = variable.chunking()
+            if chunking == 'contiguous':
+                return 1
+            return int(np.prod([last // size - first // size + 1 for (first, last), size in zip(bounds, chunking)]))
+
+        return min(variables, key=chunks)
+
+    @staticmethod
+    def _fill(data: np.ndarray) -> np.ndarray:
+        # Replace Masked Values with NaN, without Copying the Underlying Data
+        if not isinstance(data, np.ma.MaskedArray):
+            return np.asarray(data)
+
+        mask = np.ma.getmask(data)
+        data = data.data
+
+        if mask is not np.ma.nomask and mask.any():
+            if data.dtype.kind != 'f':
+                data = data.astype(np.float64)
+            data[mask] = np.nan
+
+        return data
+
+    def _read_blocks(self, blocks: Iterator[Tuple[slice, np.ndarray]], dtype: Optional[np.dtype] = None) -> np.ndarray:
+        # Gather Blocks into a single Preallocated Array of dtype (default: Read Values, see dtype), Promoted rather
+        # than Cast if a Block still needs a wider dtype (e.g. Integers Masked by the Library's Default Fill Value)
+        output = np.empty(self.shape, dtype if dtype is not None else self.dtype)
+        for block, data in blocks:
+            if np.result_type(output, data) != output.dtype:
+                output = output.astype(np.result_type(output, data))
+            output[block] = data
+        return output
 
     def __repr__(self):
         return f"ERA({self._target}) {self.shape}"
+
+
+class ERAView:
+    """Lazy Array-Like View on an ERA Dataset, reading only the Time Steps that are Indexed"""
+
+    def __init__(self, era: ERA):
+        self._era = era
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self._era.shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        key = key if isinstance(key, tuple) else (key,)
+        time_key, rest = key[0], key[1:]
+
+        # Single Time Step
+        if isinstance(time_key, (int, np.integer)):
+            time_key = int(time_key) % len(self)
+            return self._era._read(slice(time_key, time_key + 1))[(0,) + rest]
+
+        # Contiguous Time Steps can be read as a single Hyperslab
+        if isinstance(time_key, slice):
+            steps = range(len(self))[time_key]
+            if steps.step == 1:
+                return self._era._read(slice(steps.start, steps.stop))[(slice(None),) + rest]
+
+        return self._era._read(np.arange(len(self))[time_key])[(slice(None),) + rest]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for _, data in self._era.iter_chunks():
+            yield from data
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return np.asarray(self._era.data, dtype)
+
+    def __repr__(self):
+        return f"ERAView({self._era._target}) {self.shape}"
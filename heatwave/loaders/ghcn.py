@@ -1,13 +1,21 @@
 from heatwave.enums import Country
+from heatwave.cache import Cache, CACHE
+from heatwave import instrumentation
+from heatwave.loaders import dly
+from heatwave.loaders.spatial import StationIndex
+from heatwave.loaders.stations import quality_control
 
+import numpy as np
 import pandas as pd
 
 from datetime import timedelta, date
-from collections import OrderedDict
-from typing import Tuple, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+from typing import Tuple, Optional, Iterable, Iterator, Dict, List, Union
 from enum import Enum, auto
 
 import tarfile
+import gzip
 import os
 
 
@@ -30,9 +38,16 @@ class GHCN:
 
     STATION_EXT = ".dly"
 
-    NA = -9999
+    SEEKABLE_PATH = os.path.join(ROOT, f'{SOURCE_NAME}-seekable.gz')
+    INDEX_PATH = os.path.join(ROOT, f'{SOURCE_NAME}-index.npz')
 
-    def __init__(self, element: GHCNElement, country: Optional[Country]=None, span: Tuple[int, int]=(1979, 2017)):
+    NA = dly.NA
+
+    _INVENTORY = None
+    _INDEX = None
+
+    def __init__(self, element: GHCNElement, country: Optional[Country]=None, span: Tuple[int, int]=(1979, 2017),
+                 cache: Optional[Cache]=CACHE):
 
         if not os.path.exists(GHCN.SOURCE_PATH):
             raise FileNotFoundError(f"Couldn't find {GHCN.SOURCE_PATH},\n"
@@ -45,12 +60,26 @@ class GHCN:
         self._element = element.name
         self._country = country.name if country else ""
         self._span = span
+        self._cache = cache
 
         self._inventory = None
+        self._stations = None
+
+    @staticmethod
+    def set_root(root: str) -> None:
+        # Point all GHCN Paths at another Data Directory (e.g. an External Drive or Synthetic Data)
+        GHCN.ROOT = os.path.abspath(root)
+        GHCN.INVENTORY_PATH = os.path.join(GHCN.ROOT, 'ghcnd-inventory.txt')
+        GHCN.SOURCE_PATH = os.path.join(GHCN.ROOT, f'{GHCN.SOURCE_NAME}{GHCN.SOURCE_EXT}')
+        GHCN.SEEKABLE_PATH = os.path.join(GHCN.ROOT, f'{GHCN.SOURCE_NAME}-seekable.gz')
+        GHCN.INDEX_PATH = os.path.join(GHCN.ROOT, f'{GHCN.SOURCE_NAME}-index.npz')
+
+        GHCN._INVENTORY = None
+        GHCN._INDEX = None
 
     @property
     def file(self) -> str:
-        return os.path.join(self.ROOT, f"ghcnd-{self.country}-{self.element}-{self.span[0]:4d}-{self.span[1]:4d}.csv")
+        return os.path.join(self.ROOT, f"ghcnd-{self.country}-{self.element}-{self.span[0]:4d}-{self.span[1]:4d}.npz")
 
     @property
     def element(self) -> str:
@@ -67,19 +96,11 @@ class GHCN:
     @property
     def inventory(self):
         if self._inventory is None:
-            # Load Inventory CSV as Pandas DataFrame
-            inventory = pd.read_csv(
-                GHCN.INVENTORY_PATH,
-                sep="\s+",
-                header=None,
-                names=["ID", "LAT", "LON", "ELEMENT", "FIRSTYEAR", "LASTYEAR"],
-                dtype={"ID": str, "LAT": float, "LON": float, "ELEMENT": str, "FIRSTYEAR": int, "LASTYEAR": int})
-
-            # Add Country to DataFrame
-            inventory["COUNTRY"] = [id[:2] for id in inventory["ID"]]
+            inventory = GHCN.read_inventory(self._cache)
 
             # Filter Inventory
-            inventory = inventory[inventory["COUNTRY"] == self.country]     # Filter by Country
+            if self.country:
+                inventory = inventory[inventory["COUNTRY"] == self.country]  # Filter by Country
             inventory = inventory[inventory["ELEMENT"] == self.element]     # Filter by Element
             inventory = inventory[inventory["FIRSTYEAR"] <= self.span[0]]   # Filter by First Year
             inventory = inventory[inventory["LASTYEAR"] >= self.span[1]]    # Filter by Last Year
@@ -90,67 +111,237 @@ class GHCN:
 
         return self._inventory
 
-    def extract(self) -> None:
-        # Create Set of ID's to Extract
-        inventory_ids = set(self.inventory.index)
-        station_data = OrderedDict()
+    @staticmethod
+    def read_inventory(cache: Optional[Cache]=CACHE) -> pd.DataFrame:
+        # Full Inventory is Shared by all GHCN Instances, Parsed through cache (if any) on First Use
+        if GHCN._INVENTORY is None:
 
-        index = 0
+            # Parse Fixed Width Inventory, Cached as Binary Structured Array
+            def parse() -> np.ndarray:
+                with open(GHCN.INVENTORY_PATH, 'rb') as file:
+                    return dly.read_inventory(file.read())
 
-        # Extract Data from Station Files
-        with tarfile.open(GHCN.SOURCE_PATH) as source:
+            inventory = cache.get(GHCN.INVENTORY_PATH, parse, product="inventory") if cache is not None else parse()
+            inventory = pd.DataFrame({name: inventory[name] for name in inventory.dtype.names})
+
+            # Add Country to DataFrame
+            inventory["COUNTRY"] = inventory["ID"].str[:2]
+
+            GHCN._INVENTORY = inventory
+
+        return GHCN._INVENTORY
+
+    @property
+    def stations(self) -> StationIndex:
+        if self._stations is None:
+            self._stations = StationIndex(np.array(self.inventory.index, dtype=str), self.inventory["LAT"].values,
+                                          self.inventory["LON"].values)
+        return self._stations
+
+    def extract(self, processes: int = 1) -> None:
+        GHCN.extract_all([self], processes)
+
+    @staticmethod
+    def extract_all(requests: Iterable[Union['GHCN', Tuple[GHCNElement, Optional[Country], Tuple[int, int]]]],
+                    processes: int = 1) -> List['GHCN']:
+        # Accept both GHCN Instances and (element, country, span) Tuples
+        requests = [request if isinstance(request, GHCN) else GHCN(*request) for request in requests]
+
+        # Route every Station ID to each (Request, Column) it is Extracted into
+        routes = {}
+        for request_index, request in enumerate(requests):
+            for column, station_id in enumerate(request.inventory.index):
+                routes.setdefault(station_id, []).append((request_index, column))
+
+        # Preallocate [days, stations] Output per Request
+        values = [np.full((dly.span_days(request.span), len(request.inventory)), GHCN.NA, np.int16)
+                  for request in requests]
+        found = [np.zeros(len(request.inventory), bool) for request in requests]
+
+        def store(station_routes, station_values) -> None:
+            for (request_index, column), station_value in zip(station_routes, station_values):
+                values[request_index][:, column] = station_value
+                found[request_index][column] = True
+
+        # Parse Station Files in a Process Pool, while this Process Streams the Archive. The Pool is Shut Down on
+        # Leaving the Block, also if Streaming or Parsing Fails
+        pending = {}
+
+        def collect(block: bool) -> None:
+            for future in [future for future in pending if block or future.done()]:
+                store(pending.pop(future), future.result())
+
+        with ProcessPoolExecutor(processes) if processes > 1 else nullcontext() as executor:
+            # Extract Data from Station Files, Reading the Archive Once for all Requests
+            for index, (station_id, raw) in enumerate(GHCN.iter_stations(routes)):
+                instrumentation.progress("Extracting", index + 1, len(routes), station_id)
+
+                targets = [(requests[request_index].element, requests[request_index].span)
+                           for request_index, _ in routes[station_id]]
+
+                if executor is None:
+                    store(routes[station_id], dly.station_targets(raw, targets))
+                else:
+                    pending[executor.submit(dly.station_targets, raw, targets)] = routes[station_id]
+
+                    # Bound the Number of Station Files held in Memory
+                    if len(pending) >= 4 * processes:
+                        collect(block=False)
+                        if len(pending) >= 4 * processes:
+                            wait(pending, return_when=FIRST_COMPLETED)
+                            collect(block=False)
+
+            collect(block=True)
+
+        instrumentation.progress("Extracting", len(routes), len(routes))
+
+        # Write Columnar Output with Station Metadata
+        for request, request_values, request_found in zip(requests, values, found):
+            GHCN.save(request.file, request_values[:, request_found],
+                      request.inventory.iloc[np.flatnonzero(request_found)], request.span)
+
+        return requests
+
+    @staticmethod
+    def save(path: str, values: np.ndarray, inventory: pd.DataFrame, span: Tuple[int, int]) -> None:
+        with open(path, 'wb') as output:
+            np.savez(output,
+                     values=values,
+                     stations=np.array(inventory.index, dtype=str),
+                     latitude=inventory["LAT"].values.astype(np.float32),
+                     longitude=inventory["LON"].values.astype(np.float32),
+                     start=np.datetime64(f"{span[0]:04d}-01-01"))
+
+    def fetch(self, station_ids: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        # Read a Subset of Stations from the Inventory directly, without Writing an Extract
+        inventory = self.inventory if station_ids is None else self.inventory.loc[list(station_ids)]
+        column = {station_id: index for index, station_id in enumerate(inventory.index)}
+
+        values = np.full((dly.span_days(self.span), len(inventory)), GHCN.NA, np.int16)
+        for station_id, raw in GHCN.iter_stations(column):
+            dly.station_values(raw, self.element, self.span, values[:, column[station_id]])
+
+        return {"values": values,
+                "stations": np.array(inventory.index, dtype=str),
+                "latitude": inventory["LAT"].values.astype(np.float32),
+                "longitude": inventory["LON"].values.astype(np.float32),
+                "start": np.datetime64(f"{self.span[0]:04d}-01-01")}
+
+    @staticmethod
+    def iter_stations(station_ids: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        station_ids = set(station_ids)
+        index = GHCN.read_index()
+
+        # Seek directly to the Requested Stations if the Archive was Indexed
+        if index is not None:
+            selection = np.flatnonzero(np.isin(index["stations"], list(station_ids)))
+            selection = selection[np.argsort(index["offsets"][selection])]
+
+            with open(GHCN.SEEKABLE_PATH, 'rb') as source:
+                for station in selection:
+                    source.seek(index["offsets"][station])
+                    raw = gzip.decompress(source.read(index["lengths"][station]))
+                    instrumentation.count('ghcn.bytes_read', len(raw))
+                    yield str(index["stations"][station]), raw
+            return
+
+        # Otherwise Stream the whole Archive
+        with tarfile.open(GHCN.SOURCE_PATH, mode='r|*') as source:
 
             # Loop through each Station File
             for station in source:
 
                 # Parse Station ID from Station (File) Name
-                station_id = station.name.replace(f"{self.SOURCE_NAME}/", "").replace(self.STATION_EXT, "")
+                station_id = station.name.replace(f"{GHCN.SOURCE_NAME}/", "").replace(GHCN.STATION_EXT, "")
 
-                # If Station ID is in Inventory -> Extract
-                if station_id in inventory_ids:
-                    print(f"\rExtracting {index + 1:5d}/{len(inventory_ids):5d} : {station_id}", end="")
+                if station_id in station_ids:
+                    raw = source.extractfile(station).read()
+                    instrumentation.count('ghcn.bytes_read', len(raw))
+                    yield station_id, raw
 
-                    # Initialize Station Data Dictionary
-                    station_data[station_id] = {}
+    @staticmethod
+    def build_index() -> None:
+        # Recompress every Station File as an Independent Gzip Member, Recording its Offset and Length,
+        # such that any Station can be Read by a single Seek (the Result is still a valid .gz File)
+        stations, offsets, lengths = [], [], []
 
-                    # Loop Through Every Entry in Station File
-                    for line in source.extractfile(station).read().decode().split('\n'):
-                        if line:  # If Entry is Not Blank
+        with tarfile.open(GHCN.SOURCE_PATH, mode='r|*') as source, open(GHCN.SEEKABLE_PATH + '.tmp', 'wb') as output:
+            for station in source:
+                if not station.isfile():
+                    continue
 
-                            # Parse Header and Data
-                            header, data = line[:21], line[21:]
-                            name, year, month, var = header[:11], int(header[11:15]), int(header[15:17]), header[17:21]
+                instrumentation.progress("Indexing", len(stations) + 1, None, station.name)
 
-                            # If Entry is about target Variable and within target Year -> Extract
-                            if self.span[0] <= year <= self.span[1] and self.element == var:
-                                for day, value in enumerate([int(data[i:i+5]) for i in range(0, len(data), 8)], 1):
-                                    station_data[station_id][f"{year:4d}-{month:02d}-{day:02d}"] = value
+                member = gzip.compress(source.extractfile(station).read())
 
-                    index += 1
+                stations.append(station.name.replace(f"{GHCN.SOURCE_NAME}/", "").replace(GHCN.STATION_EXT, ""))
+                offsets.append(output.tell())
+                lengths.append(len(member))
 
-        print()
+                output.write(member)
 
-        # Write CSV from Acquired Data
-        with open(self.file, 'w') as output:
-            station_ids = station_data.keys()
-            output.write("DATE,{}\n".format(",".join(station_ids)))
+        instrumentation.progress("Indexing", len(stations), len(stations))
 
-            for day in self.daterange(date(self.span[0], 1, 1), date(self.span[1]+1, 1, 1)):
-                day_string = day.strftime("%Y-%m-%d")
-                values = [str(station_data[station_id].get(day_string, GHCN.NA)) for station_id in station_ids]
-                output.write("{},{}\n".format(day_string, ", ".join(values)))
+        os.replace(GHCN.SEEKABLE_PATH + '.tmp', GHCN.SEEKABLE_PATH)
 
-                print(f"\rWriting CSV -> {day_string}", end="")
+        # Store Index alongside the Source's Size and Modification Time, to Detect Stale Indices
+        stat = os.stat(GHCN.SOURCE_PATH)
+        with open(GHCN.INDEX_PATH, 'wb') as output:
+            np.savez(output,
+                     stations=np.array(stations, dtype=str),
+                     offsets=np.array(offsets, np.int64),
+                     lengths=np.array(lengths, np.int64),
+                     source=np.array([stat.st_size, stat.st_mtime_ns], np.int64))
 
-        print()
+        GHCN._INDEX = None
 
-    def load(self) -> pd.DataFrame:
+    @staticmethod
+    def read_index() -> Optional[Dict[str, np.ndarray]]:
+        if GHCN._INDEX is None:
+            if not os.path.exists(GHCN.INDEX_PATH) or not os.path.exists(GHCN.SEEKABLE_PATH):
+                return None
+
+            with np.load(GHCN.INDEX_PATH) as index:
+                index = dict(index)
+
+            # Ignore Index if Source Archive Changed since Indexing
+            stat = os.stat(GHCN.SOURCE_PATH)
+            if tuple(index["source"]) != (stat.st_size, stat.st_mtime_ns):
+                return None
+
+            GHCN._INDEX = index
+
+        return GHCN._INDEX
+
+    def load_arrays(self) -> Dict[str, np.ndarray]:
         # Extract Data if not yet available
         if not os.path.exists(self.file):
             self.extract()
 
+        # NPZ Members are Read on Access: Station Metadata always, Values only on Cache Misses, such that Warm Starts
+        # Memory-Map the Cached Values without Decompressing the Extract
+        with np.load(self.file) as extract:
+            arrays = {name: extract[name] for name in extract.files if name != "values"}
+
+            if self._cache is not None:
+                arrays["values"] = self._cache.get(self.file, lambda: extract["values"], product="values")
+            else:
+                arrays["values"] = extract["values"]
+
+        return arrays
+
+    def load_qc(self, **kwargs) -> Dict[str, np.ndarray]:
+        # Station Arrays passing Quality Control, see stations.quality_control for Arguments
+        return quality_control(self.load_arrays(), self.element, **kwargs)
+
+    def load(self) -> pd.DataFrame:
+        arrays = self.load_arrays()
+
         # Return Dataframe
-        return pd.read_csv(self.file)
+        dates = [day.strftime("%Y-%m-%d") for day in self.daterange(date(self.span[0], 1, 1),
+                                                                     date(self.span[1] + 1, 1, 1))]
+        return pd.concat([pd.DataFrame({"DATE": dates}), pd.DataFrame(arrays["values"], columns=arrays["stations"])],
+                         axis=1)
 
     def daterange(self, start_date, end_date) -> Iterable[date]:
         for n in range(int((end_date - start_date).days)):
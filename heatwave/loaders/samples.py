@@ -0,0 +1,175 @@
+from heatwave.loaders.era import ERA
+
+import numpy as np
+import pandas as pd
+
+from typing import Iterable, Iterator, Optional, Tuple
+
+import threading
+import queue
+
+
+class Samples:
+    """
+    Batches of (Predictor, Target) Training Samples, e.g. for the CNN Notebooks, as plain Numpy Arrays
+
+    Every Sample pairs a target Date with the predictor Anomaly lag Days earlier, averaged over the preceding window
+    Days (like anomaly.rolling(window).mean().loc[date - lag]), for every (lag, window) Combination:
+
+        X: [batch, lat, lon, len(lags) * len(windows)] float32, Channels ordered by Lag, then Window
+        y: [batch] Target Values
+
+    Rolling Means are Differences of a (Cached) Cumulative Sum of the Anomaly, so no Per-Window Cubes are built.
+    Batches are Prepared by a Background Thread, prefetch Batches ahead of the Consumer.
+    """
+
+    def __init__(self, predictor: ERA, target: pd.Series, lags: Iterable[int] = (50,),
+                 windows: Iterable[int] = (1,), batch_size: int = 32, shuffle: bool = False,
+                 seed: Optional[int] = None, prefetch: int = 2, fill: float = 0.0):
+
+        self._predictor = predictor
+        self._lags = np.asarray(list(lags), np.int64)
+        self._windows = np.asarray(list(windows), np.int64)
+        self._batch_size = batch_size
+        self._shuffle = shuffle
+        self._random = np.random.RandomState(seed)
+        self._prefetch = prefetch
+        self._fill = fill
+
+        self._sums, self._land, self._missing, self._cells = self._cumulative()
+
+        # Predictor Position of every Target Date, Dropping Dates without (enough) Predictor History
+        dates = np.asarray(pd.DatetimeIndex(target.index).values.astype('datetime64[D]'))
+        time = np.asarray(predictor.time_axis.date)
+
+        lagged = dates[:, None] - self._lags[None, :].astype('timedelta64[D]')
+        position = np.clip(np.searchsorted(time, lagged), 0, len(time) - 1)
+
+        valid = np.all(time[position] == lagged, axis=1)
+        valid &= np.all(position - self._windows.max() + 1 >= 0, axis=1)
+        valid &= np.asarray(pd.notnull(target.values))
+
+        self._positions = position[valid]
+        self._target = np.asarray(target.values)[valid]
+        self._index = pd.DatetimeIndex(target.index)[valid]
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        # Target Dates of all Samples, in (Unshuffled) Sample Order
+        return self._index
+
+    @property
+    def target(self) -> np.ndarray:
+        return self._target
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return len(self._target), self._sums.shape[1], self._sums.shape[2], len(self._lags) * len(self._windows)
+
+    def sample(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Predictor Stack and Target of the given Samples
+        samples = np.atleast_1d(samples)
+
+        # End of every (Sample, Lag, Window) Window within the Cumulative Sum, and its Start
+        end = np.repeat(self._positions[samples][:, :, None] + 1, len(self._windows), axis=2)
+        start = end - self._windows[None, None, :]
+
+        sums = self._sums[end.ravel()] - self._sums[start.ravel()]
+        means = sums.reshape(end.shape + sums.shape[1:]) / self._windows[None, None, :, None, None]
+
+        # Windows touching Missing Values are Missing, like pandas' rolling Mean
+        means[..., self._land] = self._fill
+        if self._missing is not None:
+            flat = means.reshape(end.shape + (-1,))
+            missing = (self._missing[end.ravel()] - self._missing[start.ravel()]).reshape(end.shape + (-1,)) > 0
+            flat[..., self._cells] = np.where(missing, self._fill, flat[..., self._cells])
+
+        # [sample, lag, window, lat, lon] -> [sample, lat, lon, lag * window]
+        X = np.moveaxis(means.reshape((len(samples), -1) + means.shape[3:]), 1, -1).astype(np.float32)
+        return X, self._target[samples]
+
+    def batches(self) -> Iterator[np.ndarray]:
+        order = self._random.permutation(len(self._target)) if self._shuffle else np.arange(len(self._target))
+        for start in range(0, len(order), self._batch_size):
+            yield order[start:start + self._batch_size]
+
+    def __len__(self) -> int:
+        return -(-len(self._target) // self._batch_size)
+
+    def __getitem__(self, batch: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.sample(np.arange(len(self._target))[batch * self._batch_size:(batch + 1) * self._batch_size])
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Prepare the Next Batches in a Background Thread (Numpy releases the GIL for the Heavy Lifting)
+        batches = queue.Queue(maxsize=max(1, self._prefetch))
+        stop = threading.Event()
+        done = object()
+
+        def produce() -> None:
+            try:
+                for samples in self.batches():
+                    if stop.is_set():
+                        return
+                    batches.put(self.sample(samples))
+            except BaseException as error:
+                batches.put(error)
+            batches.put(done)
+
+        worker = threading.Thread(target=produce, daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+
+            # Unblock the Worker if it is waiting on a Full Queue
+            while worker.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    worker.join(0.01)
+
+    def _cumulative(self) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        # Cumulative Sum [time + 1, lat, lon] of the Anomaly (Missing as 0), Cached alongside the Anomaly itself
+        anomaly = self._predictor.anomaly
+        blocks = [slice(start, min(start + self._predictor.time_block(), len(anomaly)))
+                  for start in range(0, len(anomaly), self._predictor.time_block())]
+
+        def compute() -> np.ndarray:
+            sums = np.zeros((len(anomaly) + 1,) + anomaly.shape[1:], np.float64)
+            for block in blocks:
+                np.cumsum(np.nan_to_num(anomaly[block]), axis=0, out=sums[block.start + 1:block.stop + 1])
+                sums[block.start + 1:block.stop + 1] += sums[block.start]
+            return sums
+
+        sums = self._predictor._cached(compute, product='cumulative_anomaly')
+
+        # Cells Missing at all Times (e.g. Land) are Masked, Cells Missing at some Times (e.g. Sea Ice) Count them
+        missing_any = np.zeros(anomaly.shape[1:], bool)
+        missing_all = np.ones(anomaly.shape[1:], bool)
+        for block in blocks:
+            missing = np.isnan(anomaly[block])
+            missing_any |= missing.any(0)
+            missing_all &= missing.all(0)
+
+        cells = np.flatnonzero(missing_any & ~missing_all)
+        if not len(cells):
+            return sums, missing_all, None, None
+
+        counts = np.zeros((len(anomaly) + 1, len(cells)), np.int32)
+        for block in blocks:
+            missing = np.isnan(anomaly[block].reshape(block.stop - block.start, -1)[:, cells])
+            np.cumsum(missing, axis=0, out=counts[block.start + 1:block.stop + 1])
+            counts[block.start + 1:block.stop + 1] += counts[block.start]
+
+        return sums, missing_all, counts, cells
+
+    def __repr__(self):
+        return f"Samples({self._predictor}) {self.shape}"
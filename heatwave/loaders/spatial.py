@@ -0,0 +1,86 @@
+import numpy as np
+
+from typing import Tuple
+
+
+EARTH_RADIUS = 6371.0  # km
+
+
+def to_cartesian(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    # Points on the Unit Sphere, such that Chord Distance is Monotonic in Great Circle Distance
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    return np.stack([np.cos(latitude) * np.cos(longitude),
+                     np.cos(latitude) * np.sin(longitude),
+                     np.sin(latitude)], axis=-1)
+
+
+def chord(distance: float) -> float:
+    # Chord Length on the Unit Sphere corresponding to a Great Circle Distance (km)
+    return 2 * np.sin(np.minimum(distance / EARTH_RADIUS, np.pi) / 2)
+
+
+class StationIndex:
+    """KD-Tree over Station Coordinates, for Spatial Station Queries and Matching Stations to Grid Cells"""
+
+    def __init__(self, ids: np.ndarray, latitude: np.ndarray, longitude: np.ndarray):
+        self._ids = np.asarray(ids)
+        self._latitude = np.asarray(latitude, np.float64)
+        self._longitude = np.asarray(longitude, np.float64)
+
+        # scipy.spatial is Imported on First Use, it Dominates the Import Time of the Loaders otherwise
+        from scipy.spatial import cKDTree
+        self._tree = cKDTree(to_cartesian(self._latitude, self._longitude))
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    def bbox(self, latitude: Tuple[float, float], longitude: Tuple[float, float]) -> np.ndarray:
+        # Longitude Bounds may use either the -180/180 or the 0/360 Convention, and may Wrap
+        longitude_min, longitude_max = np.mod(longitude, 360)
+        station_longitude = np.mod(self._longitude, 360)
+
+        if longitude_min <= longitude_max:
+            within_longitude = (station_longitude >= longitude_min) & (station_longitude <= longitude_max)
+        else:
+            within_longitude = (station_longitude >= longitude_min) | (station_longitude <= longitude_max)
+
+        within = within_longitude & (self._latitude >= latitude[0]) & (self._latitude <= latitude[1])
+        return self._ids[within]
+
+    def radius(self, latitude: float, longitude: float, distance: float) -> np.ndarray:
+        # Stations within distance (km) of a Point
+        index = self._tree.query_ball_point(to_cartesian(latitude, longitude), chord(distance))
+
+        # An Empty Query gives an Empty List, which Numpy would turn into a (non-Index) float64 Array
+        return self._ids[np.sort(np.asarray(index, dtype=np.intp))]
+
+    def polygon(self, coordinates: np.ndarray) -> np.ndarray:
+        # Stations within a Polygon of (longitude, latitude) Vertices, in -180/180 Convention
+        from heatwave.masks import points_in_polygon
+
+        coordinates = np.asarray(coordinates, np.float64)
+        edges = np.hstack([coordinates, np.roll(coordinates, -1, axis=0)])
+        stations = np.column_stack([np.where(self._longitude > 180, self._longitude - 360, self._longitude),
+                                    self._latitude])
+
+        return self._ids[points_in_polygon(edges, stations)] if len(stations) else self._ids[:0]
+
+    def nearest(self, latitude: float, longitude: float, n: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        # n Nearest Stations to a Point (e.g. a Grid Cell Center), and their Distance (km)
+        distance, index = self._tree.query(to_cartesian(latitude, longitude), k=min(n, len(self._ids)))
+        distance, index = np.atleast_1d(distance), np.atleast_1d(index)
+        return self._ids[index], 2 * EARTH_RADIUS * np.arcsin(np.minimum(distance / 2, 1))
+
+    def grid_cells(self, latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Nearest Grid Cell (latitude index, longitude index) of every Station, e.g. for an ERA Grid
+        from scipy.spatial import cKDTree
+
+        grid_latitude, grid_longitude = np.meshgrid(latitudes, longitudes, indexing='ij')
+        grid = cKDTree(to_cartesian(grid_latitude.ravel(), grid_longitude.ravel()))
+
+        _, index = grid.query(to_cartesian(self._latitude, self._longitude))
+        return np.unravel_index(index, grid_latitude.shape)
+
+    def __len__(self) -> int:
+        return len(self._ids)
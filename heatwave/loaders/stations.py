@@ -0,0 +1,208 @@
+from heatwave.loaders.era import ERA
+from heatwave.loaders import dly
+
+import netCDF4
+
+import numpy as np
+
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import os
+
+
+# Physical Units per Raw Unit of every Element (e.g. Tenths of Degrees C)
+SCALE = {'PRCP': 0.1, 'SNOW': 1.0, 'SNWD': 1.0, 'TMAX': 0.1, 'TMIN': 0.1}
+
+# Plausible Range (Physical Units) of every Element, Stations with Values outside it are Dropped
+BOUNDS = {'TMAX': (-50.0, 70.0), 'TMIN': (-50.0, 70.0)}
+
+
+def dates(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    # Date of every Row of a [days, stations] Station Store (see GHCN.load_arrays)
+    return np.datetime64(arrays['start'], 'D') + np.arange(len(arrays['values']))
+
+
+def masked(arrays: Dict[str, np.ndarray], element: str = 'TMAX') -> np.ma.MaskedArray:
+    # [days, stations] Values in Physical Units (float32), Missing Values Masked
+    values = np.ma.masked_equal(arrays['values'], dly.NA)
+    return (values.astype(np.float32) * np.float32(SCALE.get(element, 1.0))).astype(np.float32)
+
+
+def quality_control(arrays: Dict[str, np.ndarray], element: str = 'TMAX', bounds: Optional[Tuple[float, float]] = None,
+                    months: Iterable[int] = (6, 7, 8), coverage: float = 0.8, years: float = 0.8,
+                    latitude: Optional[Tuple[float, float]] = None,
+                    longitude: Optional[Tuple[float, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Stations passing Quality Control (as McKinnon.ipynb), in the same int16 [days, stations] Layout
+
+    bounds: Stations with any Value outside (Physical Units) are Dropped, default BOUNDS[element] (if any)
+    months / coverage / years: Stations need Values on at least coverage of the Days in months in at least years of
+                               all Years (80% of June, July and August in 80% of Years)
+    latitude / longitude: Coordinate Box the Stations should be in, Longitudes in either Convention (and may Wrap)
+
+    Values are Reduced one Year at a Time as Masked Arrays on the Raw int16 Values (Bounds are Scaled, not the
+    Data), such that a Memory-Mapped Store is Read Once and never Converted as a whole. 'coverage' is Added to
+    the Result: the Fraction of Years every (Kept) Station Covers.
+    """
+
+    values = arrays['values']
+    n_days, n_stations = values.shape
+
+    keep = np.ones(n_stations, bool)
+
+    if latitude is not None:
+        keep &= (arrays['latitude'] >= latitude[0]) & (arrays['latitude'] <= latitude[1])
+    if longitude is not None:
+        longitude_min, longitude_max = np.mod(longitude, 360)
+        longitudes = np.mod(arrays['longitude'], 360)
+        if longitude_min <= longitude_max:
+            keep &= (longitudes >= longitude_min) & (longitudes <= longitude_max)
+        else:
+            keep &= (longitudes >= longitude_min) | (longitudes <= longitude_max)
+
+    bounds = bounds if bounds is not None else BOUNDS.get(element)
+    scale = SCALE.get(element, 1.0)
+
+    day = dates(arrays)
+    year = day.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = day.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    season = np.isin(month, list(months))
+
+    minimum = np.full(n_stations, np.iinfo(np.int16).max, np.int64)
+    maximum = np.full(n_stations, np.iinfo(np.int16).min, np.int64)
+    covered = np.zeros(n_stations, np.int64)
+
+    # Dates are Sorted, so every Year is a Contiguous Block of Rows
+    boundaries = np.r_[0, np.flatnonzero(np.diff(year)) + 1, n_days]
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        block = np.ma.masked_equal(values[start:stop], dly.NA)
+
+        minimum = np.minimum(minimum, block.min(0).filled(np.iinfo(np.int16).max))
+        maximum = np.maximum(maximum, block.max(0).filled(np.iinfo(np.int16).min))
+
+        summer = season[start:stop]
+        if summer.any():
+            covered += block[summer].count(0) >= coverage * summer.sum()
+
+    if bounds is not None:
+        keep &= (minimum * scale > bounds[0]) & (maximum * scale < bounds[1])
+
+    fraction = covered / max(1, len(boundaries) - 1)
+    keep &= fraction >= years
+
+    output = {name: array[keep] for name, array in arrays.items() if name in ('stations', 'latitude', 'longitude')}
+    output.update(values=np.asarray(values[:, keep]), start=arrays['start'], coverage=fraction[keep])
+    return output
+
+
+def station_cells(latitude: np.ndarray, longitude: np.ndarray, grid_latitude: np.ndarray,
+                  grid_longitude: np.ndarray) -> np.ndarray:
+    # Flat (Row-Major) Cell of a Regular Grid every Station lies in (Nearest Center within Half a Spacing), -1 Outside
+    latitude, longitude = np.asarray(latitude, np.float64), np.asarray(longitude, np.float64)
+    grid_latitude, grid_longitude = np.asarray(grid_latitude, np.float64), np.asarray(grid_longitude, np.float64)
+
+    row = np.argmin(np.abs(latitude[:, None] - grid_latitude[None, :]), axis=1)
+    row_distance = np.abs(latitude - grid_latitude[row])
+
+    # Longitude Distances are Circular, such that either Convention (and a Global Seam) Works
+    offset = np.abs(np.mod(longitude[:, None] - grid_longitude[None, :] + 180, 360) - 180)
+    column = np.argmin(offset, axis=1)
+    column_distance = offset[np.arange(len(longitude)), column]
+
+    spacing_latitude = np.median(np.abs(np.diff(grid_latitude))) if len(grid_latitude) > 1 else 180.0
+    spacing_longitude = np.median(np.abs(np.diff(grid_longitude))) if len(grid_longitude) > 1 else 360.0
+
+    inside = (row_distance <= spacing_latitude / 2 + 1e-9) & (column_distance <= spacing_longitude / 2 + 1e-9)
+    return np.where(inside, row * len(grid_longitude) + column, -1)
+
+
+def iter_aggregate(arrays: Dict[str, np.ndarray], era: ERA, element: str = 'TMAX', time_block: Optional[int] = None,
+                   memory_limit: Optional[int] = None) -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+    """
+    Station Values Binned into the Cells of an ERA Grid, on the ERA's Time Axis, one Time Block at a Time
+
+    Yields (block, [block, lat, lon] Mean (Physical Units, NaN without Stations), [block, lat, lon] Station Count).
+    Every Block is two Sparse Products of the Block's [time, stations] Values (and Validity) with a [stations, cells]
+    Binning Matrix, so Stations are never Looped over.
+    """
+
+    from scipy import sparse
+
+    cells = station_cells(arrays['latitude'], arrays['longitude'], era.latitude, era.longitude)
+    inside = np.flatnonzero(cells >= 0)
+
+    shape = era.shape[1:]
+    binning = sparse.csr_matrix((np.ones(len(inside)), (inside, cells[inside])),
+                                shape=(len(cells), int(np.prod(shape))))
+
+    # Station Row of every ERA Time Step (Sub-Daily Steps share the Row of their Day)
+    rows = (np.asarray(era.time_axis.date) - np.datetime64(arrays['start'], 'D')).astype(np.int64)
+    available = (rows >= 0) & (rows < len(arrays['values']))
+
+    scale = np.float32(SCALE.get(element, 1.0))
+    values = arrays['values']
+
+    for block in era._time_blocks(time_block or era.time_block(memory_limit)):
+        means = np.full((block.stop - block.start,) + shape, np.nan, np.float32)
+        counts = np.zeros((block.stop - block.start,) + shape, np.int32)
+
+        steps = np.flatnonzero(available[block])
+        if len(steps):
+            raw = np.asarray(values[rows[block][steps]])
+            valid = raw != dly.NA
+
+            sums = np.asarray((sparse.csr_matrix(np.where(valid, raw, 0).astype(np.float32)) @ binning).todense())
+            number = np.asarray((sparse.csr_matrix(valid.astype(np.float32)) @ binning).todense())
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[steps] = (np.where(number > 0, sums / number, np.nan) * scale).reshape((-1,) + shape)
+            counts[steps] = number.reshape((-1,) + shape)
+
+        yield block, means, counts
+
+
+def aggregate(arrays: Dict[str, np.ndarray], era: ERA, element: str = 'TMAX', time_block: Optional[int] = None,
+              memory_limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # [time, lat, lon] Gridded Daily Station Means and Counts on an ERA Grid, see iter_aggregate
+    means = np.empty(era.shape, np.float32)
+    counts = np.empty(era.shape, np.int32)
+
+    for block, block_means, block_counts in iter_aggregate(arrays, era, element, time_block, memory_limit):
+        means[block], counts[block] = block_means, block_counts
+
+    return means, counts
+
+
+def write_aggregate(path: str, arrays: Dict[str, np.ndarray], era: ERA, element: str = 'TMAX',
+                    time_block: Optional[int] = None, memory_limit: Optional[int] = None) -> None:
+    """
+    Write Gridded Station Means (as element) and Counts (as 'count') to a netCDF File on the ERA's Grid and Time
+    Axis, one Time Block at a Time, such that ERA(path, element) Reads it like the Reanalysis (e.g. for t95)
+    """
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    time = era.dataset[era._time_key]
+
+    with netCDF4.Dataset(path, 'w', format='NETCDF4') as dataset:
+        dataset.createDimension(era._time_key, None)
+        dataset.createDimension(era._latitude_key, len(era.latitude))
+        dataset.createDimension(era._longitude_key, len(era.longitude))
+        dimensions = (era._time_key, era._latitude_key, era._longitude_key)
+
+        times = dataset.createVariable(era._time_key, time.dtype, (era._time_key,))
+        for name in ('units', 'calendar'):
+            if name in time.ncattrs():
+                times.setncattr(name, time.getncattr(name))
+        times[:] = np.ma.getdata(time[era._index[0]])
+
+        dataset.createVariable(era._latitude_key, np.float32, (era._latitude_key,))[:] = era.latitude
+        dataset.createVariable(era._longitude_key, np.float32, (era._longitude_key,))[:] = era.longitude
+
+        means = dataset.createVariable(element, np.float32, dimensions, zlib=True, fill_value=np.float32(np.nan))
+        counts = dataset.createVariable('count', np.int32, dimensions, zlib=True)
+
+        for block, block_means, block_counts in iter_aggregate(arrays, era, element, time_block, memory_limit):
+            means[block] = block_means
+            counts[block] = block_counts
@@ -0,0 +1,244 @@
+from heatwave.loaders.era import ERA
+
+import netCDF4
+
+import numpy as np
+
+from typing import Dict, List, Optional, Tuple
+
+import os
+
+
+STORE_ATTRIBUTE = 'heatwave_store'  # Global Attribute Marking Rechunked Stores
+SUMMARIES = ('min', 'max', 'mean')
+
+# Default Chunk Shapes (time, lat, lon): Whole Maps per Step, or Long Series of small Tiles
+TIME_CHUNKS = (8, None, None)
+SPACE_CHUNKS = (1024, 16, 16)
+
+BYTES_PER_VALUE = 24  # Memory per Value of a Block: Source Read (float64), float32 Copy and Summary Temporaries
+
+
+def rechunk(era: ERA, path: str, layout: str = 'both', time_chunks: Tuple[Optional[int], ...] = TIME_CHUNKS,
+            space_chunks: Tuple[Optional[int], ...] = SPACE_CHUNKS, complevel: int = 4,
+            memory_limit: Optional[int] = None) -> None:
+    """
+    Convert (a View of) an ERA Dataset into an Analysis-Ready NETCDF4 Store, that ERA can Read like any other File
+
+    layout: 'time' (Time-Major Chunks, Fast Maps), 'space' (Space-Major Chunks, Fast Series) or 'both' (Stored
+            Twice, ERA Reads from whichever Layout Touches the Fewest Chunks)
+    time_chunks / space_chunks: Chunk Shapes, None spans the whole Axis
+
+    Per-Chunk min/max/mean Summaries are Stored alongside, over Tiles of the Time Chunk of the First Layout and the
+    Spatial Chunk of the Last Layout (i.e. the Finer of both), see Store.
+
+    The Source is Read Once, in Time Blocks within memory_limit (default era.memory_limit), which also covers one
+    Chunk of every Layout. Blocks are Aligned with the Chunks of all Layouts if such Blocks fit, otherwise Chunks are
+    Written Partially by several Blocks, with as much of a Row of Chunks Cached as the Rest of the Limit allows
+    (Chunks Evicted before they are Complete are Recompressed, which is Slower, but stays within the Limit).
+    Raises ValueError if the Limit can't hold a single Time Step and one Chunk of every Layout.
+    """
+
+    if layout not in ('time', 'space', 'both'):
+        raise ValueError(f"layout should be either 'time', 'space' or 'both', not '{layout}'")
+
+    shape = era.shape
+    layouts = {'time': [_chunk_shape(time_chunks, shape)], 'space': [_chunk_shape(space_chunks, shape)],
+               'both': [_chunk_shape(time_chunks, shape), _chunk_shape(space_chunks, shape)]}[layout]
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    source = era.dataset[era._target]
+    time = era.dataset[era._time_key]
+
+    with netCDF4.Dataset(path, 'w', format='NETCDF4') as dataset:
+        dataset.setncattr(STORE_ATTRIBUTE, 1)
+
+        dataset.createDimension(era._time_key, None)
+        dataset.createDimension(era._latitude_key, shape[1])
+        dataset.createDimension(era._longitude_key, shape[2])
+        dimensions = (era._time_key, era._latitude_key, era._longitude_key)
+
+        times = dataset.createVariable(era._time_key, time.dtype, (era._time_key,))
+        for name in ('units', 'calendar'):
+            if name in time.ncattrs():
+                times.setncattr(name, time.getncattr(name))
+        times[:] = np.ma.getdata(time[era._index[0]])
+
+        dataset.createVariable(era._latitude_key, np.float32, (era._latitude_key,))[:] = era.latitude
+        dataset.createVariable(era._longitude_key, np.float32, (era._longitude_key,))[:] = era.longitude
+
+        # Memory Budget: one Chunk per Layout (HDF5 Holds a Chunk while Writing it), the Rest for the Time Block
+        memory_limit = memory_limit if memory_limit is not None else era.memory_limit
+        chunk_bytes = [int(np.prod(chunks)) * np.dtype(np.float32).itemsize for chunks in layouts]
+        step_bytes = shape[1] * shape[2] * BYTES_PER_VALUE
+
+        if step_bytes + sum(chunk_bytes) > memory_limit:
+            raise ValueError(f"memory_limit of {memory_limit} bytes can't hold a time step ({step_bytes} bytes) and "
+                             f"a chunk of every layout ({sum(chunk_bytes)} bytes), use smaller chunks or a larger "
+                             f"memory_limit")
+
+        steps = min(max(shape[0], 1), (memory_limit - sum(chunk_bytes)) // step_bytes)
+
+        # Blocks are Multiples of every Layout's Time Chunk if they fit, every Chunk is then Written Whole, Once
+        step = int(np.lcm.reduce([chunks[0] for chunks in layouts]))
+        aligned = steps >= step or steps >= shape[0]
+        time_block = steps // step * step if steps >= step else steps
+
+        # Otherwise Chunks are Completed over several Blocks: Cache (part of) a Row of Chunks in the Spare Budget
+        spare = (memory_limit - sum(chunk_bytes) - time_block * step_bytes) // len(layouts)
+        caches = [size if aligned else size + min(spare, chunks[0] * shape[1] * shape[2] * 4)
+                  for size, chunks in zip(chunk_bytes, layouts)]
+
+        variables = []
+        for suffix, chunks, cache in zip(('', ERA.SERIES_SUFFIX), layouts, caches):
+            variable = dataset.createVariable(era._target + suffix, np.float32, dimensions, zlib=True,
+                                              complevel=complevel, chunksizes=chunks, fill_value=np.float32(np.nan))
+            for name in ('units', 'long_name', 'standard_name'):
+                if name in source.ncattrs():
+                    variable.setncattr(name, source.getncattr(name))
+
+            variable.set_var_chunk_cache(size=int(cache))
+            variables.append(variable)
+
+        # Summaries over Tiles of the First Layout's Time Chunk and the Last Layout's Spatial Chunk
+        summary_chunks = (layouts[0][0], layouts[-1][1], layouts[-1][2])
+        summary_shape = tuple(-(-length // size) for length, size in zip(shape, summary_chunks))
+        for axis, length in zip(dimensions, summary_shape):
+            dataset.createDimension(f'summary_{axis}', length)
+
+        summaries = {}
+        for name in SUMMARIES:
+            summaries[name] = dataset.createVariable(f'{era._target}_{name}', np.float32,
+                                                     tuple(f'summary_{axis}' for axis in dimensions),
+                                                     fill_value=np.float32(np.nan))
+            summaries[name].setncattr('chunk_shape', np.array(summary_chunks, np.int64))
+
+        # Summary Tiles may span several Blocks: Reduce every Block's Part of a Tile, Combine until the Tile is Complete
+        tile = summary_chunks[0]
+        partial = None
+
+        for start in range(0, shape[0], time_block):
+            block = slice(start, min(start + time_block, shape[0]))
+            data = np.asarray(era.view[block], np.float32)
+
+            for variable in variables:
+                variable[block] = data
+
+            for row in range(block.start // tile, (block.stop - 1) // tile + 1):
+                first, last = max(block.start, row * tile), min(block.stop, (row + 1) * tile)
+                reduced = _reduce_tiles(data[first - block.start:last - block.start], summary_chunks[1:])
+                partial = reduced if partial is None else _combine(partial, reduced)
+
+                if last == min(shape[0], (row + 1) * tile):
+                    for name, values in _finish(partial).items():
+                        summaries[name][row] = values
+                    partial = None
+
+
+def _chunk_shape(chunks: Tuple[Optional[int], ...], shape: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    return tuple(max(1, min(size or length, length)) for size, length in zip(chunks, shape))
+
+
+def _reduce_tiles(data: np.ndarray, chunks: Tuple[int, int]) -> Dict[str, np.ndarray]:
+    # min/max/sum/count (Ignoring NaN) over Time and Spatial Tiles of a [time, lat, lon] Block, as [lat, lon] Tiles
+    padded_shape = (len(data),) + tuple(-(-length // size) * size for length, size in zip(data.shape[1:], chunks))
+    padded = np.full(padded_shape, np.nan, np.float32)
+    padded[:, :data.shape[1], :data.shape[2]] = data
+
+    tiles = padded.reshape(len(data), padded_shape[1] // chunks[0], chunks[0], padded_shape[2] // chunks[1], chunks[1])
+    valid = ~np.isnan(tiles)
+
+    return {'min': np.where(valid, tiles, np.inf).min(axis=(0, 2, 4)),
+            'max': np.where(valid, tiles, -np.inf).max(axis=(0, 2, 4)),
+            'sum': np.where(valid, tiles, 0).sum(axis=(0, 2, 4), dtype=np.float64),
+            'count': valid.sum(axis=(0, 2, 4))}
+
+
+def _combine(first: Dict[str, np.ndarray], second: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {'min': np.minimum(first['min'], second['min']), 'max': np.maximum(first['max'], second['max']),
+            'sum': first['sum'] + second['sum'], 'count': first['count'] + second['count']}
+
+
+def _finish(reduced: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # min/max/mean of Reduced Tiles, NaN for Tiles without Values
+    counts = reduced['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {'min': np.where(counts, reduced['min'], np.nan), 'max': np.where(counts, reduced['max'], np.nan),
+                'mean': reduced['sum'] / counts}
+
+
+class Store:
+    """
+    Per-Chunk Summaries of a Rechunked Store, to Skip Chunks that can't Satisfy a Query
+
+    E.g. the Time Steps at which any Cell in a Region may exceed 35 degrees, without Reading the Data:
+        Store(path, 't2m').blocks(index=(None, rows, columns), above=308.15)
+    """
+
+    def __init__(self, path: str, target: str):
+        self._path = path
+        self._target = target
+
+        with netCDF4.Dataset(path) as dataset:
+            if STORE_ATTRIBUTE not in dataset.ncattrs():
+                raise ValueError(f"{path} is not a rechunked store, see rechunk()")
+
+            self._summaries = {name: np.ma.filled(dataset[f'{target}_{name}'][:], np.nan) for name in SUMMARIES}
+            self._chunks = tuple(int(size) for size in dataset[f'{target}_min'].getncattr('chunk_shape'))
+            self._shape = dataset[target].shape
+
+    @property
+    def chunks(self) -> Tuple[int, int, int]:
+        return self._chunks
+
+    @property
+    def summaries(self) -> Dict[str, np.ndarray]:
+        # [time chunk, lat chunk, lon chunk] min/max/mean
+        return self._summaries
+
+    def blocks(self, index: Tuple[Optional[slice], ...] = (), above: Optional[float] = None,
+               below: Optional[float] = None) -> List[Tuple[slice, slice, slice]]:
+        """
+        (time, lat, lon) Slices of the Chunks that Intersect the Query Box (index, Contiguous Slices) and may hold
+        Values above (> above) / below (< below) the given Thresholds, Clipped to the Query Box
+        """
+
+        box = [(key or slice(None)).indices(length)[:2] for key, length in
+               zip(tuple(index) + (None,) * (3 - len(index)), self._shape)]
+
+        ranges = [range(start // size, -(-stop // size)) for (start, stop), size in zip(box, self._chunks)]
+        selection = np.ix_(*ranges)
+
+        candidate = np.ones(tuple(len(r) for r in ranges), bool)
+        if above is not None:
+            candidate &= self._summaries['max'][selection] > above
+        if below is not None:
+            candidate &= self._summaries['min'][selection] < below
+
+        blocks = []
+        for position in zip(*np.nonzero(candidate)):
+            chunk = [r[p] for r, p in zip(ranges, position)]
+            blocks.append(tuple(slice(max(c * size, start), min((c + 1) * size, stop))
+                                for c, size, (start, stop) in zip(chunk, self._chunks, box)))
+
+        return blocks
+
+    def read(self, index: Tuple[Optional[slice], ...] = (), above: Optional[float] = None,
+             below: Optional[float] = None) -> np.ndarray:
+        # Read the Query Box, but only the Chunks that may Satisfy the Thresholds (NaN elsewhere)
+        box = [(key or slice(None)).indices(length)[:2] for key, length in
+               zip(tuple(index) + (None,) * (3 - len(index)), self._shape)]
+        output = np.full(tuple(stop - start for start, stop in box), np.nan, np.float32)
+
+        with netCDF4.Dataset(self._path) as dataset:
+            variable = dataset[self._target]
+            for block in self.blocks(index, above, below):
+                local = tuple(slice(key.start - start, key.stop - start) for key, (start, _) in zip(block, box))
+                output[local] = np.ma.filled(variable[block], np.nan)
+
+        return output
+
+    def __repr__(self):
+        return f"Store({self._target}) {self._shape}, chunks {self._chunks}"
@@ -0,0 +1,267 @@
+import netCDF4
+
+import numpy as np
+import pandas as pd
+
+from typing import Tuple, Dict, Optional
+
+import re
+
+
+DAYS = 366  # Number of Day of Year Slots (Leap Year Calendar)
+LEAP_DAY = 59  # Slot of February 29th
+
+# Slot of the First Day of each Month (Leap Year Calendar)
+MONTH_OFFSET = np.cumsum([0, 0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+# Month Lengths of Calendars with Fixed Year Lengths
+FIXED_CALENDARS = {
+    'noleap': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '365_day': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'all_leap': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '366_day': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '360_day': [30] * 12,
+}
+
+STANDARD_CALENDARS = ('standard', 'gregorian', 'proleptic_gregorian')
+
+UNIT_SECONDS = {
+    'seconds': 1, 'second': 1, 'secs': 1, 'sec': 1, 's': 1,
+    'minutes': 60, 'minute': 60, 'mins': 60, 'min': 60, 'm': 60,
+    'hours': 3600, 'hour': 3600, 'hrs': 3600, 'hr': 3600, 'h': 3600,
+    'days': 86400, 'day': 86400, 'd': 86400, 'D': 86400,
+}
+
+SECONDS_PER_DAY = 86400
+
+
+def parse_units(units: str) -> Tuple[int, np.datetime64]:
+    # Split CF Time Units (e.g. 'hours since 1900-01-01 00:00:00.0') into Seconds per Unit and Origin
+    match = re.match(r"\s*(\w+)\s+since\s+(\d+-\d+-\d+)(?:[ T](\d+:\d+(?::\d+)?))?", units)
+
+    if match is None or match.group(1) not in UNIT_SECONDS:
+        raise ValueError(f"Can't parse time units '{units}'")
+
+    year, month, day = (int(part) for part in match.group(2).split('-'))
+    origin = np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", 's')
+
+    if match.group(3):
+        clock = [int(part) for part in match.group(3).split(':')] + [0]
+        origin += np.timedelta64(clock[0] * 3600 + clock[1] * 60 + clock[2], 's')
+
+    return UNIT_SECONDS[match.group(1)], origin
+
+
+class TimeAxis:
+    """
+    Decoded Time Axis, converting numeric CF Offsets straight to Calendar Fields and datetime64 with Numpy Arithmetic
+
+    Supports the Standard (Proleptic Gregorian) and Fixed Length (noleap, all_leap, 360_day) Calendars, other Calendars
+    fall back on netCDF4.num2date. Day of Year and Season Indices are Precomputed on First Use.
+    """
+
+    def __init__(self, values: np.ndarray, units: str, calendar: str = 'standard'):
+        self._units = units
+        self._calendar = calendar.lower() if calendar else 'standard'
+
+        values = np.asarray(values, np.float64)
+
+        if self._calendar in STANDARD_CALENDARS:
+            fields = self._decode_standard(values, units)
+        elif self._calendar in FIXED_CALENDARS:
+            fields = self._decode_fixed(values, units, FIXED_CALENDARS[self._calendar])
+        else:
+            fields = self._decode_fallback(values, units, self._calendar)
+
+        self._fields = fields
+        self._day_of_year = {}
+        self._season = None
+
+    @property
+    def calendar(self) -> str:
+        return self._calendar
+
+    @property
+    def units(self) -> str:
+        return self._units
+
+    @property
+    def datetime(self) -> np.ndarray:
+        return self._fields['datetime']
+
+    @property
+    def date(self) -> np.ndarray:
+        return self._fields['datetime'].astype('datetime64[D]')
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.datetime)
+
+    @property
+    def year(self) -> np.ndarray:
+        return self._fields['year']
+
+    @property
+    def month(self) -> np.ndarray:
+        return self._fields['month']
+
+    @property
+    def day(self) -> np.ndarray:
+        return self._fields['day']
+
+    @property
+    def seconds(self) -> np.ndarray:
+        # Seconds since Midnight, for Sub-Daily Resolution
+        return self._fields['seconds']
+
+    @property
+    def slots(self) -> int:
+        # Number of Day of Year Slots the Calendar uses (see day_of_year), the Period of its Annual Cycle
+        return sum(FIXED_CALENDARS['360_day']) if self._calendar == '360_day' else DAYS
+
+    @property
+    def season(self) -> np.ndarray:
+        # 0: DJF, 1: MAM, 2: JJA, 3: SON
+        if self._season is None:
+            self._season = (self.month % 12) // 3
+        return self._season
+
+    def day_of_year(self, leap: str = 'keep') -> np.ndarray:
+        """
+        Day of Year Slot (0-365) for every Date, such that the same Calendar Date always maps onto the same Slot
+
+        leap: 'keep' gives February 29th a Slot of its own, 'merge' pools it with February 28th
+
+        360_day Calendars use their own Day of Year (0-359) instead, as February 29th and 30th would otherwise share
+        Slots with March 1st; they have no Leap Day to merge.
+        """
+
+        if leap not in self._day_of_year:
+            if leap not in ('keep', 'merge'):
+                raise ValueError(f"leap should be either 'keep' or 'merge', not '{leap}'")
+
+            if self._calendar == '360_day':
+                index = (self.month - 1) * FIXED_CALENDARS['360_day'][0] + self.day - 1
+            else:
+                index = MONTH_OFFSET[self.month] + np.minimum(self.day, 31) - 1
+
+                if leap == 'merge':
+                    index = np.where(index == LEAP_DAY, LEAP_DAY - 1, index)
+
+            self._day_of_year[leap] = np.minimum(index, DAYS - 1)
+
+        return self._day_of_year[leap]
+
+    def window(self, start: str = '06-24', end: str = '08-22', leap_shift: bool = True,
+               before: int = 0, after: int = 0) -> np.ndarray:
+        """
+        Positions of all Time Steps within a Fixed Day of Year Window (start/end as 'MM-DD', inclusive) of every Year
+
+        leap_shift: Keep the Window on the same Day of Year Numbers in Leap Years (i.e. one Calendar Day earlier)
+        before / after: Extra Days before / after the Window, e.g. for Lags or Rolling Windows
+        """
+
+        month_lengths = FIXED_CALENDARS.get(self._calendar, FIXED_CALENDARS['noleap'])
+        month_offset = np.cumsum([0] + month_lengths)
+
+        def ordinal(month, day):
+            return month_offset[np.asarray(month) - 1] + np.asarray(day) - 1
+
+        first = ordinal(*(int(part) for part in start.split('-'))) - before
+        last = ordinal(*(int(part) for part in end.split('-'))) + after
+
+        position = ordinal(self.month, self.day)
+
+        # Days after February 29th are one Day later within a Leap Year
+        if leap_shift and self._calendar in STANDARD_CALENDARS:
+            leap = (self.year % 4 == 0) & ((self.year % 100 != 0) | (self.year % 400 == 0))
+            position = position + (leap & (self.month > 2))
+
+        return np.flatnonzero((position >= first) & (position <= last))
+
+    def __getitem__(self, key) -> 'TimeAxis':
+        axis = TimeAxis.__new__(TimeAxis)
+        axis._units, axis._calendar = self._units, self._calendar
+        axis._fields = {name: field[key] for name, field in self._fields.items()}
+        axis._day_of_year = {leap: index[key] for leap, index in self._day_of_year.items()}
+        axis._season = self._season[key] if self._season is not None else None
+        return axis
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    @staticmethod
+    def _decode_standard(values: np.ndarray, units: str) -> Dict[str, np.ndarray]:
+        unit, origin = parse_units(units)
+        datetime = origin + np.round(values * unit).astype(np.int64).astype('timedelta64[s]')
+        return TimeAxis._fields_of(datetime)
+
+    @staticmethod
+    def _decode_fixed(values: np.ndarray, units: str, month_lengths: list) -> Dict[str, np.ndarray]:
+        unit, origin = parse_units(units)
+        month_offset = np.cumsum([0] + month_lengths)
+        year_length = month_offset[-1]
+
+        # Origin as Day Number and Seconds within the Fixed Length Calendar
+        origin_fields = TimeAxis._fields_of(np.atleast_1d(origin))
+        origin_day = (origin_fields['year'][0] * year_length + month_offset[origin_fields['month'][0] - 1]
+                      + origin_fields['day'][0] - 1)
+
+        seconds = origin_fields['seconds'][0] + np.round(values * unit).astype(np.int64)
+        days = origin_day + seconds // SECONDS_PER_DAY
+
+        year, day_of_year = np.divmod(days, year_length)
+        month = np.searchsorted(month_offset, day_of_year, side='right')
+        day = day_of_year - month_offset[month - 1] + 1
+        seconds = seconds % SECONDS_PER_DAY
+
+        # Map onto Gregorian datetime64: Exact where the Date exists, Proportional to the Day of Year otherwise
+        if year_length == 365:
+            date = TimeAxis._date_of(year, month, day)
+        else:
+            year_start = TimeAxis._date_of(year, np.ones_like(month), np.ones_like(day))
+            gregorian_length = TimeAxis._date_of(year + 1, np.ones_like(month), np.ones_like(day)) - year_start
+            offset = day_of_year * gregorian_length.astype(np.int64) // year_length
+            date = year_start + offset.astype('timedelta64[D]')
+
+        return {'datetime': date.astype('datetime64[s]') + seconds.astype('timedelta64[s]'),
+                'year': year, 'month': month, 'day': day, 'seconds': seconds}
+
+    @staticmethod
+    def _decode_fallback(values: np.ndarray, units: str, calendar: str) -> Dict[str, np.ndarray]:
+        dates = netCDF4.num2date(values, units=units, calendar=calendar)
+
+        year = np.array([date.year for date in dates], np.int64)
+        month = np.array([date.month for date in dates], np.int64)
+        day = np.array([date.day for date in dates], np.int64)
+        seconds = np.array([date.hour * 3600 + date.minute * 60 + date.second for date in dates], np.int64)
+
+        return {'datetime': TimeAxis._date_of(year, month, np.minimum(day, 28)).astype('datetime64[s]')
+                + (day - np.minimum(day, 28)).astype('timedelta64[D]') + seconds.astype('timedelta64[s]'),
+                'year': year, 'month': month, 'day': day, 'seconds': seconds}
+
+    @staticmethod
+    def _fields_of(datetime: np.ndarray) -> Dict[str, np.ndarray]:
+        # Calendar Fields of (Proleptic Gregorian) datetime64 Values
+        days = datetime.astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        years = days.astype('datetime64[Y]')
+
+        return {'datetime': datetime.astype('datetime64[s]'),
+                'year': years.astype(np.int64) + 1970,
+                'month': (months - years.astype('datetime64[M]')).astype(np.int64) + 1,
+                'day': (days - months.astype('datetime64[D]')).astype(np.int64) + 1,
+                'seconds': (datetime.astype('datetime64[s]') - days.astype('datetime64[s]')).astype(np.int64)}
+
+    @staticmethod
+    def _date_of(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+        months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+        return months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+
+
+def axis_from(variable, unit: str = 'h', origin: str = '1900-01-01', index=slice(None)) -> TimeAxis:
+    # Time Axis of a netCDF Time Variable, falling back on (unit, origin) if it has no Units Attribute
+    attributes = variable.ncattrs()
+    units = variable.units if 'units' in attributes else f"{unit} since {origin}"
+    calendar = variable.calendar if 'calendar' in attributes else 'standard'
+    return TimeAxis(np.ma.getdata(variable[index]), units, calendar)
@@ -0,0 +1,202 @@
+from heatwave.enums import Country
+from heatwave.cache import Cache, CACHE
+
+import numpy as np
+import netCDF4
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple, List
+
+import os
+
+
+DATA_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data'))
+SHAPEFILE_PATH = os.path.join(DATA_ROOT, 'misc/ne_50m_admin_0_countries/ne_50m_admin_0_countries.shp')
+
+POINT_IN_POLYGON_BLOCK = 2 ** 22  # Maximum Number of Edge x Row Crossings evaluated at once
+
+
+@lru_cache(maxsize=None)
+def country_shapes() -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    # pyshp is only Imported once Shapes are Needed, Masks come from the Cache otherwise
+    import shapefile
+
+    countries = shapefile.Reader(SHAPEFILE_PATH)
+
+    iso_a2_index = [field[0] for field in countries.fields[1:]].index("ISO_A2")
+
+    codes, bounding_boxes, edges = [], [], []
+
+    for shape, record in zip(countries.shapes(), countries.records()):
+        iso_a2 = record[iso_a2_index]
+        codes.append(Country[iso_a2] if iso_a2 in Country.__members__ else -1)
+        bounding_boxes.append(shape.bbox)
+
+        # Collect Edges (x1, y1, x2, y2) of all Rings (Outer Rings and Holes alike)
+        points = np.asarray(shape.points, np.float64)
+        parts = list(shape.parts) + [len(points)]
+        rings = [points[start:stop] for start, stop in zip(parts[:-1], parts[1:]) if stop > start]
+        edges.append(np.concatenate([np.hstack([ring, np.roll(ring, -1, axis=0)]) for ring in rings]))
+
+    return np.array(codes), np.array(bounding_boxes, np.float64), edges
+
+
+def points_in_polygon(edges: np.ndarray, coordinates: np.ndarray) -> np.ndarray:
+    # Even-Odd Rule: Count Polygon Edges crossing the Horizontal Line of each Point, Left of that Point
+    # Points sharing a Latitude (e.g. Grid Rows) share their Crossings, so Work scales with Rows x Edges
+    x, y = coordinates[:, 0], coordinates[:, 1]
+    rows, row_index = np.unique(y, return_inverse=True)
+
+    inside = np.zeros(len(coordinates), bool)
+
+    low = min(x.min(), edges[:, [0, 2]].min()) - 1
+    span = max(x.max(), edges[:, [0, 2]].max()) + 1 - low
+
+    block_size = max(1, POINT_IN_POLYGON_BLOCK // len(edges))
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+
+        # Only Edges spanning the Latitudes of this Block of Rows
+        block_edges = edges[(np.maximum(edges[:, 1], edges[:, 3]) >= block[0]) &
+                            (np.minimum(edges[:, 1], edges[:, 3]) <= block[-1])]
+
+        selection = np.flatnonzero((row_index >= start) & (row_index < start + len(block)))
+        if not len(block_edges) or not len(selection):
+            continue
+
+        x1, y1, x2, y2 = (block_edges[:, [i]] for i in range(4))
+
+        # Crossings [edges, rows], Sorted per Row, with Non-Crossing Edges placed Right of all Points
+        with np.errstate(invalid='ignore', divide='ignore'):
+            crossings = x1 + (block[None, :] - y1) * (x2 - x1) / (y2 - y1)
+        crossings[(y1 > block[None, :]) == (y2 > block[None, :])] = low + span
+        crossings = np.sort(crossings, axis=0).T
+
+        # Offset every Row, such that all Rows can be Searched in a single Sorted Array
+        offsets = np.arange(len(block))[:, None] * (span + 1)
+        keys = (crossings - low + offsets).ravel()
+
+        local = row_index[selection] - start
+        counts = np.searchsorted(keys, x[selection] - low + local * (span + 1)) - local * len(block_edges)
+
+        inside[selection] = counts % 2 == 1
+
+    return inside
+
+
+def country_mask(coordinates, processes: int = 1):
+    coordinates = np.asarray(coordinates, np.float64).reshape(-1, 2)
+
+    # Split Coordinates into Tiles and Classify them in Parallel
+    if processes > 1 and len(coordinates) > processes:
+        order = np.argsort(coordinates[:, 1], kind='stable')
+        tiles = np.array_split(coordinates[order], processes)
+        with ProcessPoolExecutor(processes) as executor:
+            country_codes = np.empty(len(coordinates), int)
+            country_codes[order] = np.concatenate(list(executor.map(country_mask, tiles)))
+            return country_codes
+
+    codes, bounding_boxes, edges = country_shapes()
+
+    country_codes = np.full(len(coordinates), -1, int)
+    assigned = np.zeros(len(coordinates), bool)
+
+    x, y = coordinates[:, 0], coordinates[:, 1]
+
+    # Bounding Box Index: Skip Shapes that contain none of the Coordinates
+    overlap = ((bounding_boxes[:, 0] <= x.max()) & (bounding_boxes[:, 2] >= x.min()) &
+               (bounding_boxes[:, 1] <= y.max()) & (bounding_boxes[:, 3] >= y.min()))
+
+    # First Shape that contains a Coordinate determines its Country
+    for shape in np.flatnonzero(overlap):
+        min_x, min_y, max_x, max_y = bounding_boxes[shape]
+        candidates = np.flatnonzero(~assigned & (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y))
+
+        if len(candidates):
+            inside = candidates[points_in_polygon(edges[shape], coordinates[candidates])]
+            country_codes[inside] = codes[shape]
+            assigned[inside] = True
+
+    return country_codes
+
+
+def grid_country_mask(longitudes, latitudes, processes: int = 1):
+    # Normalize to ShapeFile Coordinates
+    longitudes = np.where(np.asarray(longitudes) > 180, np.asarray(longitudes) - 360, longitudes)
+
+    coordinates = np.empty((len(latitudes), len(longitudes), 2), np.float64)
+    coordinates[..., 0] = np.reshape(longitudes, (1, -1))
+    coordinates[..., 1] = np.reshape(latitudes, (-1, 1))
+
+    return country_mask(coordinates.reshape(-1, 2), processes).reshape(coordinates.shape[:2])
+
+
+def country_fraction(longitudes, latitudes, country: Country, supersample: int = 8, processes: int = 1):
+    # Fraction of each Grid Cell (centered on its Coordinate) covered by Country,
+    # estimated by Classifying a regular supersample x supersample Sub-Grid within every Cell
+    longitudes, latitudes = np.asarray(longitudes, np.float64), np.asarray(latitudes, np.float64)
+
+    def sub_grid(centers):
+        spacing = np.abs(np.diff(centers)).mean() if len(centers) > 1 else 0
+        offsets = ((np.arange(supersample) + 0.5) / supersample - 0.5) * spacing
+        return (centers[:, None] + offsets[None, :]).ravel()
+
+    mask = grid_country_mask(sub_grid(longitudes), sub_grid(latitudes), processes) == country
+    return mask.reshape(len(latitudes), supersample, len(longitudes), supersample).mean(axis=(1, 3))
+
+
+def era_coordinate_grid(path):
+    # Get Latitudes and Longitudes from ERA .nc file
+    era = netCDF4.Dataset(path)
+
+    if 'latitude' in era.variables and 'longitude' in era.variables:
+        latitudes = era['latitude'][:]
+        longitudes = era['longitude'][:]
+    elif 'lat' in era.variables and 'lon' in era.variables:
+        latitudes = era['lat'][:]
+        longitudes = era['lon'][:]
+    else:
+        raise AttributeError("path contains neither 'latitude'/'longitude' nor 'lat'/'lon' fields")
+
+    # Create Coordinate Grid
+    coordinates = np.empty((len(latitudes), len(longitudes), 2), np.float32)
+    coordinates[..., 0] = longitudes.reshape(1, -1)
+    coordinates[..., 1] = latitudes.reshape(-1, 1)
+
+    return coordinates
+
+
+def era_cell_centers(path):
+    # Load Coordinates and Normalize to ShapeFile Coordinates
+    coordinates = era_coordinate_grid(path)
+    coordinates[..., 0][coordinates[..., 0] > 180] -= 360
+
+    # Take Center of Grid Cell as Coordinate
+    coordinates[..., 0] += (coordinates[0, 1, 0] - coordinates[0, 0, 0]) / 2
+    coordinates[..., 1] += (coordinates[1, 0, 1] - coordinates[0, 0, 1]) / 2
+
+    return coordinates[0, :, 0], coordinates[:, 0, 1]
+
+
+def era_country_mask(path, index=None, cache: Optional[Cache] = CACHE, processes: int = 1):
+    def create_mask():
+        return grid_country_mask(*era_cell_centers(path), processes=processes)
+
+    if cache is None:
+        return create_mask()
+
+    return cache.get([path, SHAPEFILE_PATH], create_mask, product='country_mask')
+
+
+def era_country_fraction(path, country: Country, supersample: int = 8,
+                         cache: Optional[Cache] = CACHE, processes: int = 1):
+    def create_fraction():
+        return country_fraction(*era_cell_centers(path), country, supersample, processes)
+
+    if cache is None:
+        return create_fraction()
+
+    return cache.get([path, SHAPEFILE_PATH], create_fraction, product='country_fraction',
+                     country=country.name, supersample=supersample)
@@ -0,0 +1,230 @@
+from heatwave.loaders.era import ERA
+from heatwave.loaders.timeaxis import TimeAxis
+from heatwave.climatology import Climatology, day_of_year
+
+import numpy as np
+import pandas as pd
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+
+SUMMER = ('06-24', '08-22')  # 60 Hottest Days of Summer, see ERA.summer()
+
+
+def year_folds(years: Iterable[int], k: int = 4) -> List[np.ndarray]:
+    # Test Years of k Folds: Consecutive Groups of (Unique) Years, like np.split(YEARS, KFOLDS) in ERA5.ipynb
+    return list(np.array_split(np.unique(np.asarray(list(years))), k))
+
+
+def fold_indices(time: pd.DatetimeIndex, folds: Sequence[Iterable[int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    # (Train, Test) Positions within a Time Index for every Fold, given the Test Years of every Fold
+    years = np.asarray(time.year)
+    tests = [np.isin(years, np.asarray(list(fold))) for fold in folds]
+    return [(np.flatnonzero(~test), np.flatnonzero(test)) for test in tests]
+
+
+def correlation_maps(era: ERA, target: pd.Series, lags: Iterable[int] = range(0, 61),
+                     folds: Optional[Sequence[Iterable[int]]] = None, partial: Optional[pd.DataFrame] = None,
+                     window: Optional[Tuple[str, str]] = SUMMER, anomaly: bool = True,
+                     time_block: Optional[int] = None, memory_limit: Optional[int] = None) -> np.ndarray:
+    """
+    Lagged (Partial) Correlation Maps between a Predictor Field and a Target Series (e.g. T95), for all Lags at once
+
+    Lag l pairs the Target on Day t with the Predictor on Day t - l (i.e. the Predictor Leads by l Days).
+
+    folds: Test Years of every Fold (see year_folds), every Fold Correlates over its Training Years only, with the
+           Predictor Anomaly taken relative to a Climatology of those Years, so Maps never see the Test Years
+    partial: Covariates on the Target Dates (e.g. ONI, or T95 itself some Days earlier), giving Partial Correlations
+    window: Day of Year Window ('MM-DD', 'MM-DD') of Target Days to Correlate over, None for all Days
+
+    Returns [lag, lat, lon] Maps, or [fold, lag, lat, lon] Maps if folds were given.
+
+    Only the Predictor Days that any (Target Day, Lag) Pair needs are Read, in Time Chunks, plus (for Anomalies) the
+    other Days in their Day of Year Slots to Fit the Climatology (Read Once if they fit in Memory). Every Chunk adds
+    to the Cross Moments of all Lags (and Folds) with a single Matrix Product of a [lag, time] Design Matrix holding
+    the (Lagged) Target and the Chunk. Missing Predictor Values are
+    left out Pairwise (Partial Correlations assume the Covariates are known on all Days).
+    """
+
+    lags = np.asarray(list(lags), np.int64)
+
+    target = target[pd.notnull(target.values)]
+    if window is not None:
+        target = target.iloc[_window(pd.DatetimeIndex(target.index), *window)]
+
+    dates = np.asarray(pd.DatetimeIndex(target.index).values.astype('datetime64[D]'))
+    values = np.asarray(target.values, np.float64)
+
+    covariates = np.zeros((len(dates), 0))
+    if partial is not None:
+        partial = pd.DataFrame(partial).reindex(pd.DatetimeIndex(target.index))
+        if partial.isnull().values.any():
+            raise ValueError("partial covariates should be known on every target day")
+        covariates = partial.values.astype(np.float64)
+
+    # Predictor Position of every (Target Day, Lag) Pair, and whether the Predictor has that Day at all
+    time = np.asarray(era.time_axis.date)
+    lagged = dates[:, None] - lags[None, :].astype('timedelta64[D]')
+    position = np.clip(np.searchsorted(time, lagged), 0, max(len(time) - 1, 0))
+    paired = time[position] == lagged if len(time) else np.zeros(lagged.shape, bool)
+
+    if not paired.any():
+        raise ValueError("target and predictor have no (lagged) days in common")
+
+    # Read only the Predictor Days that are Needed
+    needed = np.unique(position[paired])
+    local = np.searchsorted(needed, position)
+
+    tests = [np.isin(pd.DatetimeIndex(target.index).year, np.asarray(list(fold))) for fold in folds] \
+        if folds is not None else [np.zeros(len(dates), bool)]
+
+    view = era.reindex([needed])
+    climatologies = None
+
+    if anomaly:
+        # Climatologies are Fitted on every Day (of the Training Years) in the Day of Year Slots of the Needed Days,
+        # not on the Needed Days only: Slots then see every Year (Leap Years shift Windows by a Slot), and the
+        # Anomalies of a Lag never depend on which other Lags were Requested
+        slots = day_of_year(era.time_axis)
+        climate_days = np.flatnonzero(np.isin(slots, slots[needed]))
+        climate = era.reindex([climate_days])
+
+        if len(climate.time) <= climate.time_block(memory_limit):
+            climate.data  # Load Once, the Needed Days are then Served from Memory
+
+        view = climate.reindex([np.searchsorted(climate_days, needed)])
+
+        climate_years = climate.time_axis.year
+        climate_train = [~np.isin(climate_years, np.asarray(list(fold))) for fold in folds] \
+            if folds is not None else [np.ones(len(climate_days), bool)]
+
+        fitted = [Climatology(climate.time_axis) for _ in tests]
+        for block, data in climate.iter_chunks(time_block, memory_limit):
+            positions = np.arange(block.start, block.stop)
+            for climatology, train in zip(fitted, climate_train):
+                rows = train[block]
+                if rows.any():
+                    climatology.update(positions[rows], data[rows])
+
+        climatologies = [Climatology(view.time_axis, mean=climatology.mean) for climatology in fitted]
+
+    designs = [_Design(lags, values, covariates, paired & ~test[:, None], local) for test in tests]
+
+    for block, data in view.iter_chunks(time_block, memory_limit):
+        for fold, design in enumerate(designs):
+            chunk = climatologies[fold].anomaly(data, block) if anomaly else data
+            design.update(block, chunk.reshape(len(chunk), -1))
+
+    maps = np.stack([design.correlation() for design in designs]).reshape((len(designs), len(lags)) + view.shape[1:])
+    return maps if folds is not None else maps[0]
+
+
+class _Design:
+    """
+    Cross Moments between (Chunks of) a [time, cells] Predictor and the Lagged Target of one Fold
+
+    Rows of the Design Matrix are [lag] Pair Indicators, [lag] Target Residuals and [covariate, lag] Centered
+    Covariates, Columns are Predictor Days, such that one Product with a Chunk gives the Sums of all Lags.
+    """
+
+    def __init__(self, lags: np.ndarray, target: np.ndarray, covariates: np.ndarray, sample: np.ndarray,
+                 local: np.ndarray):
+
+        n_lags, n_covariates = len(lags), covariates.shape[1]
+        self._n_lags, self._n_covariates = n_lags, n_covariates
+
+        # Per Lag: Residual of the Target on [1, Covariates] and Centered Covariates, over the Lag's own Sample
+        residuals = np.zeros((n_lags, len(target)))
+        centered = np.zeros((n_covariates, n_lags, len(target)))
+        self._inverse = np.zeros((n_lags, n_covariates, n_covariates))
+
+        for lag in range(n_lags):
+            rows = sample[:, lag]
+            if rows.sum() <= n_covariates + 1:
+                continue
+
+            z = covariates[rows] - covariates[rows].mean(0)
+            y = target[rows] - target[rows].mean()
+
+            if n_covariates:
+                beta, *_ = np.linalg.lstsq(z, y, rcond=None)
+                y = y - z @ beta
+                self._inverse[lag] = np.linalg.pinv(z.T @ z / rows.sum())
+
+            residuals[lag, rows] = y
+            centered[:, lag, rows] = z.T
+
+        # (Lag, Target Day) Pairs of the Sample, Ordered by Predictor Day
+        day, lag = np.nonzero(sample)
+        order = np.argsort(local[day, lag], kind='stable')
+        self._day, self._lag, self._local = day[order], lag[order], local[day, lag][order]
+        self._residuals = residuals[self._lag, self._day]
+        self._centered = centered[:, self._lag, self._day]
+
+        self._moments = None
+
+    def update(self, block: slice, data: np.ndarray) -> None:
+        n_lags = self._n_lags
+
+        first, last = np.searchsorted(self._local, [block.start, block.stop])
+        lag, column = self._lag[first:last], self._local[first:last] - block.start
+
+        rows = (2 + self._n_covariates) * n_lags
+        design = np.zeros((rows, data.shape[0]))
+        design[lag, column] = 1
+        design[n_lags + lag, column] = self._residuals[first:last]
+        for covariate in range(self._n_covariates):
+            design[(2 + covariate) * n_lags + lag, column] = self._centered[covariate, first:last]
+
+        if self._moments is None:
+            self._moments = {name: np.zeros((size, data.shape[1])) for name, size in
+                             (('counts', n_lags), ('products', rows), ('squares', n_lags),
+                              ('target', n_lags), ('target_squares', n_lags))}
+
+        missing = np.isnan(data)
+        values = np.where(missing, 0, data) if missing.any() else data
+
+        # [pairs, lag, covariate] x [time, cells]: Sums of x, x y and x z of all Lags in one Product
+        self._moments['products'] += design @ values
+        self._moments['squares'] += design[:n_lags] @ values ** 2
+
+        targets = design[n_lags:2 * n_lags]
+        if missing.any():
+            valid = (~missing).astype(np.float64)
+            self._moments['counts'] += design[:n_lags] @ valid
+            self._moments['target'] += targets @ valid
+            self._moments['target_squares'] += targets ** 2 @ valid
+        else:
+            self._moments['counts'] += design[:n_lags].sum(1)[:, None]
+            self._moments['target'] += targets.sum(1)[:, None]
+            self._moments['target_squares'] += (targets ** 2).sum(1)[:, None]
+
+    def correlation(self) -> np.ndarray:
+        # [lag, cells] (Partial) Correlation of the Predictor with the Target, NaN without enough Pairs
+        n_lags = self._n_lags
+        moments = self._moments
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            counts = moments['counts']
+            mean_x = moments['products'][:n_lags] / counts
+            mean_y = moments['target'] / counts
+
+            covariance = moments['products'][n_lags:2 * n_lags] / counts - mean_x * mean_y
+            variance_x = moments['squares'] / counts - mean_x ** 2
+            variance_y = moments['target_squares'] / counts - mean_y ** 2
+
+            # Partial out the Covariates: Var(x | z) = Var(x) - Cov(x, z)' Cov(z, z)^-1 Cov(x, z)
+            if self._n_covariates:
+                cross = moments['products'][2 * n_lags:].reshape(self._n_covariates, n_lags, -1) / counts[None]
+                variance_x = variance_x - np.einsum('ilc,lij,jlc->lc', cross, self._inverse, cross)
+
+            correlation = covariance / np.sqrt(variance_x * variance_y)
+
+        correlation[(counts <= self._n_covariates + 2) | ~(variance_x > 0) | ~(variance_y > 0)] = np.nan
+        return np.clip(correlation, -1, 1)
+
+
+def _window(index: pd.DatetimeIndex, start: str, end: str) -> np.ndarray:
+    # Positions of the Dates within a Day of Year Window, see TimeAxis.window
+    days = np.asarray(index.values.astype('datetime64[D]').astype(np.int64))
+    return TimeAxis(days, 'days since 1970-01-01').window(start, end)
@@ -0,0 +1,252 @@
+from heatwave.loaders.era import ERA
+from heatwave.cache import Cache, CACHE
+
+import numpy as np
+from scipy import sparse
+
+from typing import Iterator, Optional, Tuple
+
+
+METHODS = ('bilinear', 'nearest', 'conservative')
+
+
+class Regridder:
+    """
+    Regridding between two Regular Latitude/Longitude Grids as a single Sparse Matrix Product
+
+    method: 'bilinear', 'nearest' (e.g. for Label Masks) or 'conservative' (Area Weighted Cell Overlap)
+
+    Longitudes may use either the -180/180 or the 0/360 Convention and Wrap around when the Source Grid is Global.
+    Coordinates may be in any (e.g. Descending) Order. All Methods are Separable on such Grids, so the Weights are
+    the Kronecker Product of a Latitude and a Longitude Weight Matrix. Missing (NaN) Source Values are left out, with
+    the Remaining Weights Renormalized, Target Cells whose valid Weight is below min_weight become NaN. Target Cells
+    outside a (Regional) Source Grid have no Weight at all, and are NaN too.
+    """
+
+    def __init__(self, source: Tuple[np.ndarray, np.ndarray], target: Tuple[np.ndarray, np.ndarray],
+                 method: str = 'bilinear', min_weight: float = 0.5, weights: Optional[sparse.spmatrix] = None):
+
+        if method not in METHODS:
+            raise ValueError(f"method should be one of {METHODS}, not '{method}'")
+
+        self._source = tuple(np.asarray(axis, np.float64) for axis in source)
+        self._target = tuple(np.asarray(axis, np.float64) for axis in target)
+        self._method = method
+        self._min_weight = min_weight
+
+        if weights is None:
+            weights = self.compute_weights(self._source, self._target, method)
+        self._weights = sparse.csr_matrix(weights)
+
+        # Transposed Once, such that [samples, source] @ [source, target] is a single CSC Product
+        self._weights_t = self._weights.T.tocsr()
+
+        # Target Cells the Source doesn't Cover (enough), NaN even where no Source Value is Missing
+        coverage = np.asarray(self._weights.sum(1)).ravel()
+        self._uncovered = coverage <= 0 if method == 'nearest' else coverage < min_weight
+
+    @staticmethod
+    def between(source: ERA, target: ERA, method: str = 'bilinear', min_weight: float = 0.5,
+                cache: Optional[Cache] = CACHE) -> 'Regridder':
+        # Regridder from one ERA Grid to another, with Weights Cached on the Grid Coordinates
+        grids = (source.latitude, source.longitude), (target.latitude, target.longitude)
+
+        def compute() -> np.ndarray:
+            weights = Regridder.compute_weights(*grids, method).tocoo()
+            triplets = np.empty(weights.nnz, [('row', np.int64), ('column', np.int64), ('weight', np.float64)])
+            triplets['row'], triplets['column'], triplets['weight'] = weights.row, weights.col, weights.data
+            return triplets
+
+        if cache is None:
+            triplets = compute()
+        else:
+            triplets = cache.get([], compute, product='regrid', method=method, source=list(grids[0]),
+                                 target=list(grids[1]), outside='unweighted')
+
+        shape = (len(target.latitude) * len(target.longitude), len(source.latitude) * len(source.longitude))
+        weights = sparse.coo_matrix((triplets['weight'], (triplets['row'], triplets['column'])), shape=shape)
+
+        return Regridder(grids[0], grids[1], method, min_weight, weights)
+
+    @property
+    def weights(self) -> sparse.csr_matrix:
+        # [target cells, source cells], Cells in Row-Major (lat, lon) Order
+        return self._weights
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self._target[0]), len(self._target[1])
+
+    def __call__(self, data: np.ndarray) -> np.ndarray:
+        # Regrid [..., lat, lon] Data onto the Target Grid, all Leading Axes (e.g. a Time Chunk) in one Product
+        data = np.asarray(data)
+        leading = data.shape[:-2]
+        flat = data.reshape(-1, data.shape[-2] * data.shape[-1]).astype(np.float64)
+
+        missing = np.isnan(flat)
+
+        if self._method == 'nearest' or not missing.any():
+            output = np.asarray(flat @ self._weights_t) if not missing.any() else self._nearest(flat)
+        else:
+            valid = (~missing).astype(np.float64)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                total = np.asarray(valid @ self._weights_t)
+                output = np.asarray(np.where(missing, 0, flat) @ self._weights_t) / total
+                output[total < self._min_weight] = np.nan
+
+        output[:, self._uncovered] = np.nan
+        return output.reshape(leading + self.shape)
+
+    def iter_chunks(self, era: ERA, time_block: Optional[int] = None, memory_limit: Optional[int] = None,
+                    anomaly: bool = False) -> Iterator[Tuple[slice, np.ndarray]]:
+        # Regrid an ERA Dataset one Time Chunk at a Time
+        chunks = era.iter_anomaly(time_block, memory_limit) if anomaly else era.iter_chunks(time_block, memory_limit)
+        for block, data in chunks:
+            yield block, self(data)
+
+    def _nearest(self, flat: np.ndarray) -> np.ndarray:
+        # Nearest Neighbour keeps Missing Values (each Target Cell has exactly one Source Cell)
+        output = np.asarray(np.nan_to_num(flat) @ self._weights_t)
+        output[np.asarray(np.isnan(flat).astype(np.float64) @ self._weights_t) > 0] = np.nan
+        return output
+
+    @staticmethod
+    def compute_weights(source: Tuple[np.ndarray, np.ndarray], target: Tuple[np.ndarray, np.ndarray],
+                        method: str = 'bilinear') -> sparse.csr_matrix:
+        latitude = _axis_weights(source[0], target[0], method, periodic=False, latitude=True)
+
+        # Regional Longitudes are Measured from the Region's Western Edge, such that they are Contiguous
+        periodic = _is_global(source[1])
+        origin = 0 if periodic else _western_edge(source[1])
+        longitude = _axis_weights(np.mod(source[1] - origin, 360), np.mod(target[1] - origin, 360), method,
+                                  periodic=periodic, latitude=False)
+
+        # Row-Major (lat, lon) Cells: W[(i, j), (k, l)] = latitude[i, k] * longitude[j, l]
+        return sparse.kron(latitude, longitude, format='csr')
+
+
+def _is_global(longitude: np.ndarray) -> bool:
+    # Whether the Longitudes go all around, such that the Last Cell Neighbours the First
+    longitude = np.sort(np.mod(longitude, 360))
+    if len(longitude) < 2:
+        return False
+    # No Gap between Coordinates (including the one across 0/360) may be much wider than the Spacing
+    gaps = np.diff(np.r_[longitude, longitude[0] + 360])
+    return gaps.max() <= 1.5 * np.median(gaps)
+
+
+def _western_edge(longitude: np.ndarray) -> float:
+    # First Longitude (0/360) of a Regional Grid: the one after the Largest Circular Gap between Coordinates
+    longitude = np.sort(np.mod(longitude, 360))
+    gaps = np.diff(np.r_[longitude, longitude[0] + 360])
+    return float(longitude[(np.argmax(gaps) + 1) % len(longitude)])
+
+
+def _axis_weights(source: np.ndarray, target: np.ndarray, method: str, periodic: bool,
+                  latitude: bool) -> sparse.csr_matrix:
+    # [target, source] Weights along a single Axis (Degrees), Source in any Order
+    order = np.argsort(source, kind='stable')
+    ordered = source[order]
+
+    if method == 'conservative':
+        rows, columns, weights = _overlap_weights(ordered, target, periodic, latitude)
+    else:
+        rows, columns, weights = _linear_weights(ordered, target, periodic)
+
+        if method == 'nearest':
+            # Keep the Larger of both Linear Weights, i.e. the Nearest Source Coordinate (none outside the Source)
+            pairs = weights.reshape(-1, 2)
+            nearest = np.argmax(pairs, axis=1)
+            rows = rows.reshape(-1, 2)[np.arange(len(pairs)), nearest]
+            columns = columns.reshape(-1, 2)[np.arange(len(pairs)), nearest]
+            weights = (pairs.max(1) > 0).astype(np.float64)
+
+    matrix = sparse.coo_matrix((weights, (rows, order[columns])), shape=(len(target), len(source)))
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+    return matrix.tocsr()
+
+
+def _linear_weights(source: np.ndarray, target: np.ndarray, periodic: bool) -> Tuple[np.ndarray, ...]:
+    # Two (Row, Column, Weight) Triplets per Target Coordinate, both Zero outside the Source Range unless Periodic
+    n = len(source)
+
+    if periodic:
+        extended = np.r_[source[-1] - 360, source, source[0] + 360]
+        target = np.where(target < extended[0], target + 360, target)
+        upper = np.clip(np.searchsorted(extended, target, side='right'), 1, n + 1)
+        lower = upper - 1
+        fraction = (target - extended[lower]) / (extended[upper] - extended[lower])
+        lower, upper = (lower - 1) % n, (upper - 1) % n
+    else:
+        upper = np.clip(np.searchsorted(source, target, side='right'), 1, max(n - 1, 1))
+        lower = upper - 1
+        upper = np.minimum(upper, n - 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(source[upper] > source[lower],
+                                (target - source[lower]) / (source[upper] - source[lower]), 0)
+
+    fraction = np.clip(fraction, 0, 1)
+
+    # Targets beyond the Outer Source Coordinates are not Extrapolated (as griddata, which gives NaN there)
+    inside = np.ones(len(target), bool) if periodic else (target >= source[0]) & (target <= source[-1])
+
+    rows = np.repeat(np.arange(len(target)), 2)
+    columns = np.column_stack([lower, upper]).ravel()
+    weights = (np.column_stack([1 - fraction, fraction]) * inside[:, None]).ravel()
+
+    return rows, columns, weights
+
+
+def _bounds(centers: np.ndarray, periodic: bool, limits: Optional[Tuple[float, float]]) -> np.ndarray:
+    # Cell Edges halfway between (Ascending) Centers, the Outer Edges half a Spacing out
+    if len(centers) == 1:
+        edges = np.array([centers[0] - 0.5, centers[0] + 0.5])
+    else:
+        middle = (centers[1:] + centers[:-1]) / 2
+        edges = np.r_[2 * centers[0] - middle[0], middle, 2 * centers[-1] - middle[-1]]
+
+    if periodic:
+        # Close the Gap between Last and First Cell
+        edges[0] = edges[-1] = ((centers[-1] - 360) + centers[0]) / 2
+        edges[-1] += 360
+
+    if limits is not None:
+        edges = np.clip(edges, *limits)
+
+    return edges
+
+
+def _overlap_weights(source: np.ndarray, target: np.ndarray, periodic: bool,
+                     latitude: bool) -> Tuple[np.ndarray, ...]:
+    # Area Weighted Overlap of Target and Source Cells, Normalized per Target Cell
+    target_order = np.argsort(target, kind='stable')
+    source_edges = _bounds(source, periodic, (-90, 90) if latitude else None)
+    target_edges = _bounds(target[target_order], periodic and _is_global(target), (-90, 90) if latitude else None)
+
+    # Latitude Cells cover Area in Proportion to the Sine of Latitude
+    measure = (lambda edges: np.sin(np.radians(edges))) if latitude else (lambda edges: edges)
+
+    rows, columns, weights = [], [], []
+    shifts = (-360, 0, 360) if periodic else (0,)
+
+    for position, (start, stop) in enumerate(zip(target_edges[:-1], target_edges[1:])):
+        row = target_order[position]
+        for shift in shifts:
+            low = np.maximum(source_edges[:-1] + shift, start)
+            high = np.minimum(source_edges[1:] + shift, stop)
+            overlap = np.flatnonzero(high > low)
+
+            rows.append(np.full(len(overlap), row))
+            columns.append(overlap)
+            weights.append(measure(high[overlap]) - measure(low[overlap]))
+
+    rows, columns, weights = np.concatenate(rows), np.concatenate(columns), np.concatenate(weights)
+
+    # Normalize by Overlapping (rather than Target Cell) Area, so Partially Covered Edge Cells keep Full Weight
+    totals = np.bincount(rows, weights, minlength=len(target))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = weights / totals[rows]
+
+    return rows, columns, weights
+
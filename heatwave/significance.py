@@ -0,0 +1,287 @@
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+
+METHODS = ('permutation', 'bootstrap')
+
+Shared = Dict[str, Tuple[str, Tuple[int, ...], str]]  # Name -> (Shared Memory Block, Shape, dtype)
+
+
+class Significance:
+    """
+    Resampling Test Result: the Observed Statistic and its (Two-Sided) p-Value, per Cell or per Forecast
+
+    lower / upper: Bootstrap Confidence Interval of the Statistic (None for Permutation Tests)
+    """
+
+    def __init__(self, statistic: np.ndarray, p_value: np.ndarray, lower: Optional[np.ndarray] = None,
+                 upper: Optional[np.ndarray] = None):
+        self.statistic = statistic
+        self.p_value = p_value
+        self.lower = lower
+        self.upper = upper
+
+    def significant(self, alpha: float = 0.05, fdr: bool = True) -> np.ndarray:
+        # Locally Significant Cells, Controlling the False Discovery Rate (at alpha) unless fdr is False
+        return false_discovery(self.p_value, alpha) if fdr else self.p_value <= alpha
+
+    def __repr__(self):
+        return f"Significance{np.shape(self.statistic)}"
+
+
+def resamples(n: int, n_resamples: int = 1000, method: str = 'permutation', blocks: Optional[np.ndarray] = None,
+              seed: Optional[int] = 0) -> np.ndarray:
+    """
+    Resampling Scheme over n Samples, Shared by all Cells (and Forecasts) being Tested
+
+    permutation: [resample, n] Positions, Sample i takes the Target of Sample positions[i]
+    bootstrap:   [resample, n] Multiplicities (Weights) of every Sample
+
+    blocks: Block Label (e.g. Year) of every Sample, Resampling whole Blocks (e.g. Summers) to Respect Autocorrelation;
+            Permuted Blocks should all have the same Length
+    """
+
+    if method not in METHODS:
+        raise ValueError(f"method should be one of {METHODS}, not '{method}'")
+
+    random = np.random.RandomState(seed)
+
+    if blocks is None:
+        if method == 'permutation':
+            return np.argsort(random.random_sample((n_resamples, n)), axis=1)
+        return random.multinomial(n, np.full(n, 1 / n), size=n_resamples).astype(np.float64)
+
+    labels, members = np.unique(np.asarray(blocks), return_inverse=True)
+
+    if method == 'bootstrap':
+        drawn = random.randint(len(labels), size=(n_resamples, len(labels)))
+        counts = np.stack([np.bincount(row, minlength=len(labels)) for row in drawn])
+        return counts[:, members].astype(np.float64)
+
+    # Permute whole Blocks: the k-th Block takes the Samples of the permuted k-th Block, in Order
+    positions = [np.flatnonzero(members == block) for block in range(len(labels))]
+    if len({len(block) for block in positions}) > 1:
+        raise ValueError("Block permutation requires blocks of equal length")
+
+    positions = np.stack(positions)
+    order = np.argsort(random.random_sample((n_resamples, len(labels))), axis=1)
+
+    output = np.empty((n_resamples, n), np.int64)
+    output[:, positions.ravel()] = positions[order].reshape(n_resamples, -1)
+    return output
+
+
+def correlation_test(x: np.ndarray, y: np.ndarray, method: str = 'permutation', n_resamples: int = 1000,
+                     blocks: Optional[np.ndarray] = None, confidence: float = 0.95, seed: Optional[int] = 0,
+                     processes: int = 1, memory_limit: int = 2 ** 30) -> Significance:
+    """
+    Resampling Test of the Correlation between every Cell of a [sample, ...] Field and a [sample] Target
+
+    Every Resample of every Cell is one Column of a Batched Matrix Product: [cells, sample] x [sample, resample]
+    for Permutations, [resample, sample] Weights x [sample, cells] Moments for the Bootstrap. Cells are Split over
+    processes Worker Processes, which Attach to the Field, Target and Resamples in Shared Memory rather than
+    receiving Copies, and Handle their Cells in Blocks that fit within memory_limit (in total).
+    Cells with Missing Values are NaN.
+    """
+
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    shape = x.shape[1:]
+    x = x.reshape(len(x), -1)
+
+    if len(y) != len(x):
+        raise ValueError(f"x has {len(x)} samples, but y has {len(y)}")
+
+    scheme = resamples(len(y), n_resamples, method, blocks, seed)
+
+    # Cells per Block: [resample, cells] Statistics and [sample, cells] Moments (float64)
+    budget = memory_limit // max(1, processes) // (8 * (4 * n_resamples + 3 * len(x)))
+    block = int(max(1, min(budget, -(-x.shape[1] // max(1, processes)))))
+    columns = [slice(start, min(start + block, x.shape[1])) for start in range(0, x.shape[1], block)]
+
+    if processes > 1 and len(columns) > 1:
+        arrays, handles = _share({'x': x, 'y': y, 'resamples': scheme})
+        try:
+            with ProcessPoolExecutor(processes) as executor:
+                results = list(executor.map(_correlation_task, [arrays] * len(columns), columns,
+                                            [method] * len(columns), [confidence] * len(columns)))
+        finally:
+            for handle in handles:
+                handle.close()
+                handle.unlink()
+    else:
+        results = [_correlation_block(x[:, column], y, scheme, method, confidence) for column in columns]
+
+    statistic, p_value, lower, upper = (np.concatenate(parts).reshape(shape) for parts in zip(*results))
+    return Significance(statistic, p_value, *((lower, upper) if method == 'bootstrap' else (None, None)))
+
+
+def auc_test(score: np.ndarray, events: np.ndarray, method: str = 'permutation', n_resamples: int = 1000,
+             blocks: Optional[np.ndarray] = None, confidence: float = 0.95, seed: Optional[int] = 0) -> Significance:
+    """
+    Resampling Test of the ROC AUC (as roc_auc_score) of [sample, ...] Forecast Scores for [sample] Binary Events
+
+    The p-Value is Two-Sided, of |AUC - 0.5|. Permuted AUCs are a Product of the Permuted Events with the Ranks of
+    the Scores (Mann-Whitney), Bootstrapped AUCs Weight every Positive by the (Weighted) Negatives Ranked below it.
+    """
+
+    score = np.asarray(score, np.float64)
+    events = np.asarray(events, bool)
+    shape = score.shape[1:]
+    score = score.reshape(len(score), -1)
+
+    positive, negative = events.sum(), (~events).sum()
+    if not positive or not negative:
+        raise ValueError("AUC is undefined unless there are both events and non-events")
+
+    scheme = resamples(len(events), n_resamples, method, blocks, seed)
+
+    # scipy.stats is Imported here only, Correlation Workers never Need it
+    from scipy import stats
+
+    ranks = stats.rankdata(score, axis=0)
+    statistic = (events @ ranks - positive * (positive + 1) / 2) / (positive * negative)
+
+    if method == 'permutation':
+        # [resample, sample] x [sample, forecast]
+        resampled = (events[scheme].astype(np.float64) @ ranks - positive * (positive + 1) / 2) / (positive * negative)
+    else:
+        resampled = np.stack([_weighted_auc(scheme, column, events) for column in score.T], axis=1)
+
+    p_value, lower, upper = _summarize(statistic, resampled, method, confidence, center=0.5)
+
+    if method == 'bootstrap':
+        return Significance(statistic.reshape(shape), p_value.reshape(shape), lower.reshape(shape),
+                            upper.reshape(shape))
+    return Significance(statistic.reshape(shape), p_value.reshape(shape))
+
+
+def false_discovery(p_value: np.ndarray, alpha: float = 0.05) -> np.ndarray:
+    # Benjamini-Hochberg: Reject the k Smallest p-Values, k the Largest Rank with p(k) <= alpha k / m (NaN Ignored)
+    p_value = np.asarray(p_value, np.float64)
+    valid = ~np.isnan(p_value)
+
+    ordered = np.sort(p_value[valid])
+    passed = np.flatnonzero(ordered <= alpha * np.arange(1, len(ordered) + 1) / max(1, len(ordered)))
+
+    threshold = ordered[passed[-1]] if len(passed) else -np.inf
+    return valid & (np.nan_to_num(p_value, nan=np.inf) <= threshold)
+
+
+def field_significance(p_value: np.ndarray, alpha_global: float = 0.05) -> Tuple[np.ndarray, bool]:
+    """
+    Field Significance of a Map of Local p-Values (Wilks, 2016): the Field is Significant at alpha_global if any Cell
+    is Significant under the False Discovery Rate at 2 alpha_global, which holds up under Spatial Correlation
+
+    Returns the Locally Significant Cells and whether the Field is Significant
+    """
+
+    mask = false_discovery(p_value, 2 * alpha_global)
+    return mask, bool(mask.any())
+
+
+def _correlation_block(x: np.ndarray, y: np.ndarray, scheme: np.ndarray, method: str,
+                       confidence: float) -> Tuple[np.ndarray, ...]:
+    # Observed Correlation, p-Value and Confidence Interval of the [sample, cells] Block x, NaN for Incomplete Cells
+    complete = ~np.isnan(x).any(0)
+    output = [np.full(x.shape[1], np.nan) for _ in range(4)]
+
+    if not complete.any():
+        return tuple(output)
+
+    values = x[:, complete]
+    n = len(y)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standard_x = (values - values.mean(0)) / values.std(0)
+        standard_y = (y - y.mean()) / y.std()
+        statistic = standard_y @ standard_x / n
+
+        if method == 'permutation':
+            # Permutations leave the Moments of x and y as they are: [resample, sample] x [sample, cells]
+            resampled = standard_y[scheme] @ standard_x / n
+        else:
+            # Weighted Moments of every Resample: [resample, sample] x [sample, cells]
+            weights = scheme / scheme.sum(1, keepdims=True)
+            mean_x, mean_y = weights @ standard_x, weights @ standard_y
+            covariance = weights @ (standard_x * standard_y[:, None]) - mean_x * mean_y[:, None]
+            variance_x = weights @ standard_x ** 2 - mean_x ** 2
+            variance_y = weights @ standard_y ** 2 - mean_y ** 2
+            resampled = covariance / np.sqrt(variance_x * variance_y[:, None])
+
+    output[0][complete] = statistic
+    for target, values in zip(output[1:], _summarize(statistic, resampled, method, confidence, center=0.0)):
+        if values is not None:
+            target[complete] = values
+
+    return tuple(output)
+
+
+def _correlation_task(arrays: Shared, columns: slice, method: str, confidence: float) -> Tuple[np.ndarray, ...]:
+    # Worker Process: Attach to the Shared Arrays, and Test one Block of Cells
+    handles = []
+    try:
+        shared = {}
+        for name, (block, shape, dtype) in arrays.items():
+            handles.append(shared_memory.SharedMemory(block))
+            shared[name] = np.ndarray(shape, dtype, buffer=handles[-1].buf)
+        result = _correlation_block(shared['x'][:, columns], shared['y'], shared['resamples'], method, confidence)
+        del shared
+        return result
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _share(arrays: Dict[str, np.ndarray]) -> Tuple[Shared, List[shared_memory.SharedMemory]]:
+    # Copy Arrays into Shared Memory Blocks, returning their Descriptions (for the Workers) and Handles
+    descriptions, handles = {}, []
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            handle = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            handles.append(handle)
+            np.ndarray(array.shape, array.dtype, buffer=handle.buf)[...] = array
+            descriptions[name] = (handle.name, array.shape, array.dtype.str)
+    except BaseException:
+        for handle in handles:
+            handle.close()
+            handle.unlink()
+        raise
+    return descriptions, handles
+
+
+def _weighted_auc(weights: np.ndarray, score: np.ndarray, events: np.ndarray) -> np.ndarray:
+    # [resample] AUC with [resample, sample] Multiplicities, Ties counting Half
+    order = np.argsort(score, kind='stable')
+    score, events, weights = score[order], events[order], weights[:, order]
+
+    # Negative Weight of every Group of Tied Scores, and of all Groups below it
+    starts = np.flatnonzero(np.r_[True, score[1:] != score[:-1]])
+    group = np.cumsum(np.r_[True, score[1:] != score[:-1]]) - 1
+    tied = np.add.reduceat(weights * ~events, starts, axis=1)
+    below = np.cumsum(tied, axis=1) - tied
+
+    positive = weights * events
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (positive * (below + tied / 2)[:, group]).sum(1) / (positive.sum(1) * (weights * ~events).sum(1))
+
+
+def _summarize(statistic: np.ndarray, resampled: np.ndarray, method: str, confidence: float,
+               center: float) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+    # Two-Sided p-Value (and Bootstrap Confidence Interval) from [resample, ...] Resampled Statistics
+    if method == 'permutation':
+        extreme = np.abs(resampled - center) >= np.abs(statistic - center) - 1e-12
+        return (1 + extreme.sum(0)) / (1 + len(resampled)), None, None
+
+    # Bootstrap: how often the Resampled Statistic falls on the other Side of the Null Value
+    below = np.mean(resampled <= center, axis=0)
+    above = np.mean(resampled >= center, axis=0)
+    p_value = np.minimum(1, 2 * np.minimum(below, above))
+
+    quantile = np.nanquantile if np.isnan(resampled).any() else np.quantile
+    lower, upper = quantile(resampled, [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+    return p_value, lower, upper